@@ -8,15 +8,14 @@
 版本号: 1.0
 变更说明: 无
 """
-from fastapi import APIRouter, Depends
-from fastapi.responses import StreamingResponse
-from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import APIRouter, Depends, Request
 
-from app.db.session import get_session
 from app.models.chat import ChatRequest
 from app.services.chat_service import chat_service
-from app.core.dependencies import method_logger
+from app.core.dependencies import check_token_budget, method_logger
+from app.models.db_models import User
 from app.utils.logger import get_logger
+from app.utils.sse import sse_manager
 
 
 logger = get_logger(__name__)
@@ -26,18 +25,23 @@ router = APIRouter()
 
 @method_logger
 @router.post("/chat")
-async def chat(request: ChatRequest, db: AsyncSession = Depends(get_session)):
+async def chat(request: ChatRequest, http_request: Request, current_user: User = Depends(check_token_budget)):
     """
-    与AI助手对话
+    与AI助手对话（流式响应期间不持有数据库连接）
+
+    回答时参考当前用户笔记中的相关片段。
 
     Args:
         request: ChatRequest模型数据
-        db: 数据库连接实例
+        http_request: request请求
+        current_user: 当前登录的用户
 
     Request:
-        StreamingResponse: AI的回复内容
+        EventStreamResponse: AI的回复内容（SSE，结束时发送 done 事件，可以通过 Last-Event-ID 续传）
     """
 
     session_id = "{}_{}".format(request.user_id, request.note_id)
     logger.info(f"与AI助手对话 session id {session_id}")
-    return StreamingResponse(chat_service.generate_stream_by_langchain(db, user_msg=request.user_msg, session_id=session_id), media_type="text/event-stream")
+    return sse_manager.response(http_request, chat_service.generate_stream_by_langchain(
+        user_msg=request.user_msg, session_id=session_id,
+        chroma=http_request.app.state.chroma, user_id=current_user.id))
@@ -1,13 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
-from app.db.session import get_session
-from app.models.note import CurrentDayNote, NoteResponse, NoteUpdate
+from app.db.session import get_session, session_scope
+from app.models.db_models import User
+from app.models.note import CurrentDayNote, NoteGenerationJobResponse, NoteResponse, NoteUpdate
+from app.services.note_batch_service import note_batch_service
 from app.services.note_service import note_service
-from app.core.dependencies import method_logger
+from app.services.study_plan_service import study_plan_service
+from app.core.dependencies import check_token_budget, get_current_user, method_logger
 from app.utils.logger import get_logger
+from app.utils.sse import sse_manager
 
 logger = get_logger(__name__)
 
@@ -32,6 +35,50 @@ async def get_study_plan_notes(study_plan_id: int, db: AsyncSession = Depends(ge
     return [NoteResponse.model_validate(note) for note in notes]
 
 
+@method_logger
+@router.post("/study-plan/{study_plan_id}/generate", response_model=NoteGenerationJobResponse, status_code=202)
+async def generate_study_plan_notes(study_plan_id: int, request: Request,
+                                    current_user: User = Depends(check_token_budget)):
+    """
+    批量生成学习计划下全部笔记的详细内容（后台任务）
+
+    已经有详细内容的笔记会被跳过；该学习计划已经有未结束的任务时返回该任务。
+
+    Args:
+        study_plan_id: 学习计划ID
+        request: request请求
+        current_user: 当前登录的用户
+
+    Retrun:
+        NoteGenerationJobResponse: 批量生成任务
+    """
+    logger.info(f"批量生成笔记 study_plan_id:{study_plan_id}")
+    async with session_scope() as db:
+        study_plan = await study_plan_service.get_study_plan(db, study_plan_id)
+    if study_plan is None or study_plan.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Study plan not found")
+    return await note_batch_service.create_job(study_plan_id, current_user.id, request.app.state.chroma)
+
+
+@method_logger
+@router.get("/jobs/{job_id}", response_model=NoteGenerationJobResponse)
+async def get_generation_job(job_id: int, current_user: User = Depends(get_current_user)):
+    """
+    获取批量生成任务的进度
+
+    Args:
+        job_id: 任务ID
+        current_user: 当前登录的用户
+
+    Retrun:
+        NoteGenerationJobResponse: 任务的进度和吞吐量
+    """
+    job = await note_batch_service.get_job(job_id)
+    if job is None or job.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
 @method_logger
 @router.get("/{note_id}", response_model=NoteResponse)
 async def get_note(note_id: int, db: AsyncSession = Depends(get_session)):
@@ -55,20 +102,20 @@ async def get_note(note_id: int, db: AsyncSession = Depends(get_session)):
 
 
 @method_logger
-@router.get("/{note_id}/details", response_model=NoteResponse)
-async def get_note(note_id: int, db: AsyncSession = Depends(get_session)):
+@router.get("/{note_id}/details", response_model=NoteResponse, dependencies=[Depends(check_token_budget)])
+async def get_note(note_id: int, request: Request):
     """
-    获取笔记的具体要学习的内容
+    获取笔记的具体要学习的内容（流式响应期间不持有数据库连接）
 
     Args:
         note_id: note id
-        db: 数据库连接实例
+        request: request请求
 
     Retrun:
-        StreamingResponse: AI生成的具体学习的内容
+        EventStreamResponse: AI生成的具体学习的内容（SSE，结束时发送 done 事件，可以通过 Last-Event-ID 续传）
     """
     logger.info("获取笔记的具体要学习的内容")
-    return StreamingResponse(note_service.generate_detailed_content(db, note_id), media_type="text/event-stream")
+    return sse_manager.response(request, note_service.generate_detailed_content(note_id, request.app.state.chroma))
 
 
 @method_logger
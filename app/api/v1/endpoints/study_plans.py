@@ -1,13 +1,14 @@
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException, Request
-from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from langchain_core.messages import HumanMessage
 from app.db.session import get_session
 from app.models.study_plan import StudyPlanResponse
 from app.services.study_plan_service import study_plan_service
-from app.core.dependencies import method_logger
+from app.core.dependencies import check_token_budget, method_logger
+from app.models.db_models import User
 from app.utils.logger import get_logger
+from app.utils.sse import sse_manager
 
 logger = get_logger(__name__)
 
@@ -52,31 +53,37 @@ async def get_study_plan(plan_id: int, db: AsyncSession = Depends(get_session)):
 
 @method_logger
 @router.post("/gen_plan_by_graph")
-async def gen_plan_by_graph(request: Request, session_id: str, text: str, db: AsyncSession = Depends(get_session)):
+async def gen_plan_by_graph(request: Request, session_id: str, text: str,
+                            current_user: User = Depends(check_token_budget)):
     """
-    通过多轮对话，生成学习计划
+    通过多轮对话，生成学习计划（流式响应期间不持有数据库连接）
 
     Args:
         request: request请求
         session_id: 当前回话的唯一表示（前端生成的）
         text: 用户输入的聊天内容
-        db: 数据库连接实例
+        current_user: 当前登录的用户
     Retrun:
-        StreamingResponse: AI回复的内容的流
+        EventStreamResponse: AI回复的内容的流（SSE，结束时发送 done 事件，可以通过 Last-Event-ID 续传）
     """
+    # 重连时直接续传，不再把这次输入加入会话
+    resumed = sse_manager.resume(request)
+    if resumed is not None:
+        return resumed
     logger.info("获取或初始化state")
     logger.info(f"当前的session id:{session_id}")
     sessions = request.app.state.sessions
     graph = request.app.state.graph
     vector_store = request.app.state.vector_store
     chroma = request.app.state.chroma
-    state = {}
-    if session_id not in sessions:
+    state = await sessions.get(session_id)
+    if state is None:
         logger.info(f"这是一个新的会话")
         state = {
             "learned_before": None,
             "want_deep_learn": None,
             "learning_plan": None,
+            "plan_data": None,
             "is_satisfied": None,
             "input_completeness": None,
             "status": "start",
@@ -85,10 +92,10 @@ async def gen_plan_by_graph(request: Request, session_id: str, text: str, db: As
         }
         logger.info(f"当前status:start")
     else:
-        state = sessions.get(session_id)
         logger.info(f"当前status:{state.get("status", "未获取")}")
         if not state["input_completeness"]:
             state["subject"] = text
         state["messages"].append(HumanMessage(content=text))
 
-    return StreamingResponse(study_plan_service.ge_study_plan_event_stream(state, graph, db, sessions, session_id, vector_store, chroma), media_type="text/event-stream")
+    return sse_manager.response(request, study_plan_service.ge_study_plan_event_stream(
+        state, graph, sessions, session_id, vector_store, chroma, current_user.id))
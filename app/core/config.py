@@ -1,4 +1,5 @@
 import os
+from typing import Optional
 from pydantic import Field
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
@@ -21,6 +22,16 @@ class Settings(BaseSettings):
     POSTGRES_PASSWORD: str = "postgres"
     POSTGRES_DB: str = "smart_note"
     POSTGRES_PORT: str = "5432"
+    # 数据库连接池
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30
+    # 连接最长使用时间（秒），超过后重新建立，避免被数据库或中间代理断开
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_ECHO: bool = False
+    # asyncpg 预编译语句缓存大小，经过 pgbouncer(transaction 模式) 时需要设置为 0
+    DB_PREPARED_STATEMENT_CACHE_SIZE: int = 500
 
     # JWT settings
     SECRET_KEY: str = get_env_value('SECRET_KEY')  # 在生产环境中应该使用环境变量
@@ -32,9 +43,106 @@ class Settings(BaseSettings):
     OPENAI_API_URL: str = get_env_value('OPENAI_API_URL')
     OPENAI_MODEL_NAME: str = get_env_value('OPENAI_MODEL_NAME')
 
+    # 向量数据库：配置了 CHROMA_SERVER_HOST 时连接独立的 Chroma 服务（多 worker 使用 chroma 后端时必须）
+    CHROMA_PERSIST_DIRECTORY: str = "./data/smart_note_vector_db"
+    CHROMA_SERVER_HOST: Optional[str] = None
+    CHROMA_SERVER_PORT: int = 8000
+    # 向量存储后端：chroma | numpy（进程内精确检索，数据保存在 CHROMA_PERSIST_DIRECTORY/numpy 下）
+    VECTOR_BACKEND: str = "chroma"
+    # numpy 后端在内存中保存向量的方式：none（float32）| int8（内存约 1/4，粗排后用 float32 精排）
+    VECTOR_QUANTIZATION: str = "none"
+    VECTOR_RERANK_FACTOR: int = 4
+    # 文档带有 user_id/plan_id/created_at 元数据、使用余弦距离的集合（旧的 smart_note 集合没有元数据）
+    CHROMA_COLLECTION_NAME: str = "smart_note_v2"
+    # 检索学习历史时的相关度阈值（1 - 余弦距离），可用 benchmarks/calibrate_history_threshold.py 重新校准
+    HISTORY_SIMILARITY_THRESHOLD: float = 0.6
+    HISTORY_SEARCH_K: int = 3
+    # 混合检索：关键词覆盖率（查询词按 IDF 加权出现在文档中的比例）达到该值时直接采用关键词结果，不再向量检索
+    HISTORY_KEYWORD_COVERAGE: float = 0.8
+    # 关键词结果参与融合的最低覆盖率（按 IDF 加权）
+    HISTORY_KEYWORD_MIN_COVERAGE: float = 0.3
+    # 关键词结果的最低 BM25 分数，只命中常见词的文档分数很低
+    HISTORY_KEYWORD_MIN_SCORE: float = 1.0
+    # 每个用户的关键词索引在内存中的缓存时间（秒）和最多缓存的用户数
+    KEYWORD_INDEX_TTL: int = 60
+    KEYWORD_INDEX_MAX_USERS: int = 1024
+    # 计划和笔记切块索引：每块的最大字符数和相邻块的重叠字符数
+    VECTOR_CHUNK_SIZE: int = 500
+    VECTOR_CHUNK_OVERLAP: int = 50
+    # 聊天时从用户笔记中检索的参考片段
+    CHAT_CONTEXT_K: int = 4
+    CHAT_CONTEXT_THRESHOLD: float = 0.5
+    # 生成笔记时按学习计划缓存格式化好的 system 提示词的数量
+    NOTE_PROMPT_CACHE_SIZE: int = 256
+    # 批量生成笔记：同时调用大模型的最大数量（进程内所有任务共享）
+    NOTE_BATCH_CONCURRENCY: int = 4
+    # 运行中的批量任务超过该时间（秒）没有进度更新时，视为进程已退出，可以被重新接手
+    NOTE_BATCH_STALE_SECONDS: int = 600
+    # 运行中的批量任务刷新 updated_at 的间隔（秒），需要明显小于 NOTE_BATCH_STALE_SECONDS
+    NOTE_BATCH_HEARTBEAT_SECONDS: int = 60
+    # gunicorn 主进程在 fork 之前加载向量化模型，worker 写时复制共享
+    PRELOAD_EMBEDDINGS: bool = True
+    # 向量化推理方式：torch | torch_int8（动态量化）| onnx（ONNX Runtime，不导入 PyTorch）
+    EMBEDDING_BACKEND: str = "torch"
+    # onnx 后端使用的模型文件（模型仓库中的路径）。不设置时按 CPU 架构选择可移植的 int8 量化版本
+    # （x86_64: onnx/model_quint8_avx2.onnx，arm64: onnx/model_qint8_arm64.onnx）；
+    # 确认 CPU 支持 AVX512-VNNI 时可以设为 onnx/model_qint8_avx512_vnni.onnx
+    EMBEDDING_ONNX_FILE: Optional[str] = None
+    # 推理线程数，0 表示使用库的默认值；多 worker 部署时建议设为 CPU 核数 / worker 数
+    EMBEDDING_NUM_THREADS: int = 0
+    EMBEDDING_BATCH_SIZE: int = 32
+    EMBEDDING_MAX_LENGTH: int = 128
+
+    # SSE：没有数据时发送心跳注释的间隔（秒），避免代理断开空闲连接
+    SSE_HEARTBEAT_SECONDS: float = 15
+    # 可以通过 Last-Event-ID 续传的流的数量（进程内），以及每个流在缓冲区中保留的帧数
+    SSE_REPLAY_STREAMS: int = 256
+    SSE_REPLAY_BUFFER: int = 2048
+    # 客户端断开后等待重连的时间（秒），超时后关闭上游的大模型调用；0 表示立即关闭
+    SSE_RESUME_GRACE_SECONDS: float = 5
+    # 客户端断开、大模型流式输出被取消时，已经生成的部分是否保存：discard 不保存 | save 保存
+    LLM_PARTIAL_OUTPUT_POLICY: str = "discard"
+
+    # 每个用户每天可以使用的大模型token数（输入 + 输出），0 表示不限制；超出后接口返回 429
+    LLM_DAILY_TOKEN_BUDGET: int = 0
+    # 大模型用量在内存中累加，每隔多少秒批量写入数据库
+    LLM_USAGE_FLUSH_INTERVAL: int = 30
+
+    # 生成学习计划的输出方式：function_calling | json_schema（结构化输出，直接得到校验过的对象）
+    # | markdown（旧方式，输出 markdown 后再解析）
+    PLAN_OUTPUT_MODE: str = "function_calling"
+    # 根据反馈调整计划的方式：patch（只输出有变化的天，本地合并，需要结构化输出）| full（整体重新生成）
+    PLAN_ADJUST_MODE: str = "patch"
+    # 判断输入是否完整的同时检索学习历史，输入不完整时丢弃检索结果
+    PLAN_PREFETCH_HISTORY: bool = True
+    # 询问是否深入学习时，在等待回答期间先在后台生成进阶计划（回答为否时浪费一次生成）
+    PLAN_SPECULATIVE_GENERATION: bool = True
+    # 推测生成的计划在进程内的保留时间（秒）
+    PLAN_SPECULATIVE_TTL: int = 600
+
+    # 多轮对话生成计划时的会话状态存储：memory（单进程）| postgres（多 worker 共享）
+    SESSION_STORE: str = "memory"
+    # memory 存储的淘汰策略：最多会话数、空闲时间（秒）、已结束会话的保留时间（秒）
+    SESSION_MAX_ENTRIES: int = 10000
+    SESSION_IDLE_TTL: int = 3600
+    SESSION_ENDED_TTL: int = 60
+    # 单个会话压缩后的最大字节数（超过时丢弃最早的消息）和全部会话的内存上限
+    SESSION_MAX_BYTES: int = 64 * 1024
+    SESSION_MEMORY_BUDGET_MB: int = 256
+    # langgraph 的 checkpointer：memory | sqlite（同一台机器上的多个 worker 共享）
+    GRAPH_CHECKPOINTER: str = "memory"
+    GRAPH_CHECKPOINT_PATH: str = "./data/graph_checkpoints.sqlite"
+
     # logging setting
     log_level: str = get_env_value("LOG_LEVEL")
     log_path: str = get_env_value("LOG_PATH")
+    # 异步日志：handler 在后台线程输出，队列满时丢弃日志
+    LOG_ASYNC: bool = True
+    LOG_QUEUE_SIZE: int = 10000
+    # method_logger 的 START/END 日志采样率（0~1），错误日志不受采样影响
+    METHOD_LOG_SAMPLE_RATE: float = 0.01
+    # 超过该耗时（毫秒）的方法调用总是输出一条 WARNING 日志
+    METHOD_SLOW_MS: float = 1000
 
     # CORS setting
     ALLOW_ORIGINS = ["*"]
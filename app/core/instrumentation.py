@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: instrumentation.py
+功能: 方法级别的耗时统计装饰器 method_logger
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+"""
+import inspect
+import random
+import threading
+from functools import wraps
+from time import perf_counter_ns
+from typing import Dict
+
+from app.core.config import settings
+from app.utils.logger import get_logger
+from app.utils.metrics import Histogram, registry, render_histogram
+
+# 每个方法一个耗时直方图，key 为方法的 __qualname__
+_method_histograms: Dict[str, Histogram] = {}
+_histograms_lock = threading.Lock()
+
+
+def _get_histogram(name: str) -> Histogram:
+    with _histograms_lock:
+        histogram = _method_histograms.get(name)
+        if histogram is None:
+            histogram = _method_histograms[name] = Histogram()
+        return histogram
+
+
+def export_method_histograms() -> Dict[str, Dict]:
+    """
+    导出全部方法的耗时直方图
+
+    Return:
+        dict: {方法名: 直方图快照}，耗时单位为秒
+    """
+    with _histograms_lock:
+        histograms = dict(_method_histograms)
+    return {name: histogram.snapshot() for name, histogram in histograms.items()}
+
+
+def _collect_method_metrics():
+    """/metrics 采集时导出方法耗时直方图"""
+    with _histograms_lock:
+        histograms = dict(_method_histograms)
+    lines = ["# HELP method_duration_seconds method_logger统计的方法耗时",
+             "# TYPE method_duration_seconds histogram"]
+    for name, histogram in histograms.items():
+        lines.extend(render_histogram("method_duration_seconds", {"method": name}, histogram))
+    return lines
+
+
+registry.register_collector(_collect_method_metrics)
+
+
+def method_logger(func=None, *, slow_ms: float = None, sample_rate: float = None):
+    """
+    方法耗时统计装饰器
+
+    每次调用都把耗时记录到该方法的直方图中，只有被采样的调用和慢调用才输出日志，
+    错误总是记录。支持 @method_logger 和 @method_logger() 两种写法。
+
+    Args:
+        func: 被装饰的函数
+        slow_ms: 慢调用阈值（毫秒），默认 settings.METHOD_SLOW_MS
+        sample_rate: START/END 日志的采样率，默认 settings.METHOD_LOG_SAMPLE_RATE
+    """
+    if func is None:
+        return lambda f: _instrument(f, slow_ms, sample_rate)
+    return _instrument(func, slow_ms, sample_rate)
+
+
+def _instrument(func, slow_ms: float = None, sample_rate: float = None):
+    # 这些只在装饰时计算一次
+    method_name = func.__qualname__
+    logger = get_logger(func.__module__)
+    histogram = _get_histogram(method_name)
+    slow_ns = int((settings.METHOD_SLOW_MS if slow_ms is None else slow_ms) * 1_000_000)
+    rate = settings.METHOD_LOG_SAMPLE_RATE if sample_rate is None else sample_rate
+
+    def _start() -> bool:
+        sampled = rate > 0 and random.random() < rate
+        if sampled:
+            logger.info(f"METHOD START: {method_name}", method=method_name, stage="start")
+        return sampled
+
+    def _end(start_ns: int, sampled: bool):
+        elapsed_ns = perf_counter_ns() - start_ns
+        histogram.observe(elapsed_ns / 1e9)
+        if elapsed_ns >= slow_ns:
+            logger.warning(f"METHOD SLOW: {method_name}", method=method_name, stage="end",
+                           process_time=f"{elapsed_ns / 1e9:.3f}s", success=True)
+        elif sampled:
+            logger.info(f"METHOD END: {method_name}", method=method_name, stage="end",
+                        process_time=f"{elapsed_ns / 1e9:.3f}s", success=True)
+
+    def _error(start_ns: int, e: Exception):
+        elapsed_ns = perf_counter_ns() - start_ns
+        histogram.observe(elapsed_ns / 1e9)
+        logger.error(f"METHOD ERROR: {method_name}", method=method_name, stage="error",
+                     process_time=f"{elapsed_ns / 1e9:.3f}s", error=str(e), exc_info=True)
+
+    if inspect.isasyncgenfunction(func):
+        @wraps(func)
+        async def asyncgen_wrapper(*args, **kwargs):
+            # 流式方法统计从开始到迭代结束（或被关闭）的总耗时
+            sampled = _start()
+            start_ns = perf_counter_ns()
+            agen = func(*args, **kwargs)
+            failed = False
+            try:
+                async for item in agen:
+                    yield item
+            except Exception as e:
+                failed = True
+                _error(start_ns, e)
+                raise
+            finally:
+                await agen.aclose()
+                if not failed:
+                    _end(start_ns, sampled)
+        return asyncgen_wrapper
+
+    if inspect.iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            sampled = _start()
+            start_ns = perf_counter_ns()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                _error(start_ns, e)
+                raise
+            _end(start_ns, sampled)
+            return result
+        return async_wrapper
+
+    @wraps(func)
+    def sync_wrapper(*args, **kwargs):
+        sampled = _start()
+        start_ns = perf_counter_ns()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            _error(start_ns, e)
+            raise
+        _end(start_ns, sampled)
+        return result
+    return sync_wrapper
@@ -1,11 +1,19 @@
+import atexit
+import copy
 import logging
 import logging.config
 import json
 import os
+import queue
 import sys
 from pathlib import Path
-from logging.handlers import TimedRotatingFileHandler, RotatingFileHandler
+from logging.handlers import TimedRotatingFileHandler, RotatingFileHandler, QueueHandler, QueueListener
 from pythonjsonlogger import jsonlogger
+from app.utils.metrics import LOG_RECORDS_DROPPED
+
+# 后台日志监听线程（setup_logging 时创建）
+_listener = None
+_queue_handler = None
 
 
 class CustomJsonFormatter(jsonlogger.JsonFormatter):
@@ -29,6 +37,73 @@ class CustomJsonFormatter(jsonlogger.JsonFormatter):
         log_record['line'] = record.lineno
 
 
+class DroppingQueueHandler(QueueHandler):
+    """
+    有界队列的 QueueHandler
+
+    事件循环线程只负责把日志放进队列，格式化和写文件都交给后台线程。
+    队列满时丢弃日志而不是阻塞事件循环：ERROR 以上的日志会短暂等待，其余直接丢弃并计数。
+    """
+
+    def __init__(self, log_queue: queue.Queue, error_block_timeout: float = 0.05):
+        super().__init__(log_queue)
+        self.error_block_timeout = error_block_timeout
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 只合并 msg 和 args，格式化（包括异常堆栈）留给监听线程
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno >= logging.ERROR:
+                try:
+                    self.queue.put(record, timeout=self.error_block_timeout)
+                    return
+                except queue.Full:
+                    pass
+            self.dropped += 1
+            LOG_RECORDS_DROPPED.inc()
+
+
+class RoutingQueueListener(QueueListener):
+    """
+    按 logger 名称把日志分发给原来配置的 handler
+
+    所有 logger 共用一个队列，监听线程根据 record.name 找到最近的已配置 logger，
+    只交给它的 handler 处理，保持和同步配置时相同的输出目标。
+    """
+
+    def __init__(self, log_queue: queue.Queue, routes: dict):
+        super().__init__(log_queue, respect_handler_level=True)
+        self.routes = routes
+        self._resolved = {}
+
+    def _get_route(self, name: str) -> list:
+        handlers = self._resolved.get(name)
+        if handlers is None:
+            route = name
+            while route and route not in self.routes:
+                route = route.rpartition('.')[0]
+            handlers = self.routes.get(route, self.routes.get('', []))
+            self._resolved[name] = handlers
+        return handlers
+
+    def enqueue_sentinel(self):
+        # 队列满时等待监听线程消费，保证 stop() 能正常结束
+        self.queue.put(self._sentinel)
+
+    def handle(self, record):
+        for handler in self._get_route(record.name):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
 def ensure_log_directory(log_path):
     """确保日志目录存在"""
     log_path = Path('./log/smart_note_app' if not log_path else log_path)
@@ -48,8 +123,66 @@ def get_log_level(log_level):
     return level_map.get(log_level, logging.INFO)
 
 
-def setup_logging(log_path, log_level):
-    """日志配置"""
+def get_dropped_log_count() -> int:
+    """队列满时被丢弃的日志条数"""
+    return _queue_handler.dropped if _queue_handler else 0
+
+
+def stop_logging():
+    """停止后台监听线程，把队列中剩余的日志写完，并恢复同步输出"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        _listener.stop()
+        for name, handlers in _listener.routes.items():
+            logging.getLogger(name or None).handlers = handlers
+        _listener = None
+        _queue_handler = None
+
+
+def reinit_logging_after_fork():
+    """
+    在 fork 出来的子进程中重新启动日志监听线程
+
+    子进程不会继承父进程的线程，父进程的队列也可能处于加锁状态，
+    这里丢弃继承来的队列，按原来的路由重新创建队列和监听线程。
+    """
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    routes = _listener.routes
+    queue_size = _listener.queue.maxsize
+    for name, handlers in routes.items():
+        logging.getLogger(name or None).handlers = handlers
+    _listener = None
+    _queue_handler = None
+    _install_queue_handler(routes.keys(), queue_size)
+
+
+def _install_queue_handler(logger_names, queue_size: int):
+    """把已配置的 handler 移到后台线程，logger 上只保留一个 QueueHandler"""
+    global _listener, _queue_handler
+    log_queue = queue.Queue(maxsize=queue_size)
+    _queue_handler = DroppingQueueHandler(log_queue)
+    routes = {}
+    for name in logger_names:
+        logger = logging.getLogger(name or None)
+        routes[name] = list(logger.handlers)
+        logger.handlers = [_queue_handler]
+    _listener = RoutingQueueListener(log_queue, routes)
+    _listener.start()
+
+
+def setup_logging(log_path, log_level, queue_size: int = 10000, use_queue: bool = True):
+    """
+    日志配置
+
+    Args:
+        log_path: 日志目录
+        log_level: 日志级别
+        queue_size: 异步日志队列的最大长度，队列满时按丢弃策略处理
+        use_queue: 是否通过 QueueHandler/QueueListener 在后台线程输出日志
+    """
+    stop_logging()
 
     log_path = ensure_log_directory(log_path)
     log_level = get_log_level(log_level)
@@ -171,3 +304,8 @@ def setup_logging(log_path, log_level):
     }
 
     logging.config.dictConfig(LOGGING_CONFIG)
+    if use_queue:
+        _install_queue_handler(LOGGING_CONFIG['loggers'].keys(), queue_size)
+
+
+atexit.register(stop_logging)
@@ -17,12 +17,6 @@ class ErrorMessages:
     LLM_CONN_TIMEOUT = "大模型服务连接超时，请检测你网络"
 
 
-class CommonMessages:
-
-    # 大模型
-    LLM_PROCESS_FINISH = "***完了***\n\n"
-
-
 class UserMessages:
     PWD_DIFF = "输入的密码不相同，请重新输入。"
     USER_NOT_FOUND = "用户不存在"
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: backfill_vector_index.py
+功能: 从 PostgreSQL 重建向量索引（学习计划和笔记的切块）
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+
+- 使用服务端游标按 id 顺序分批读取 study_plans 和 notes，不会一次性把全部数据读进内存
+- 切块后交给多个进程并行向量化，同时在途的批次数量有上限，内存占用与总行数无关
+- 按提交顺序写入向量库，每写完一批记录一次检查点（阶段 + 最后处理的id），中断后可以从检查点继续
+- 切块id是稳定的，重复处理同一批数据只会覆盖，不会产生重复文档
+
+运行方式:
+    python -m app.db.backfill_vector_index --workers 4 --batch-size 256
+    python -m app.db.backfill_vector_index --restart        # 忽略检查点，从头开始
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from langchain_core.documents import Document
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.db.session import engine, session_scope
+from app.models.db_models import Note, StudyPlan
+from app.services.vector_index_service import vector_index_service
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+PHASES = ("plans", "notes")
+
+# 子进程中的向量化模型
+_worker_embeddings = None
+
+
+def _init_worker(backend: str, num_threads: int):
+    global _worker_embeddings
+    from app.llm.embedding_loader import create_embeddings
+    _worker_embeddings = create_embeddings(backend, num_threads)
+
+
+def _embed_batch(texts: List[str]):
+    import numpy as np
+    return np.asarray(_worker_embeddings.embed_documents(texts), dtype=np.float32)
+
+
+class Checkpoint:
+    """检查点文件：当前阶段和该阶段已经写入向量库的最大id"""
+
+    def __init__(self, path: str, restart: bool = False):
+        self.path = path
+        self.state = {"phase": PHASES[0], "last_id": 0, "rows": 0, "chunks": 0}
+        if not restart and os.path.exists(path):
+            with open(path) as f:
+                self.state = json.load(f)
+
+    def last_id(self, phase: str) -> Optional[int]:
+        """阶段已完成时返回 None，否则返回需要跳过的最大id"""
+        current = PHASES.index(self.state["phase"])
+        if PHASES.index(phase) < current:
+            return None
+        return self.state["last_id"] if PHASES.index(phase) == current else 0
+
+    def save(self, phase: str, last_id: int, rows: int, chunks: int):
+        if phase != self.state["phase"]:
+            self.state.update(phase=phase, last_id=0)
+        self.state["last_id"] = last_id
+        self.state["rows"] += rows
+        self.state["chunks"] += chunks
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.path)
+
+
+class Backfill:
+
+    def __init__(self, chroma, pool: ProcessPoolExecutor, checkpoint: Checkpoint, max_in_flight: int):
+        self.chroma = chroma
+        self.pool = pool
+        self.checkpoint = checkpoint
+        self.max_in_flight = max_in_flight
+        # 按提交顺序保存的在途批次: (阶段, 最后id, 行数, 切块, future)
+        self.in_flight = deque()
+        self.rows = 0
+        self.chunks = 0
+        self.start_time = time.perf_counter()
+
+    async def submit(self, phase: str, last_id: int, rows: int, chunks: Dict[str, Document]):
+        """提交一批切块去向量化；在途批次达到上限时先等最早的一批写完"""
+        while len(self.in_flight) >= self.max_in_flight:
+            await self.drain_one()
+        future = asyncio.get_running_loop().run_in_executor(
+            self.pool, _embed_batch, [doc.page_content for doc in chunks.values()])
+        self.in_flight.append((phase, last_id, rows, chunks, future))
+
+    async def drain_one(self):
+        phase, last_id, rows, chunks, future = self.in_flight.popleft()
+        embeddings = await future
+        # 写入和检查点都按提交顺序进行，检查点之前的数据一定已经写入
+        await asyncio.to_thread(self.chroma.upsert_embeddings, list(chunks), embeddings, list(chunks.values()))
+        self.checkpoint.save(phase, last_id, rows, len(chunks))
+        self.rows += rows
+        self.chunks += len(chunks)
+        elapsed = time.perf_counter() - self.start_time
+        print(f"[{phase}] last_id={last_id} 已处理 {self.rows} 行 / {self.chunks} 个切块, "
+              f"{self.rows / elapsed:.1f} 行/秒, {self.chunks / elapsed:.1f} 切块/秒", flush=True)
+
+    async def drain(self):
+        while self.in_flight:
+            await self.drain_one()
+
+    async def run_plans(self, batch_size: int):
+        last_id = self.checkpoint.last_id("plans")
+        if last_id is None:
+            return
+        stmt = (select(StudyPlan).where(StudyPlan.id > last_id).order_by(StudyPlan.id)
+                .execution_options(yield_per=batch_size))
+        async with session_scope() as db:
+            result = await db.stream_scalars(stmt)
+            async for plans in result.partitions():
+                # 游标所在的连接只负责读取计划，每天的笔记用另一个短会话查询
+                async with session_scope() as lookup:
+                    notes = (await lookup.execute(
+                        select(Note).where(Note.study_plan_id.in_([p.id for p in plans]))
+                        .order_by(Note.planned_study_start_time))).scalars().all()
+                notes_by_plan = {}
+                for note in notes:
+                    notes_by_plan.setdefault(note.study_plan_id, []).append(note)
+                chunks = {}
+                for plan in plans:
+                    chunks.update(vector_index_service.build_plan_chunks(plan, notes_by_plan.get(plan.id, [])))
+                await self.submit("plans", plans[-1].id, len(plans), chunks)
+        await self.drain()
+
+    async def run_notes(self, batch_size: int):
+        last_id = self.checkpoint.last_id("notes")
+        if last_id is None:
+            return
+        stmt = (select(Note, StudyPlan.user_id).join(StudyPlan, Note.study_plan_id == StudyPlan.id)
+                .where(Note.id > last_id, Note.detailed_content.is_not(None), Note.detailed_content != "")
+                .order_by(Note.id).execution_options(yield_per=batch_size))
+        async with session_scope() as db:
+            result = await db.stream(stmt)
+            async for rows in result.partitions():
+                chunks = {}
+                for note, user_id in rows:
+                    chunks.update(vector_index_service.build_note_chunks(note, user_id))
+                # 一行笔记可能切成很多块，按切块数再分批，避免单次向量化过大
+                items = list(chunks.items())
+                for start in range(0, len(items), batch_size):
+                    part = dict(items[start:start + batch_size])
+                    is_last = start + batch_size >= len(items)
+                    # 只有一行的全部切块都提交后才推进检查点
+                    await self.submit("notes", rows[-1][0].id if is_last else last_id,
+                                      len(rows) if is_last else 0, part)
+                last_id = rows[-1][0].id
+        await self.drain()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="从 PostgreSQL 重建向量索引")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="向量化进程数")
+    parser.add_argument("--threads-per-worker", type=int, default=1,
+                        help="每个向量化进程的推理线程数")
+    parser.add_argument("--batch-size", type=int, default=256, help="每批读取的行数和向量化的切块数")
+    parser.add_argument("--max-in-flight", type=int, default=None,
+                        help="同时在途的批次上限，默认 workers * 2")
+    parser.add_argument("--checkpoint", default="./data/backfill_vector_index.json")
+    parser.add_argument("--restart", action="store_true", help="忽略检查点，从头开始")
+    args = parser.parse_args()
+
+    from app.db.vector_db_helper import ChromaLangChainManager
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.checkpoint)), exist_ok=True)
+    checkpoint = Checkpoint(args.checkpoint, args.restart)
+    print(f"从检查点开始: {checkpoint.state}")
+    chroma = ChromaLangChainManager()
+    chroma.load_existing_collection()
+
+    # spawn 启动子进程，不继承事件循环和数据库连接
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(args.workers, mp_context=context, initializer=_init_worker,
+                             initargs=(settings.EMBEDDING_BACKEND, args.threads_per_worker)) as pool:
+        backfill = Backfill(chroma, pool, checkpoint, args.max_in_flight or args.workers * 2)
+        await backfill.run_plans(args.batch_size)
+        await backfill.run_notes(args.batch_size)
+    chroma.persist()
+    await engine.dispose()
+
+    elapsed = time.perf_counter() - backfill.start_time
+    print(f"完成: {backfill.rows} 行, {backfill.chunks} 个切块, 耗时 {elapsed:.1f}s, "
+          f"{backfill.rows / max(elapsed, 1e-9):.1f} 行/秒")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
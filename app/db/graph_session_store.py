@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: graph_session_store.py
+功能: 多轮对话生成学习计划时 graph 会话状态的存储
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+"""
+import json
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from langchain_core.messages import messages_from_dict, messages_to_dict
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+
+from app.core.config import settings
+from app.db.session import session_scope
+from app.models.db_models import GraphSession
+from app.utils.logger import get_logger
+from app.utils.metrics import GRAPH_SESSIONS, GRAPH_SESSION_BYTES, GRAPH_SESSION_EVICTIONS_TOTAL
+
+logger = get_logger(__name__)
+
+
+def serialize_state(state: Dict) -> Dict:
+    """把 graph 状态转换成可以存成 JSON 的 dict"""
+    data = dict(state)
+    if "messages" in data:
+        data["messages"] = messages_to_dict(data["messages"])
+    return data
+
+
+def deserialize_state(data: Dict) -> Dict:
+    """serialize_state 的逆操作"""
+    state = dict(data)
+    if "messages" in state:
+        state["messages"] = messages_from_dict(state["messages"])
+    return state
+
+
+class GraphSessionStore(ABC):
+    """graph 会话状态存储的接口"""
+
+    @abstractmethod
+    async def get(self, session_id: str) -> Optional[Dict]:
+        ...
+
+    @abstractmethod
+    async def set(self, session_id: str, state: Dict):
+        ...
+
+    @abstractmethod
+    async def delete(self, session_id: str):
+        ...
+
+
+class MemoryGraphSessionStore(GraphSessionStore):
+    """
+    进程内存储，只适用于单个 worker
+
+    状态序列化成压缩后的 JSON 保存，占用的字节数就是压缩后的长度。按最近访问顺序（LRU）淘汰，
+    超过空闲时间的会话会被删除，已经结束（status == "end"）的会话只保留很短的时间。
+    单个会话超过 max_session_bytes 时丢弃最早的消息，节点只用到最后一条消息。
+    """
+    # 检查过期会话的最小间隔（秒）
+    SWEEP_INTERVAL = 1.0
+
+    def __init__(self, max_entries: int = 10000, idle_ttl: float = 3600, ended_ttl: float = 60,
+                 max_session_bytes: int = 64 * 1024, memory_budget_bytes: int = 256 * 1024 * 1024):
+        """
+        Args:
+            max_entries: 最多保存的会话数
+            idle_ttl: 会话的空闲时间（秒），超过后删除
+            ended_ttl: 已结束会话的保留时间（秒）
+            max_session_bytes: 单个会话压缩后的最大字节数
+            memory_budget_bytes: 全部会话压缩后的总字节数上限
+        """
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        self.ended_ttl = ended_ttl
+        self.max_session_bytes = max_session_bytes
+        self.memory_budget_bytes = memory_budget_bytes
+        # 会话id -> (压缩后的状态, 过期时间)，按最近访问排序，最久未访问的在前面
+        self._sessions: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self._bytes = 0
+        self._next_sweep = 0.0
+
+    @staticmethod
+    def _dumps(state: Dict) -> bytes:
+        data = json.dumps(serialize_state(state), ensure_ascii=False, separators=(",", ":"), default=str)
+        return zlib.compress(data.encode("utf-8"))
+
+    @staticmethod
+    def _loads(blob: bytes) -> Dict:
+        return deserialize_state(json.loads(zlib.decompress(blob)))
+
+    def _compact(self, state: Dict) -> bytes:
+        """压缩状态，超过单个会话的上限时从最早的消息开始丢弃"""
+        blob = self._dumps(state)
+        messages = list(state.get("messages") or [])
+        while len(blob) > self.max_session_bytes and len(messages) > 1:
+            # 一次丢弃超出比例对应的消息数，避免逐条重新压缩
+            drop = max(1, min(len(messages) - 1, len(messages) * (len(blob) - self.max_session_bytes) // len(blob)))
+            messages = messages[drop:]
+            blob = self._dumps({**state, "messages": messages})
+        return blob
+
+    def _remove(self, session_id: str, reason: Optional[str] = None):
+        blob, _ = self._sessions.pop(session_id)
+        self._bytes -= len(blob)
+        if reason:
+            GRAPH_SESSION_EVICTIONS_TOTAL.inc(reason=reason)
+
+    def _evict(self):
+        now = time.monotonic()
+        # 已结束的会话 TTL 更短，可能排在未过期的空闲会话后面，所以要检查全部会话；
+        # 全量检查最多每 SWEEP_INTERVAL 秒一次
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.SWEEP_INTERVAL
+            expired = [session_id for session_id, (_, expires_at) in self._sessions.items() if expires_at <= now]
+            for session_id in expired:
+                self._remove(session_id, "ttl")
+        while self._sessions and (len(self._sessions) > self.max_entries
+                                  or self._bytes > self.memory_budget_bytes):
+            self._remove(next(iter(self._sessions)), "lru")
+        GRAPH_SESSIONS.set(len(self._sessions))
+        GRAPH_SESSION_BYTES.set(self._bytes)
+
+    async def get(self, session_id: str) -> Optional[Dict]:
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        blob, expires_at = entry
+        if expires_at <= time.monotonic():
+            self._remove(session_id, "ttl")
+            self._evict()
+            return None
+        self._sessions.move_to_end(session_id)
+        # 每次返回新的对象，调用方修改状态不会影响已保存的内容
+        return self._loads(blob)
+
+    async def set(self, session_id: str, state: Dict):
+        blob = self._compact(state)
+        ttl = self.ended_ttl if state.get("status") == "end" else self.idle_ttl
+        if session_id in self._sessions:
+            self._remove(session_id)
+        self._sessions[session_id] = (blob, time.monotonic() + ttl)
+        self._bytes += len(blob)
+        self._evict()
+
+    async def delete(self, session_id: str):
+        if session_id in self._sessions:
+            self._remove(session_id)
+            self._evict()
+
+
+class PostgresGraphSessionStore(GraphSessionStore):
+    """保存在 graph_sessions 表中，多个 worker 共享"""
+
+    async def get(self, session_id: str) -> Optional[Dict]:
+        async with session_scope() as db:
+            row = await db.get(GraphSession, session_id)
+            return deserialize_state(row.state) if row else None
+
+    async def set(self, session_id: str, state: Dict):
+        data = serialize_state(state)
+        stmt = insert(GraphSession).values(session_id=session_id, state=data)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[GraphSession.session_id],
+            set_={"state": data, "updated_at": func.now()})
+        async with session_scope() as db:
+            await db.execute(stmt)
+
+    async def delete(self, session_id: str):
+        async with session_scope() as db:
+            row = await db.get(GraphSession, session_id)
+            if row:
+                await db.delete(row)
+
+
+def create_graph_session_store(backend: str) -> GraphSessionStore:
+    """
+    根据配置创建会话存储
+
+    Args:
+        backend: memory 或 postgres
+    """
+    if backend == "postgres":
+        return PostgresGraphSessionStore()
+    if backend == "memory":
+        return MemoryGraphSessionStore(
+            settings.SESSION_MAX_ENTRIES, settings.SESSION_IDLE_TTL, settings.SESSION_ENDED_TTL,
+            settings.SESSION_MAX_BYTES, settings.SESSION_MEMORY_BUDGET_MB * 1024 * 1024)
+    raise ValueError(f"不支持的会话存储: {backend}")
@@ -1,5 +1,19 @@
+from sqlalchemy import text
 from app.db.session import Base, engine
 
+# 多个 worker 同时启动时用 advisory lock 串行执行建表，避免并发 CREATE TABLE 冲突
+INIT_DB_LOCK_ID = 20261019
+
+
+def _create_all(conn) -> None:
+    Base.metadata.create_all(conn)
+    # create_all 不会给已经存在的表补建新增的索引（例如批量任务的部分唯一索引）
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
 async def init_db() -> None:
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": INIT_DB_LOCK_ID})
+        await conn.run_sync(_create_all)
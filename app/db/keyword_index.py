@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: keyword_index.py
+功能: BM25 关键词索引（中文按二元组切分）
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+"""
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+# 连续的中日韩字符，或连续的字母数字
+_TOKEN_PATTERN = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]+|[a-zA-Z0-9_+#.]+")
+# 查询中不参与检索的二元组：学习请求中的套话，几乎每个计划里都有，命中了也说明不了学过这个主题
+STOPWORDS = frozenset({
+    "学习", "我想", "想学", "想要", "一下", "了解", "怎么", "如何", "计划", "系统", "课程", "内容", "知识", "开始",
+})
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    切词：中日韩文字切成相邻两个字的二元组（单字时保留单字），英文和数字按整词小写
+
+    例如 "学习python基础" -> ["学习", "python", "基础"]
+    """
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(text or ""):
+        word = match.group()
+        if word.isascii():
+            word = word.strip(".").lower()
+            if word:
+                tokens.append(word)
+        elif len(word) == 1:
+            tokens.append(word)
+        else:
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+class BM25Index:
+    """
+    内存中的 BM25 倒排索引
+
+    除了 BM25 分数，检索结果还给出覆盖率：查询中不重复的词（去掉 STOPWORDS）按 IDF 加权，
+    出现在文档中的比例，用来判断关键词命中是否足够可靠。只命中几乎每个文档都有的常见词时覆盖率很低。
+    """
+
+    def __init__(self, documents: Dict[str, Tuple[str, Dict[str, Any]]], k1: float = 1.5, b: float = 0.75):
+        """
+        Args:
+            documents: 文档id -> (正文, 元数据)
+            k1: 词频饱和参数
+            b: 文档长度归一化参数
+        """
+        self.k1 = k1
+        self.b = b
+        self.documents = documents
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.lengths: Dict[str, int] = {}
+        for doc_id, (text, _) in documents.items():
+            counts = Counter(tokenize(text))
+            self.lengths[doc_id] = sum(counts.values())
+            for token, tf in counts.items():
+                self.postings.setdefault(token, {})[doc_id] = tf
+        self.avg_length = sum(self.lengths.values()) / len(self.lengths) if self.lengths else 0.0
+
+    def __len__(self):
+        return len(self.documents)
+
+    def _idf(self, token: str) -> float:
+        df = len(self.postings.get(token, ()))
+        return math.log(1 + (len(self.documents) - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int = 3) -> List[Tuple[str, float, float]]:
+        """
+        检索
+
+        Args:
+            query: 查询文本
+            k: 返回结果数量
+
+        Return:
+            list: (文档id, BM25分数, 覆盖率) 按分数从高到低排列；查询只有停用词时为空
+        """
+        terms = set(tokenize(query)) - STOPWORDS
+        if not terms or not self.documents:
+            return []
+        idfs = {token: self._idf(token) for token in terms}
+        total_idf = sum(idfs.values())
+        scores: Dict[str, float] = {}
+        matched: Dict[str, float] = {}
+        for token in terms:
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = idfs[token]
+            for doc_id, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / (self.avg_length or 1))
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+                matched[doc_id] = matched.get(doc_id, 0.0) + idf
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(doc_id, score, matched[doc_id] / total_idf) for doc_id, score in ranked]
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    倒数排名融合：score(d) = Σ 1 / (k + rank)
+
+    Args:
+        rankings: 多个检索结果的文档id列表（按相关度从高到低）
+        k: 平滑常数，常用 60
+
+    Return:
+        list: (文档id, 融合分数) 按分数从高到低排列
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -1,16 +1,32 @@
+import time
+from contextlib import asynccontextmanager
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from app.core.config import settings
+from app.utils.metrics import DB_POOL_CHECKOUT_SECONDS, DB_POOL_IN_USE, DB_POOL_SATURATION
+
+# asyncpg 方言通过 URL 参数设置预编译语句缓存
+database_url = make_url(settings.SQLALCHEMY_DATABASE_URI).update_query_dict(
+    {"prepared_statement_cache_size": str(settings.DB_PREPARED_STATEMENT_CACHE_SIZE)})
 
 # 创建异步引擎
 engine = create_async_engine(
-    settings.SQLALCHEMY_DATABASE_URI,
-    echo=True,  # 开发时显示SQL语句
-    pool_size=10,
-    max_overflow=20,
-    pool_timeout=30
+    database_url,
+    echo=settings.DB_ECHO,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING
 )
 
+# 连接池使用情况在 /metrics 采集时计算
+_pool = engine.sync_engine.pool
+_pool_capacity = settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW
+DB_POOL_IN_USE.set_function(_pool.checkedout)
+DB_POOL_SATURATION.set_function(lambda: _pool.checkedout() / _pool_capacity)
+
 # 创建异步会话工厂
 AsyncSessionLocal = sessionmaker(
     bind=engine,
@@ -22,10 +38,25 @@ AsyncSessionLocal = sessionmaker(
 # 声明基类
 Base = declarative_base()
 
-# 依赖注入: 获取数据库会话
 
+@asynccontextmanager
+async def session_scope():
+    """
+    短生命周期的会话：进入时开启事务，退出时提交（异常时回滚）并归还连接。
 
-async def get_session():
+    流式接口在调用大模型前后各用一次，不要在整个流式响应期间持有连接。
+    """
     async with AsyncSessionLocal() as session:
         async with session.begin():
+            # 先取得连接，记录在连接池上的等待时间
+            start_time = time.perf_counter()
+            await session.connection()
+            DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - start_time)
             yield session
+
+# 依赖注入: 获取数据库会话
+
+
+async def get_session():
+    async with session_scope() as session:
+        yield session
@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: vector_backends.py
+功能: 向量存储后端（Chroma / NumPy）
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+
+ChromaLangChainManager 负责向量化和监控，具体的存储和检索交给这里的后端。
+后端只处理已经向量化的数据，分数统一为余弦相似度（越大越相似）。
+"""
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 检索结果: (文档id, 正文, 元数据, 余弦相似度)
+SearchHit = Tuple[str, str, Dict[str, Any], float]
+
+
+class VectorBackend(ABC):
+    """向量存储后端的接口"""
+
+    # 写操作需要进程间文件锁时返回锁文件所在的目录，不需要时为 None
+    lock_directory: Optional[str] = None
+
+    @abstractmethod
+    def upsert(self, ids: List[str], embeddings: List[List[float]], documents: List[str],
+               metadatas: List[Dict[str, Any]]):
+        ...
+
+    @abstractmethod
+    def delete(self, ids: List[str]):
+        ...
+
+    @abstractmethod
+    def get_metadatas(self, where: Optional[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def get_documents(self, where: Optional[Dict[str, Any]]) -> Dict[str, Tuple[str, Dict[str, Any]]]:
+        """满足条件的文档，文档id -> (正文, 元数据)"""
+
+    @abstractmethod
+    def query(self, embeddings: List[List[float]], k: int,
+              where: Optional[Dict[str, Any]] = None) -> List[List[SearchHit]]:
+        """批量检索，每个查询向量返回按相似度从高到低排列的 k 个结果"""
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    def persist(self):
+        pass
+
+
+class ChromaBackend(VectorBackend):
+    """直接使用 chromadb 的集合，不经过 langchain 的封装"""
+
+    def __init__(self, collection_name: str, persist_directory: str, client=None):
+        import chromadb
+        if client is None:
+            # 本地持久化的 Chroma 只支持单个进程，文件锁也无法让多个进程共享，因此不设置 lock_directory
+            client = chromadb.PersistentClient(path=persist_directory)
+        # 使用余弦距离，相似度 = 1 - distance，阈值不依赖向量是否归一化
+        self.collection = client.get_or_create_collection(
+            collection_name, metadata={"hnsw:space": "cosine"})
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        # chroma 不接受空的 metadata
+        self.collection.upsert(ids=ids, embeddings=embeddings, documents=documents,
+                               metadatas=metadatas if metadatas and all(metadatas) else None)
+
+    def delete(self, ids):
+        self.collection.delete(ids=ids)
+
+    def get_metadatas(self, where):
+        result = self.collection.get(where=where, include=["metadatas"])
+        return dict(zip(result["ids"], result["metadatas"]))
+
+    def get_documents(self, where):
+        result = self.collection.get(where=where, include=["documents", "metadatas"])
+        return {doc_id: (text, metadata or {})
+                for doc_id, text, metadata in zip(result["ids"], result["documents"], result["metadatas"])}
+
+    def query(self, embeddings, k, where=None):
+        result = self.collection.query(query_embeddings=embeddings, n_results=k, where=where,
+                                       include=["documents", "metadatas", "distances"])
+        return [
+            [(doc_id, text, metadata or {}, 1.0 - distance)
+             for doc_id, text, metadata, distance in zip(ids, texts, metadatas, distances)]
+            for ids, texts, metadatas, distances in zip(
+                result["ids"], result["documents"], result["metadatas"], result["distances"])
+        ]
+
+    def count(self):
+        return self.collection.count()
+
+
+class NumpyBackend(VectorBackend):
+    """
+    纯 NumPy 的精确检索
+
+    - 向量归一化后以 float32 追加写入 vectors.f32，通过 np.memmap 读取，不需要全部读进内存
+    - 文档id、正文和元数据的变更追加写入 log.jsonl，启动时重放；upsert 写入新行并把旧行标记为删除
+    - 检索时先用元数据倒排表得到候选行，再分块做矩阵乘法，用 argpartition 取 top-k
+    - 多个 worker 共享同一个目录：写入在文件锁内进行，其他进程在检索前读取日志的新增部分
+    - 同一进程内的日志重放、写入和检索通过可重入锁串行执行
+    - quantization="int8" 时内存中只保留按行量化的 int8 向量（约为 float32 的 1/4），
+      先用 int8 向量粗排出 k * rerank_factor 个候选，再从 memmap 读取这些行的 float32 向量精排
+    """
+
+    # 无过滤检索时每次参与矩阵乘法的行数，限制临时内存
+    BLOCK_ROWS = 65536
+    # 量化和 int8 检索时每次处理的行数，float32 临时数组约 INT8_BLOCK_ROWS * dim * 4 字节
+    INT8_BLOCK_ROWS = 4096
+
+    def __init__(self, directory: str, quantization: str = "none", rerank_factor: int = 4):
+        if quantization not in ("none", "int8"):
+            raise ValueError(f"不支持的量化方式: {quantization}")
+        self.quantization = quantization
+        self.rerank_factor = rerank_factor
+        # int8 量化后的向量和每行的缩放系数：x ≈ scale * code
+        self._codes = np.zeros((0, 0), dtype=np.int8)
+        self._scales = np.zeros(0, dtype=np.float32)
+        self._quantized_rows = 0
+        self.directory = directory
+        self.lock_directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._vector_path = os.path.join(directory, "vectors.f32")
+        self._log_path = os.path.join(directory, "log.jsonl")
+        self._info_path = os.path.join(directory, "index.json")
+        self.dim: Optional[int] = None
+        self._vectors: Optional[np.ndarray] = None
+        self._ids: List[Optional[str]] = []
+        self._documents: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._id_to_row: Dict[str, int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        # (字段, 值) -> 行号列表，用于等值过滤
+        self._postings: Dict[Tuple[str, Any], List[int]] = {}
+        self._log_offset = 0
+        # 检索在线程池中并发执行：重放日志、写入和检索都持有这个锁，
+        # 避免同一段日志被重放两次，或者检索到只更新了一半的行（写入时会嵌套调用 refresh，所以是可重入锁）
+        self._lock = threading.RLock()
+        self.refresh()
+
+    # ------------------------------------------------------------------
+    # 持久化
+    # ------------------------------------------------------------------
+    def refresh(self):
+        """读取其他进程追加的日志，并在向量文件变大时重新映射"""
+        with self._lock:
+            if self.dim is None and os.path.exists(self._info_path):
+                with open(self._info_path) as f:
+                    self.dim = json.load(f)["dim"]
+            if not os.path.exists(self._log_path) or os.path.getsize(self._log_path) == self._log_offset:
+                return
+            with open(self._log_path, "rb") as f:
+                f.seek(self._log_offset)
+                for line in f:
+                    # 只处理完整的行，写到一半的行留到下次
+                    if not line.endswith(b"\n"):
+                        break
+                    self._apply(json.loads(line))
+                    self._log_offset += len(line)
+            self._remap()
+
+    def _remap(self):
+        rows = len(self._ids)
+        if self.dim is None or rows == 0:
+            return
+        if self._vectors is None or self._vectors.shape[0] < rows:
+            self._vectors = np.memmap(self._vector_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        if self.quantization == "int8":
+            self._quantize_new_rows(rows)
+
+    def _quantize_new_rows(self, rows: int):
+        """把新增的行量化成 int8，已量化的行不再处理"""
+        if rows > len(self._codes):
+            capacity = max(rows, len(self._codes) * 2)
+            codes = np.zeros((capacity, self.dim), dtype=np.int8)
+            scales = np.zeros(capacity, dtype=np.float32)
+            if self._quantized_rows:
+                codes[:self._quantized_rows] = self._codes[:self._quantized_rows]
+                scales[:self._quantized_rows] = self._scales[:self._quantized_rows]
+            self._codes, self._scales = codes, scales
+        for start in range(self._quantized_rows, rows, self.INT8_BLOCK_ROWS):
+            end = min(start + self.INT8_BLOCK_ROWS, rows)
+            block = np.asarray(self._vectors[start:end])
+            scale = np.maximum(np.abs(block).max(axis=1), 1e-12) / 127.0
+            self._codes[start:end] = np.round(block / scale[:, None]).astype(np.int8)
+            self._scales[start:end] = scale
+        self._quantized_rows = rows
+
+    def memory_bytes(self) -> int:
+        """检索时需要常驻内存的向量数据大小（不含元数据）"""
+        rows = len(self._ids)
+        if self.quantization == "int8":
+            return self._codes[:rows].nbytes + self._scales[:rows].nbytes
+        return rows * (self.dim or 0) * 4
+
+    def _apply(self, entry: Dict[str, Any]):
+        if entry["op"] == "add":
+            row = entry["row"]
+            old_row = self._id_to_row.get(entry["id"])
+            if old_row is not None:
+                self._kill(old_row)
+            self._grow(row + 1)
+            self._ids[row] = entry["id"]
+            self._documents[row] = entry["document"]
+            self._metadatas[row] = entry["metadata"]
+            self._id_to_row[entry["id"]] = row
+            self._alive[row] = True
+            for key, value in entry["metadata"].items():
+                self._postings.setdefault((key, value), []).append(row)
+        elif entry["op"] == "delete":
+            row = self._id_to_row.pop(entry["id"], None)
+            if row is not None:
+                self._kill(row)
+
+    def _kill(self, row: int):
+        self._alive[row] = False
+        self._ids[row] = None
+        self._documents[row] = ""
+
+    def _grow(self, rows: int):
+        missing = rows - len(self._ids)
+        if missing <= 0:
+            return
+        self._ids.extend([None] * missing)
+        self._documents.extend([""] * missing)
+        self._metadatas.extend([{}] * missing)
+        if rows > len(self._alive):
+            alive = np.zeros(max(rows, len(self._alive) * 2), dtype=bool)
+            alive[:len(self._alive)] = self._alive
+            self._alive = alive
+
+    def _append_log(self, entries: List[Dict[str, Any]]):
+        with open(self._log_path, "ab") as f:
+            f.write("".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries).encode("utf-8"))
+            f.flush()
+        # 自己写入的日志按相同的流程重放
+        self.refresh()
+
+    # ------------------------------------------------------------------
+    # 写入（调用方需要持有文件锁）
+    # ------------------------------------------------------------------
+    def upsert(self, ids, embeddings, documents, metadatas):
+        with self._lock:
+            self.refresh()
+            vectors = self._normalize(np.asarray(embeddings, dtype=np.float32))
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                with open(self._info_path, "w") as f:
+                    json.dump({"dim": self.dim}, f)
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"向量维度不一致: {vectors.shape[1]} != {self.dim}")
+
+            # 行号以向量文件的实际行数为准，日志中途写入失败时也不会错位
+            first_row = os.path.getsize(self._vector_path) // (4 * self.dim) if os.path.exists(self._vector_path) else 0
+            with open(self._vector_path, "ab") as f:
+                f.write(vectors.tobytes())
+                f.flush()
+            metadatas = metadatas or [{} for _ in ids]
+            self._append_log([
+                {"op": "add", "row": first_row + i, "id": doc_id, "document": text, "metadata": metadata}
+                for i, (doc_id, text, metadata) in enumerate(zip(ids, documents, metadatas))
+            ])
+
+    def delete(self, ids):
+        with self._lock:
+            self.refresh()
+            self._append_log([{"op": "delete", "id": doc_id} for doc_id in ids if doc_id in self._id_to_row])
+
+    def persist(self):
+        for path in (self._vector_path, self._log_path):
+            if os.path.exists(path):
+                with open(path, "rb+") as f:
+                    os.fsync(f.fileno())
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+    def count(self):
+        with self._lock:
+            self.refresh()
+            return len(self._id_to_row)
+
+    def get_metadatas(self, where):
+        with self._lock:
+            self.refresh()
+            rows = self._candidate_rows(where)
+            return {self._ids[row]: self._metadatas[row] for row in rows}
+
+    def get_documents(self, where):
+        with self._lock:
+            self.refresh()
+            rows = self._candidate_rows(where)
+            return {self._ids[row]: (self._documents[row], self._metadatas[row]) for row in rows}
+
+    def query(self, embeddings, k, where=None):
+        with self._lock:
+            self.refresh()
+            queries = self._normalize(np.asarray(embeddings, dtype=np.float32))
+            if self._vectors is None:
+                return [[] for _ in range(len(queries))]
+            # 量化时先多取一些候选，再用 float32 向量精排
+            candidates = k * self.rerank_factor if self.quantization == "int8" else k
+            if where is None:
+                rows, scores = self._search_all(queries, candidates)
+            else:
+                rows, scores = self._search_rows(queries, candidates, self._candidate_rows(where))
+            if self.quantization == "int8":
+                rows, scores = self._rerank(queries, rows, scores, k)
+            return [
+                [(self._ids[row], self._documents[row], self._metadatas[row], float(score))
+                 for row, score in zip(row_list, score_list) if np.isfinite(score)]
+                for row_list, score_list in zip(rows, scores)
+            ]
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """scores 形状为 (查询数, 候选数)，返回每个查询 top-k 的下标和分数（从高到低）"""
+        k = min(k, scores.shape[1])
+        if k == 0:
+            empty = np.zeros((scores.shape[0], 0))
+            return empty.astype(np.int64), empty
+        idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top = np.take_along_axis(scores, idx, axis=1)
+        order = np.argsort(-top, axis=1)
+        return np.take_along_axis(idx, order, axis=1), np.take_along_axis(top, order, axis=1)
+
+    def _search_all(self, queries: np.ndarray, k: int):
+        """分块计算全部行的相似度，每块保留 top-k 后再合并"""
+        rows = len(self._ids)
+        block_rows, block_scores = [], []
+        for start in range(0, rows, self.BLOCK_ROWS):
+            end = min(start + self.BLOCK_ROWS, rows)
+            scores = self._score(queries, slice(start, end))
+            scores[:, ~self._alive[start:end]] = -np.inf
+            idx, top = self._top_k(scores, k)
+            block_rows.append(idx + start)
+            block_scores.append(top)
+        all_rows = np.concatenate(block_rows, axis=1)
+        idx, top = self._top_k(np.concatenate(block_scores, axis=1), k)
+        return np.take_along_axis(all_rows, idx, axis=1), top
+
+    def _search_rows(self, queries: np.ndarray, k: int, rows: np.ndarray):
+        """只计算候选行的相似度"""
+        if len(rows) == 0:
+            return [[] for _ in range(len(queries))], [[] for _ in range(len(queries))]
+        idx, top = self._top_k(self._score(queries, rows), k)
+        return rows[idx], top
+
+    def _score(self, queries: np.ndarray, rows) -> np.ndarray:
+        """计算查询和指定行（切片或行号数组）的相似度，量化时为近似值"""
+        if self.quantization == "int8":
+            return self._score_int8(queries, rows)
+        return queries @ self._vectors[rows].T
+
+    def _score_int8(self, queries: np.ndarray, rows) -> np.ndarray:
+        """int8 向量分小块转换成 float32 计算，避免一次转换整个大块产生很大的临时数组"""
+        if isinstance(rows, slice):
+            start, stop, _ = rows.indices(len(self._codes))
+            rows = np.arange(start, stop)
+        scores = np.empty((len(queries), len(rows)), dtype=np.float32)
+        for start in range(0, len(rows), self.INT8_BLOCK_ROWS):
+            part = rows[start:start + self.INT8_BLOCK_ROWS]
+            # 连续的行用切片读取，不复制 int8 数据
+            block = self._codes[part[0]:part[-1] + 1] if part[-1] - part[0] == len(part) - 1 else self._codes[part]
+            scores[:, start:start + len(part)] = (queries @ block.astype(np.float32).T) * self._scales[part]
+        return scores
+
+    def _rerank(self, queries: np.ndarray, rows, scores, k: int):
+        """用 float32 向量重新计算候选行的相似度，取精确的 top-k"""
+        result_rows, result_scores = [], []
+        for query, row_list, score_list in zip(queries, rows, scores):
+            # 按行号排序后读取，memmap 的访问更连续
+            candidates = np.sort(np.asarray(row_list)[np.isfinite(score_list)])
+            if len(candidates) == 0:
+                result_rows.append([])
+                result_scores.append([])
+                continue
+            idx, top = self._top_k((self._vectors[candidates] @ query)[None, :], k)
+            result_rows.append(candidates[idx[0]])
+            result_scores.append(top[0])
+        return result_rows, result_scores
+
+    # ------------------------------------------------------------------
+    # 元数据过滤（支持 Chroma where 子句的常用子集）
+    # ------------------------------------------------------------------
+    def _candidate_rows(self, where: Optional[Dict[str, Any]]) -> np.ndarray:
+        rows = np.flatnonzero(self._alive[:len(self._ids)]) if where is None else self._match(where)
+        return rows[self._alive[rows]]
+
+    def _match(self, where: Dict[str, Any]) -> np.ndarray:
+        if "$and" in where:
+            result = None
+            for clause in where["$and"]:
+                rows = self._match(clause)
+                result = rows if result is None else np.intersect1d(result, rows, assume_unique=True)
+            return result
+        if "$or" in where:
+            return np.unique(np.concatenate([self._match(clause) for clause in where["$or"]]))
+        if len(where) != 1:
+            return self._match({"$and": [{key: value} for key, value in where.items()]})
+
+        key, condition = next(iter(where.items()))
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        op, value = next(iter(condition.items()))
+        if op == "$eq":
+            return np.unique(np.asarray(self._postings.get((key, value), []), dtype=np.int64))
+        if op == "$in":
+            rows = [self._postings.get((key, v), []) for v in value]
+            return np.unique(np.asarray([row for part in rows for row in part], dtype=np.int64))
+        return self._scan(key, op, value)
+
+    def _scan(self, key: str, op: str, value: Any) -> np.ndarray:
+        """倒排表不支持的比较运算，逐行判断"""
+        compare = {
+            "$ne": lambda v: v != value,
+            "$nin": lambda v: v not in value,
+            "$gt": lambda v: v is not None and v > value,
+            "$gte": lambda v: v is not None and v >= value,
+            "$lt": lambda v: v is not None and v < value,
+            "$lte": lambda v: v is not None and v <= value,
+        }.get(op)
+        if compare is None:
+            raise ValueError(f"不支持的过滤条件: {op}")
+        return np.asarray([row for row, metadata in enumerate(self._metadatas)
+                           if self._alive[row] and compare(metadata.get(key))], dtype=np.int64)
+
+
+def create_vector_backend(backend: str, collection_name: str, persist_directory: str,
+                          client=None, quantization: str = "none", rerank_factor: int = 4) -> VectorBackend:
+    """
+    根据配置创建向量存储后端
+
+    Args:
+        backend: chroma 或 numpy
+        collection_name: 集合名称
+        persist_directory: 本地持久化目录
+        client: chromadb 的 HttpClient，使用独立 Chroma 服务时传入
+        quantization: numpy 后端在内存中保存向量的方式，none 或 int8
+        rerank_factor: int8 量化时粗排候选数量是 k 的倍数
+    """
+    if backend == "chroma":
+        return ChromaBackend(collection_name, persist_directory, client)
+    if backend == "numpy":
+        return NumpyBackend(os.path.join(persist_directory, "numpy", collection_name),
+                            quantization, rerank_factor)
+    raise ValueError(f"不支持的向量存储后端: {backend}")
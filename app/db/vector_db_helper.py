@@ -8,28 +8,79 @@
 版本号: 1.0
 变更说明: 无
 """
+import fcntl
+import os
+import time
+import uuid
+from contextlib import contextmanager
 from functools import lru_cache
 from langchain.schema import Document
-from typing import List, Dict, Any
-from langchain_community.vectorstores import Chroma
-from chromadb import Client
-from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+from typing import List, Dict, Any, Optional, Tuple
+import chromadb
+from app.core.config import settings
+from app.db.vector_backends import VectorBackend, SearchHit, create_vector_backend
+from app.llm.embedding_loader import get_embeddings
+from app.utils.metrics import VECTOR_SEARCH_SECONDS
 
 
 class ChromaLangChainManager:
-    def __init__(self, persist_directory: str = "./data/smart_note_vector_db"):
+    def __init__(self, persist_directory: str = None):
         """
-        初始化ChromaDB管理器（使用LangChain）
+        初始化向量数据库管理器
+
+        负责向量化和监控，存储和检索交给 VECTOR_BACKEND 指定的后端（chroma 或 numpy）。
+        配置了 CHROMA_SERVER_HOST 时连接独立的 Chroma 服务，多个 worker 共享同一份数据；
+        否则使用本地持久化目录。本地 Chroma 只能在单个进程中使用（多 worker 部署时 gunicorn 启动检查），
+        NumPy 后端的写操作通过文件锁在多个进程之间串行执行。
 
         Args:
             persist_directory: 数据持久化目录
         """
-        self.persist_directory = persist_directory
-        self.embedding_function = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
-        )
-        self.vectorstore = None
-        self.collection_name = "smart_note"
+        self.persist_directory = persist_directory or settings.CHROMA_PERSIST_DIRECTORY
+        self._embedding_function = None
+        self.backend: Optional[VectorBackend] = None
+        self.backend_name = settings.VECTOR_BACKEND
+        self.collection_name = settings.CHROMA_COLLECTION_NAME
+        self.client = None
+        if settings.CHROMA_SERVER_HOST and self.backend_name == "chroma":
+            self.client = chromadb.HttpClient(host=settings.CHROMA_SERVER_HOST,
+                                              port=settings.CHROMA_SERVER_PORT)
+
+    @property
+    def embedding_function(self):
+        """
+        向量化模型，第一次向量化时才加载
+
+        只写入已经向量化的数据的进程（批量回填的主进程）不需要加载模型。
+        """
+        if self._embedding_function is None:
+            self._embedding_function = get_embeddings()
+        return self._embedding_function
+
+    @contextmanager
+    def _writer_lock(self):
+        """
+        写操作的进程间互斥锁
+
+        只用于 NumPy 后端：多个 worker 追加写同一个目录，用文件锁保证同一时刻只有一个写入者，
+        其他进程在检索前读取新增的部分。Chroma（本地或服务）不需要加锁。
+        """
+        lock_directory = self._get_backend().lock_directory
+        if lock_directory is None:
+            yield
+            return
+        os.makedirs(lock_directory, exist_ok=True)
+        with open(os.path.join(lock_directory, ".writer.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _get_backend(self) -> VectorBackend:
+        if self.backend is None:
+            self.load_existing_collection()
+        return self.backend
 
     def create_collection(self, documents: List[Document]):
         """
@@ -37,57 +88,119 @@ class ChromaLangChainManager:
 
         Args:
             documents: Document对象列表
-            collection_name: 集合名称
 
         Returns:
-            Chroma向量存储对象
-        """
-        self.vectorstore = Chroma.from_documents(
-            documents=documents,
-            embedding=self.embedding_function,
-            persist_directory=self.persist_directory,
-            collection_name=self.collection_name
-        )
+            向量存储后端
+        """
+        self.add_documents(documents)
         print(f"集合 '{self.collection_name}' 创建成功，包含 {len(documents)} 个文档")
-        return self.vectorstore
+        return self.backend
 
     def load_existing_collection(self):
         """
-        加载已存在的集合
-
-        Args:
-            collection_name: 集合名称
+        加载已存在的集合（不存在时创建）
 
         Returns:
-            Chroma向量存储对象
+            向量存储后端
         """
-        self.vectorstore = Chroma(
-            persist_directory=self.persist_directory,
-            embedding_function=self.embedding_function,
-            collection_name=self.collection_name
-        )
-        print(f"集合 '{self.collection_name}' 加载成功")
-        return self.vectorstore
+        self.backend = create_vector_backend(
+            self.backend_name, self.collection_name, self.persist_directory, self.client,
+            settings.VECTOR_QUANTIZATION, settings.VECTOR_RERANK_FACTOR)
+        print(f"集合 '{self.collection_name}' 加载成功（{self.backend_name}）")
+        return self.backend
 
     def add_documents(self, documents: List[Document]):
         """
-        向现有集合添加文档
+        向现有集合添加文档（随机生成id）
+
+        Args:
+            documents: Document对象列表
+        """
+        self.upsert_documents([str(uuid.uuid4()) for _ in documents], documents)
+        print(f"添加了 {len(documents)} 个新文档，现在共有 {self.get_collection_info()} 个文档")
+
+    def upsert_documents(self, ids: List[str], documents: List[Document]):
+        """
+        按 id 新增或覆盖文档
 
         Args:
+            ids: 文档的稳定id，与 documents 一一对应
             documents: Document对象列表
-            collection_name: 集合名称
         """
-        if self.vectorstore is None:
-            self.load_existing_collection(self.collection_name)
+        if not documents:
+            return
+        # 向量化在锁外完成，锁内只做写入
+        embeddings = self.embedding_function.embed_documents([doc.page_content for doc in documents])
+        self.upsert_embeddings(ids, embeddings, documents)
 
-        # 获取当前集合的文档数量
-        current_count = self.vectorstore._collection.count()
+    def upsert_embeddings(self, ids: List[str], embeddings: List[List[float]], documents: List[Document]):
+        """
+        写入已经向量化的文档（批量回填时向量化在其他进程中完成）
 
-        # 添加新文档
-        self.vectorstore.add_documents(documents)
+        Args:
+            ids: 文档的稳定id
+            embeddings: 与 documents 一一对应的向量
+            documents: Document对象列表
+        """
+        if not documents:
+            return
+        backend = self._get_backend()
+        with self._writer_lock():
+            backend.upsert(ids, embeddings, [doc.page_content for doc in documents],
+                           [doc.metadata for doc in documents])
 
-        new_count = self.vectorstore._collection.count()
-        print(f"添加了 {new_count - current_count} 个新文档，现在共有 {new_count} 个文档")
+    def delete_documents(self, ids: List[str]):
+        """
+        按 id 删除文档
+
+        Args:
+            ids: 要删除的文档id
+        """
+        if not ids:
+            return
+        backend = self._get_backend()
+        with self._writer_lock():
+            backend.delete(ids)
+
+    def get_metadatas(self, filter_dict: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """
+        获取满足条件的文档的元数据（不返回向量和正文）
+
+        Args:
+            filter_dict: 过滤条件
+
+        Returns:
+            文档id -> 元数据
+        """
+        return self._get_backend().get_metadatas(filter_dict)
+
+    def get_documents(self, filter_dict: Dict[str, Any]) -> Dict[str, Tuple[str, Dict[str, Any]]]:
+        """
+        获取满足条件的文档正文和元数据（不返回向量）
+
+        Args:
+            filter_dict: 过滤条件
+
+        Returns:
+            文档id -> (正文, 元数据)
+        """
+        return self._get_backend().get_documents(filter_dict)
+
+    def _search(self, query: str, k: int, filter_dict: Optional[Dict[str, Any]], op: str) -> List[SearchHit]:
+        """向量化查询文本并检索，记录检索耗时"""
+        if self.backend is None:
+            raise ValueError("请先创建或加载集合")
+
+        embedding = self.embedding_function.embed_query(query)
+        start_time = time.perf_counter()
+        hits = self.backend.query([embedding], k, filter_dict)[0]
+        VECTOR_SEARCH_SECONDS.observe(time.perf_counter() - start_time, op=op)
+        return hits
+
+    @staticmethod
+    def _to_document(hit: SearchHit) -> Document:
+        doc_id, text, metadata, _ = hit
+        return Document(page_content=text, metadata=metadata, id=doc_id)
 
     def similarity_search(self, query: str, k: int = 3, filter_dict: Dict[str, Any] = None):
         """
@@ -101,15 +214,8 @@ class ChromaLangChainManager:
         Returns:
             搜索结果列表
         """
-        if self.vectorstore is None:
-            raise ValueError("请先创建或加载集合")
-
-        results = self.vectorstore.similarity_search(
-            query=query,
-            k=k,
-            filter=filter_dict
-        )
-        return results
+        hits = self._search(query, k, filter_dict, "similarity_search")
+        return [self._to_document(hit) for hit in hits]
 
     def similarity_search_with_score(self, query: str, k: int = 3, filter_dict: Dict[str, Any] = None):
         """
@@ -121,26 +227,61 @@ class ChromaLangChainManager:
             filter_dict: 过滤条件
 
         Returns:
-            带分数的搜索结果
+            (Document, 余弦距离) 的列表，距离越小越相似
         """
-        if self.vectorstore is None:
-            raise ValueError("请先创建或加载集合")
+        hits = self._search(query, k, filter_dict, "similarity_search_with_score")
+        return [(self._to_document(hit), 1.0 - hit[3]) for hit in hits]
 
-        results = self.vectorstore.similarity_search_with_score(
-            query=query,
-            k=k,
-            filter=filter_dict
-        )
-        return results
+    def similarity_search_with_relevance_scores(self, query: str, k: int = 3,
+                                                filter_dict: Dict[str, Any] = None,
+                                                score_threshold: float = None):
+        """
+        带相关度分数的搜索，分数为余弦相似度，越大越相似
+
+        过滤条件下推到后端，只在满足条件的文档中检索。
+
+        Args:
+            query: 查询文本
+            k: 返回结果数量
+            filter_dict: 过滤条件，可以用 build_filter 生成
+            score_threshold: 相关度阈值，低于阈值的结果会被丢弃
+
+        Returns:
+            (Document, 相关度分数) 的列表
+        """
+        hits = self._search(query, k, filter_dict, "similarity_search_with_relevance_scores")
+        return [(self._to_document(hit), hit[3]) for hit in hits
+                if score_threshold is None or hit[3] >= score_threshold]
+
+    @staticmethod
+    def build_filter(**conditions) -> Optional[Dict[str, Any]]:
+        """
+        把多个等值条件转换成 Chroma 的 where 子句
+
+        Chroma 的 where 只允许一个顶层字段，多个条件需要用 $and 组合。
+
+        Args:
+            conditions: 字段名=值，值为 list/tuple 时表示 $in，值为 None 的条件会被忽略
+
+        Returns:
+            where 子句，没有条件时返回 None
+        """
+        clauses = [{key: {"$in": list(value)} if isinstance(value, (list, tuple)) else value}
+                   for key, value in conditions.items() if value is not None]
+        if not clauses:
+            return None
+        if len(clauses) == 1:
+            return clauses[0]
+        return {"$and": clauses}
 
     def get_collection_info(self):
         """
         获取集合信息
         """
-        if self.vectorstore is None:
+        if self.backend is None:
             raise ValueError("请先创建或加载集合")
 
-        count = self.vectorstore._collection.count()
+        count = self.backend.count()
         print(f"集合中共有 {count} 个文档")
         return count
 
@@ -148,10 +289,12 @@ class ChromaLangChainManager:
         """
         持久化数据到磁盘
         """
-        if self.vectorstore is None:
+        if self.backend is None:
             raise ValueError("请先创建或加载集合")
 
-        self.vectorstore.persist()
+        # Chroma 写入即持久化；NumPy 后端把已写入的文件刷到磁盘
+        with self._writer_lock():
+            self.backend.persist()
         print(f"数据已保存到 {self.persist_directory}")
 
 # @lru_cache
@@ -1,4 +1,5 @@
 import asyncio
+import time
 from typing import Optional, Dict, Any, AsyncGenerator
 import httpx
 import os
@@ -8,18 +9,38 @@ from openai import AsyncOpenAI
 from dotenv import load_dotenv
 
 from app.core.messages import ErrorMessages
+from app.services.usage_service import estimate_tokens, usage_service
+from app.utils.metrics import LLM_STREAMS_CANCELLED_TOTAL
 load_dotenv()
 
 
+def get_cached_tokens(usage) -> Optional[int]:
+    """
+    从接口返回的 usage 中取出命中提示词缓存的token数
+
+    DeepSeek 返回 prompt_cache_hit_tokens，OpenAI 返回 prompt_tokens_details.cached_tokens
+    """
+    if usage is None:
+        return None
+    cached = getattr(usage, "prompt_cache_hit_tokens", None)
+    if cached is None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None)
+    return cached
+
+
 class AIResponse(BaseModel):
     """AI响应的基础模型"""
     content: str
+    # 输出的token数，接口没有返回 usage 时为 None
+    completion_tokens: Optional[int] = None
 
 
 class AIService:
 
-    async def generate_response(self, system_prompt: str, user_prompt: str) -> AIResponse:
+    async def generate_response(self, system_prompt: str, user_prompt: str, stage: str = "default") -> AIResponse:
         """调用大模型API生成响应"""
+        start_time = time.perf_counter()
         try:
             # 初始化 OpenAI 客户端
             client = AsyncOpenAI(
@@ -36,8 +57,14 @@ class AIService:
                 stream=False
             )
             content = response.choices[0].message.content
+            usage = response.usage
+            usage_service.record(stage, time.perf_counter() - start_time,
+                                  completion_tokens=usage.completion_tokens if usage else None,
+                                  prompt_tokens=usage.prompt_tokens if usage else None,
+                                  cached_tokens=get_cached_tokens(usage))
             return AIResponse(
-                content=content
+                content=content,
+                completion_tokens=usage.completion_tokens if usage else None
             )
 
         except httpx.TimeoutException:
@@ -53,8 +80,18 @@ class AIService:
                 detail=f"{ErrorMessages.LLM_CALLING_ERROR}: {str(e)}"
             )
 
-    async def generate_stream_response(self, system_prompt: str, user_prompt: str) -> AsyncGenerator[str, None]:
-        """调用大模型API生成流式响应"""
+    async def generate_stream_response(self, system_prompt: str, user_prompt: str, stage: str = "default") -> AsyncGenerator[str, None]:
+        """
+        调用大模型API生成流式响应
+
+        迭代被取消或生成器被关闭时（客户端断开），立即关闭上游的 HTTP 响应，不再继续接收token。
+        """
+        start_time = time.perf_counter()
+        ttft = None
+        chunk_count = 0
+        usage = None
+        client = None
+        response = None
         try:
             client = AsyncOpenAI(
                 api_key=os.getenv("OPENAI_API_KEY"),
@@ -67,13 +104,30 @@ class AIService:
                     {"role": "user", "content": user_prompt},
                 ],
                 temperature=0.7,
-                stream=True
+                stream=True,
+                # 最后一个 chunk 返回 token 用量（该 chunk 的 choices 为空）
+                stream_options={"include_usage": True}
             )
             async for chunk in response:
-                if chunk.choices[0].delta.content:
+                if chunk.usage:
+                    usage = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if ttft is None:
+                        ttft = time.perf_counter() - start_time
+                    chunk_count += 1
                     yield chunk.choices[0].delta.content
                     await asyncio.sleep(0.02)  # 控制流的速度
+            usage_service.record(stage, time.perf_counter() - start_time, ttft=ttft,
+                                  completion_tokens=usage.completion_tokens if usage else chunk_count,
+                                  prompt_tokens=usage.prompt_tokens if usage else None,
+                                  cached_tokens=get_cached_tokens(usage))
 
+        except (asyncio.CancelledError, GeneratorExit):
+            # 输入和已经输出的token同样计费，拿不到 usage，输入按提示词估算，输出用 chunk 数近似
+            LLM_STREAMS_CANCELLED_TOTAL.inc(stage=stage)
+            usage_service.record(stage, time.perf_counter() - start_time, ttft=ttft, completion_tokens=chunk_count,
+                                 prompt_tokens=estimate_tokens(system_prompt) + estimate_tokens(user_prompt))
+            raise
         except httpx.TimeoutException:
             raise HTTPException(
                 status_code=504,
@@ -84,6 +138,12 @@ class AIService:
                 status_code=500,
                 detail=f"{ErrorMessages.LLM_CALLING_ERROR}: {str(e)}"
             )
+        finally:
+            # 关闭 HTTP 响应（没有读完时直接断开连接）和客户端的连接池
+            if response is not None:
+                await response.close()
+            if client is not None:
+                await client.close()
 
 
 # Global instance
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: callbacks.py
+功能: langchain 回调，记录大模型调用的监控指标
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+"""
+import asyncio
+from time import perf_counter
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from app.services.usage_service import estimate_tokens, usage_service
+from app.utils.metrics import LLM_STREAMS_CANCELLED_TOTAL
+
+# 调用时通过 config={"metadata": {LLM_STAGE_KEY: "..."}} 指定所属环节
+LLM_STAGE_KEY = "llm_stage"
+
+
+class LLMMetricsCallbackHandler(BaseCallbackHandler):
+    """
+    记录每次大模型调用的耗时、首token时间和token数
+
+    环节名从 metadata 的 llm_stage 中获取，取值是代码里固定的几个环节，标签数量有限。
+    """
+    # 在调用所在的线程/事件循环中直接执行，不放进线程池
+    run_inline = True
+
+    def __init__(self):
+        self._runs: Dict[UUID, Dict[str, Any]] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID,
+                            metadata: Optional[Dict[str, Any]] = None, **kwargs):
+        self._runs[run_id] = {
+            "stage": (metadata or {}).get(LLM_STAGE_KEY, "default"),
+            "start": perf_counter(),
+            "ttft": None,
+            "chunks": 0,
+            # 调用被取消时拿不到 usage，按提示词估算输入的token数
+            "prompt_tokens": sum(estimate_tokens(message.content) for batch in messages for message in batch
+                                 if isinstance(message.content, str)),
+        }
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs):
+        run = self._runs.get(run_id)
+        if run is None or not token:
+            return
+        if run["ttft"] is None:
+            run["ttft"] = perf_counter() - run["start"]
+        run["chunks"] += 1
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        usage = self._get_usage(response)
+        usage_service.record(
+            run["stage"],
+            perf_counter() - run["start"],
+            ttft=run["ttft"],
+            # 拿不到 usage 时用流式 chunk 数近似
+            completion_tokens=usage.get("output_tokens") or run["chunks"],
+            prompt_tokens=usage.get("input_tokens"),
+            cached_tokens=usage.get("cached_tokens"))
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        if isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+            # 客户端断开后取消（或关闭生成器）的流式调用，输入和已经输出的token同样计费，输出用 chunk 数近似
+            LLM_STREAMS_CANCELLED_TOTAL.inc(stage=run["stage"])
+            usage_service.record(run["stage"], perf_counter() - run["start"], ttft=run["ttft"],
+                                 completion_tokens=run["chunks"], prompt_tokens=run["prompt_tokens"])
+        else:
+            usage_service.record(run["stage"], perf_counter() - run["start"], ttft=run["ttft"])
+
+    @staticmethod
+    def _get_usage(response: LLMResult) -> Dict[str, Any]:
+        """从返回结果中取出 token 用量"""
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    return {**usage, "cached_tokens": (usage.get("input_token_details") or {}).get("cache_read")}
+        token_usage = (response.llm_output or {}).get("token_usage") or {}
+        return {
+            "input_tokens": token_usage.get("prompt_tokens"),
+            "output_tokens": token_usage.get("completion_tokens"),
+            # DeepSeek 返回 prompt_cache_hit_tokens，OpenAI 返回 prompt_tokens_details.cached_tokens
+            "cached_tokens": token_usage.get("prompt_cache_hit_tokens")
+            or (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens"),
+        }
+
+
+llm_metrics_callback = LLMMetricsCallbackHandler()
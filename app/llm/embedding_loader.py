@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: embedding_loader.py
+功能: 加载向量化模型（每个进程只加载一次）
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+"""
+import platform
+import time
+from functools import lru_cache
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from app.core.config import settings
+from app.utils.metrics import EMBEDDING_SECONDS
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+
+def default_onnx_file() -> str:
+    """
+    按 CPU 架构选择 int8 量化的 ONNX 模型文件
+
+    AVX512-VNNI 版本在不支持该指令集的 CPU 上无法运行或非常慢，所以默认只用 AVX2 / ARM64 版本
+    """
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "onnx/model_qint8_arm64.onnx"
+    return "onnx/model_quint8_avx2.onnx"
+
+
+class TimedEmbeddings(Embeddings):
+    """记录向量化耗时的 Embeddings 包装"""
+
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        start_time = time.perf_counter()
+        result = self.embeddings.embed_documents(texts)
+        EMBEDDING_SECONDS.observe(time.perf_counter() - start_time, op="documents")
+        return result
+
+    def embed_query(self, text: str) -> List[float]:
+        start_time = time.perf_counter()
+        result = self.embeddings.embed_query(text)
+        EMBEDDING_SECONDS.observe(time.perf_counter() - start_time, op="query")
+        return result
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    用 ONNX Runtime 在 CPU 上推理的向量化模型
+
+    只依赖 onnxruntime 和 tokenizers，不导入 PyTorch，加载更快、内存更少。
+    池化方式与原模型一致（按 attention mask 做 mean pooling，不归一化）。
+    """
+
+    def __init__(self, model_name: str, onnx_file: str, num_threads: int = 0,
+                 batch_size: int = 32, max_length: int = 128):
+        import onnxruntime
+        from huggingface_hub import hf_hub_download
+        from tokenizers import Tokenizer
+
+        self.batch_size = batch_size
+        self.tokenizer = Tokenizer.from_pretrained(model_name)
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        options = onnxruntime.SessionOptions()
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(
+            hf_hub_download(model_name, onnx_file), options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        import numpy as np
+
+        result = []
+        for start in range(0, len(texts), self.batch_size):
+            encodings = self.tokenizer.encode_batch(texts[start:start + self.batch_size])
+            input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+            attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self.input_names:
+                inputs["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+            token_embeddings = self.session.run(None, inputs)[0]
+            mask = attention_mask[:, :, None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            result.extend(pooled.tolist())
+        return result
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text])[0]
+
+
+class SentenceTransformerEmbeddings(Embeddings):
+    """直接调用 SentenceTransformer 的向量化模型，用于对模型做动态 int8 量化"""
+
+    def __init__(self, model, batch_size: int = 32):
+        self.model = model
+        self.batch_size = batch_size
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.model.encode(texts, batch_size=self.batch_size).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.model.encode([text])[0].tolist()
+
+
+def create_embeddings(backend: str = "torch", num_threads: int = 0) -> Embeddings:
+    """
+    创建向量化模型
+
+    Args:
+        backend: torch（PyTorch 原始模型）| torch_int8（Linear 层动态 int8 量化）| onnx（ONNX Runtime）
+        num_threads: 推理使用的线程数，0 表示使用库的默认值
+
+    Return:
+        Embeddings: 带耗时监控的向量化模型
+    """
+    if backend == "onnx":
+        return TimedEmbeddings(OnnxEmbeddings(
+            EMBEDDING_MODEL_NAME, settings.EMBEDDING_ONNX_FILE or default_onnx_file(), num_threads,
+            settings.EMBEDDING_BATCH_SIZE, settings.EMBEDDING_MAX_LENGTH))
+
+    if backend not in ("torch", "torch_int8"):
+        raise ValueError(f"不支持的向量化后端: {backend}")
+    # PyTorch 和 sentence-transformers 只在使用时导入，onnx 后端不需要
+    import torch
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+    if backend == "torch":
+        from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+        return TimedEmbeddings(HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME))
+
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(EMBEDDING_MODEL_NAME, device="cpu")
+    model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return TimedEmbeddings(SentenceTransformerEmbeddings(model, settings.EMBEDDING_BATCH_SIZE))
+
+
+@lru_cache
+def get_embeddings() -> Embeddings:
+    """
+    获取向量化模型（由 EMBEDDING_BACKEND 和 EMBEDDING_NUM_THREADS 决定推理方式）
+
+    第一次调用时加载，之后在进程内复用。gunicorn 以 preload 方式启动时由主进程提前加载，
+    fork 出来的 worker 通过写时复制共享模型权重，不会各自再加载一份。
+    """
+    return create_embeddings(settings.EMBEDDING_BACKEND, settings.EMBEDDING_NUM_THREADS)
@@ -8,17 +8,31 @@
 版本号: 1.0
 变更说明: 无
 """
-from typing import Annotated, List, Optional, Literal, TypedDict
+import asyncio
+from typing import Annotated, Dict, List, Optional, Literal, Tuple, Type, TypedDict
 from langchain_core.messages import HumanMessage
 from langchain_core.messages.ai import AIMessage
 from langgraph.graph import END, StateGraph
 from langgraph.graph.message import add_messages
 from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
-from langchain_core.documents import Document
+from langchain_core.runnables import Runnable
+from pydantic import BaseModel
 from app.llm.llm_loader import llm
+from app.llm.callbacks import LLM_STAGE_KEY
+from app.llm.intent_classifier import intent_classifier, rule_input_completeness, rule_yes_no
+from app.llm.speculative import speculative_plans
 from app.llm.prompts.check_input_completeness_prompt import CheckInputCompletenessPrompt
+from app.llm.prompts.check_yes_no_prompt import CheckYesNoPrompt
+from app.llm.prompts.adjust_plan_prompt import AdjustPlanPrompt
 from app.llm.prompts.gen_plan_prompt import GenPlanPrompt
+from app.models.study_plan import StudyPlanOutput, StudyPlanPatch
 from app.services.study_plan_service import study_plan_service
+from app.services.note_service import note_service
+from app.services.vector_index_service import vector_index_service
+from app.services.history_search_service import history_search_service
+from app.db.session import session_scope
+from app.core.config import settings
+from app.utils.metrics import PLAN_OUTPUT_TOTAL
 
 from app.core.dependencies import method_logger
 from app.utils.logger import get_logger
@@ -39,8 +53,10 @@ class State(TypedDict):
     learned_before: Optional[bool] = None
     # 是否要深入学习
     want_deep_learn: Optional[bool] = None
-    # 生成的学习计划
+    # 生成的学习计划（展示给用户的 markdown）
     learning_plan: Optional[str] = None
+    # 结构化输出模式下校验过的学习计划（StudyPlanOutput.model_dump()），保存时不再解析 markdown
+    plan_data: Optional[Dict] = None
     # 用户是否满意
     is_satisfied: Optional[bool] = None
     # 当前状态
@@ -48,64 +64,233 @@ class State(TypedDict):
     messages: Annotated[List, add_messages]  # 关键：使用 Annotated 和 add_messages
 
 
+# 图中用到的提示词模板，模块加载时只解析一次
+PROMPTS = {
+    "check_input": ChatPromptTemplate.from_template(CheckInputCompletenessPrompt.PROMPT),
+    "check_yes_no": ChatPromptTemplate.from_template(CheckYesNoPrompt.PROMPT),
+    "beginner": ChatPromptTemplate.from_template(GenPlanPrompt.PROMPT_WITHOUT_HISTORY),
+    "advanced": PromptTemplate(
+        input_variables=["history_study_plan", "subject"],
+        template=GenPlanPrompt.PROMPT_WITH_HISTORY
+    ),
+}
+# 结构化输出模式下生成学习计划的提示词，输出格式由 StudyPlanOutput 的 schema 约束
+STRUCTURED_PROMPTS = {
+    "beginner_structured": ChatPromptTemplate.from_template(GenPlanPrompt.STRUCTURED_PROMPT_WITHOUT_HISTORY),
+    "advanced_structured": PromptTemplate(
+        input_variables=["history_study_plan", "subject"],
+        template=GenPlanPrompt.STRUCTURED_PROMPT_WITH_HISTORY
+    ),
+}
+# 根据反馈增量调整计划的提示词，只输出 StudyPlanPatch
+PATCH_PROMPTS = {
+    "adjust_patch": PromptTemplate(
+        input_variables=["current_plan", "feedback"],
+        template=AdjustPlanPrompt.PROMPT
+    ),
+}
+# 每条链所属的环节，用于大模型调用的监控指标
+CHAIN_STAGES = {"check_input": "check_input", "check_yes_no": "check_yes_no",
+                "beginner": "gen_plan", "advanced": "gen_plan",
+                "beginner_structured": "gen_plan", "advanced_structured": "gen_plan",
+                "adjust_patch": "adjust_patch"}
+
+
+def build_chains(model, plan_output_mode: str = settings.PLAN_OUTPUT_MODE) -> Dict[str, Runnable]:
+    """
+    构建 prompt | llm 链，节点直接复用，不在每次调用时重新解析模板和组装链
+
+    Args:
+        model: 大模型实例（测试时可以传入桩模型）
+        plan_output_mode: 生成学习计划的输出方式，不是 markdown 时额外构建结构化输出的链
+
+    Return:
+        dict: check_input / check_yes_no / beginner / advanced（/ beginner_structured / advanced_structured / adjust_patch）-> 可复用的链
+    """
+    result = {name: (prompt | model).with_config(metadata={LLM_STAGE_KEY: CHAIN_STAGES[name]})
+              for name, prompt in PROMPTS.items()}
+    if plan_output_mode != "markdown":
+        # function_calling / json_schema：模型按 StudyPlanOutput 的 schema 输出，解析器直接返回校验过的对象
+        structured_model = model.with_structured_output(StudyPlanOutput, method=plan_output_mode)
+        for name, prompt in STRUCTURED_PROMPTS.items():
+            result[name] = (prompt | structured_model).with_config(metadata={LLM_STAGE_KEY: CHAIN_STAGES[name]})
+        patch_model = model.with_structured_output(StudyPlanPatch, method=plan_output_mode)
+        for name, prompt in PATCH_PROMPTS.items():
+            result[name] = (prompt | patch_model).with_config(metadata={LLM_STAGE_KEY: CHAIN_STAGES[name]})
+    return result
+
+
+chains = build_chains(llm)
+
+
+def warm_up_chains():
+    """启动时用示例输入格式化一次全部模板，提前完成第一次调用时的初始化"""
+    # 需要包含所有模板用到的变量（PATCH_PROMPTS 用到 current_plan / feedback，check_yes_no 用到 question）
+    sample = {"input": "warm up", "subject": "warm up", "history_study_plan": "warm up",
+              "current_plan": "warm up", "feedback": "warm up", "question": "warm up"}
+    for name, prompt in {**PROMPTS, **STRUCTURED_PROMPTS, **PATCH_PROMPTS}.items():
+        prompt.invoke({key: sample[key] for key in prompt.input_variables})
+        if name in chains:
+            chains[name].get_input_schema()
+
+
 @method_logger
 def check_input_info(subject: str) -> bool:
     """
     检查用户输入的信息是否完整。
     """
     logger.info("检查用户输入的信息是否完整")
-    prompt = ChatPromptTemplate.from_template(
-        CheckInputCompletenessPrompt.PROMPT)
-    chains = prompt | llm
-    response = chains.invoke(input=subject)
+    response = chains["check_input"].invoke(subject)
     return response.content
 
+
+@method_logger
+def check_yes_no(question: str, answer: str) -> bool:
+    """
+    规则无法判断时，由大模型判断用户对问题的回答是不是肯定的
+
+    Args:
+        question: 助手提出的问题
+        answer: 用户的回答
+    """
+    response = chains["check_yes_no"].invoke({"question": question, "input": answer})
+    return response.content.strip() == "是"
+
 # RAG检索函数
 
 
 @method_logger
-def retrieve_learning_history(subject: str, vectorstore) -> str:
+def retrieve_learning_history(subject: str, vectorstore, user_id: int) -> str:
     """
     检查用户是否曾经学习过该主题。如果学习过该主题，则返回学习过的内容。
+
+    只在当前用户的计划概要和每天主题的切块中检索，关键词命中可靠时不再做向量检索。
     """
     logger.info("检查用户是否曾经学习过该主题")
-    docs = vectorstore.similarity_search_with_score(subject, k=3)
-    contexts = [doc[0].page_content for doc in docs if doc[1] > 7]
+    contexts = history_search_service.search(vectorstore, subject, user_id, k=settings.HISTORY_SEARCH_K)
     return "\n".join(contexts)
 
 
+def generate_structured_plan(chain: Runnable, input: Dict,
+                             schema: Type[BaseModel] = StudyPlanOutput) -> Optional[BaseModel]:
+    """
+    以结构化输出方式生成学习计划
+
+    流式读取解析器的输出，每个 chunk 都是到目前为止已经校验通过的对象，最后一个就是完整的计划。
+
+    Args:
+        chain: 结构化输出的链
+        input: 提示词的输入
+        schema: 输出的结构（StudyPlanOutput 或 StudyPlanPatch）
+
+    Return:
+        BaseModel|None: 校验通过的对象，模型没有按 schema 输出时返回 None
+    """
+    plan = None
+    for chunk in chain.stream(input):
+        if chunk is not None:
+            plan = chunk
+    if plan is None:
+        return None
+    try:
+        return schema.model_validate(plan)
+    except ValueError:
+        logger.warning("结构化输出的学习计划校验失败")
+        return None
+
+
 # 生成学习计划函数
 @method_logger
-def generate_learning_plan(subject: str, history_study_plan: str, level: Literal["beginner", "advanced"]) -> str:
-    """生成学习计划"""
+def generate_learning_plan(subject: str, history_study_plan: str, level: Literal["beginner", "advanced"],
+                           stage: str = "gen_plan") -> Tuple[str, Optional[Dict]]:
+    """
+    生成学习计划
+
+    Args:
+        subject: 学习主题（调整计划时包含用户的反馈）
+        history_study_plan: 检索到的学习历史
+        level: beginner | advanced
+        stage: 监控指标中的环节名，整体重新调整计划时为 adjust_plan
+
+    Return:
+        tuple: (展示给用户的 markdown, 结构化的学习计划)。markdown 模式下结构化计划为 None，保存时再解析 markdown
+    """
+    config = {"metadata": {LLM_STAGE_KEY: stage}}
     logger.info(f"生成学习计划, 计划主题:{subject}, 当前水平: {level}")
     input = {"subject": subject}
-    if level == "beginner":
-        prompt_template = ChatPromptTemplate.from_template(
-            GenPlanPrompt.PROMPT_WITHOUT_HISTORY)
-    else:
-        prompt_template = PromptTemplate(
-            input_variables=["history_study_plan", "subject"],
-            template=GenPlanPrompt.PROMPT_WITH_HISTORY
-        )
+    if level == "advanced":
         input["history_study_plan"] = history_study_plan
-    chains = prompt_template | llm
-    response = chains.invoke(input=input)
-    return response.content
+    structured_chain = chains.get(f"{level}_structured")
+    if structured_chain is not None:
+        plan = generate_structured_plan(structured_chain.with_config(config), input)
+        if plan is not None:
+            PLAN_OUTPUT_TOTAL.inc(mode=settings.PLAN_OUTPUT_MODE, result="ok")
+            return plan.to_markdown(), plan.model_dump()
+        # 很少发生，退回 markdown 方式，不让用户看到错误
+        PLAN_OUTPUT_TOTAL.inc(mode=settings.PLAN_OUTPUT_MODE, result="invalid")
+    response = chains[level].invoke(input, config=config)
+    PLAN_OUTPUT_TOTAL.inc(mode="markdown", result="ok")
+    return response.content, None
+
+
+@method_logger
+def adjust_learning_plan(plan: StudyPlanOutput, feedback: str) -> Optional[Tuple[StudyPlanOutput, List[int]]]:
+    """
+    增量调整学习计划：只让大模型输出有变化的部分，在本地合并
+
+    Args:
+        plan: 当前的学习计划
+        feedback: 用户的修改意见
+
+    Return:
+        tuple|None: (调整后的计划, 有变化的天)。没有结构化输出的链、大模型没有按 schema 输出，
+        或合并后的天数不连续时返回 None（调用方重新生成完整的计划）
+    """
+    chain = chains.get("adjust_patch")
+    if chain is None:
+        return None
+    patch = generate_structured_plan(
+        chain, {"current_plan": plan.model_dump_json(), "feedback": feedback}, StudyPlanPatch)
+    if patch is None:
+        PLAN_OUTPUT_TOTAL.inc(mode="patch", result="invalid")
+        return None
+    adjusted = patch.apply(plan)
+    if adjusted is None:
+        logger.warning(f"增量调整后的天数不连续，重新生成完整的计划: total_days={patch.total_days}")
+        PLAN_OUTPUT_TOTAL.inc(mode="patch", result="incomplete")
+        return None
+    PLAN_OUTPUT_TOTAL.inc(mode="patch", result="ok")
+    return adjusted, sorted({day_plan.day for day_plan in patch.changed_days if day_plan.day <= adjusted.total_days})
 
 # 定义各个节点
 
 
 @method_logger
-def check_input_completeness_node(state: State) -> State:
+async def check_input_completeness_node(state: State, config) -> State:
     """查用户输入的信息是否完整节点"""
     logger.info("检查户输入的信息是否完整节点")
-
-    result = check_input_info(state["messages"][-1])
-    is_completeness = False
-    if result == "是":
-        is_completeness = True
+    text = state["messages"][-1].content
+
+    # 检索学习历史不依赖完整性的判断结果，和判断同时进行；规则已经判定不完整时不检索
+    retrieval = None
+    if settings.PLAN_PREFETCH_HISTORY and rule_input_completeness(text) is not False:
+        retrieval = asyncio.create_task(asyncio.to_thread(
+            retrieve_learning_history, state["subject"],
+            config["configurable"].get("chroma"), config["configurable"].get("user_id")))
+
+    # 规则能判断时不调用大模型
+    try:
+        is_completeness = await asyncio.to_thread(
+            intent_classifier.classify, "input_completeness", text, rule_input_completeness,
+            lambda text: check_input_info(text).strip() == "是")
+    except BaseException:
+        if retrieval is not None:
+            retrieval.cancel()
+        raise
     if not is_completeness:
+        # 输入不完整，丢弃提前检索的结果
+        if retrieval is not None:
+            retrieval.cancel()
         return {
             "status": "checking_input_completeness",
             "input_completeness": False,
@@ -114,6 +299,10 @@ def check_input_completeness_node(state: State) -> State:
                     content=f"您输入的信息较少，请输入更多的信息。如目标和当前的水平。例如：我想要学习python，我没有任何基础，通过学习能够完成简单的编程")
             ]
         }
+    if retrieval is not None:
+        result = await retrieval
+        return {"input_completeness": True, "learned_before": bool(result),
+                "status": "retrieved", "history_plan": result}
     return {
         "input_completeness": True,
         "status": "retrieve"
@@ -124,8 +313,9 @@ def check_input_completeness_node(state: State) -> State:
 def retrieve_node(state: State, config) -> State:
     """检索学习历史节点"""
     logger.info("检索学习历史节点")
-    vector_store = config["configurable"].get("vector_store")
-    result = retrieve_learning_history(state["subject"], vector_store)
+    chroma = config["configurable"].get("chroma")
+    user_id = config["configurable"].get("user_id")
+    result = retrieve_learning_history(state["subject"], chroma, user_id)
     has_learned = False
     if result:
         has_learned = True
@@ -133,11 +323,16 @@ def retrieve_node(state: State, config) -> State:
 
 
 @method_logger
-def ask_deep_learn_node(state: State) -> State:
+async def ask_deep_learn_node(state: State, config) -> State:
     """询问是否深入学习节点"""
     logger.info("询问是否深入学习节点")
     logger.info(f"之前是否学习过:{state["learned_before"]}")
     if state["learned_before"]:
+        if settings.PLAN_SPECULATIVE_GENERATION:
+            # 等待用户回答期间先生成进阶计划，回答为深入学习时直接使用
+            speculative_plans.start(
+                config["configurable"]["thread_id"], ("advanced", state["subject"], state["history_plan"]),
+                generate_learning_plan, state["subject"], state["history_plan"], "advanced")
         return {
             "status": "asking_deep_learn",
             "messages": state["messages"] + [
@@ -155,8 +350,9 @@ def handle_deep_learn_response_node(state: State) -> State:
     logger.info("处理用户是否深入学习的响应节点:")
     last_message = state["messages"][-1]
     if isinstance(last_message, HumanMessage):
-        response = last_message.content.lower()
-        if "是" in response or "yes" in response or "想" in response:
+        # 规则没有把握时（例如同时有肯定和否定）交给大模型判断
+        if intent_classifier.classify("deep_learn", last_message.content, rule_yes_no,
+                                      lambda text: check_yes_no("您是否希望在此基础上进行深入学习？", text)):
             return {"want_deep_learn": True, "status": "generate_advanced_plan"}
         else:
             return {"want_deep_learn": False, "status": "generate_beginner_plan"}
@@ -164,7 +360,7 @@ def handle_deep_learn_response_node(state: State) -> State:
 
 
 @method_logger
-def generate_plan_node(state: State) -> State:
+async def generate_plan_node(state: State, config) -> State:
     """生成学习计划节点"""
     logger.info("生成学习计划节点")
     if state.get("want_deep_learn", False) or (state["learned_before"] and state.get("want_deep_learn", True)):
@@ -173,11 +369,17 @@ def generate_plan_node(state: State) -> State:
         level = "beginner"
 
     logger.info(f"正在生成{'进阶' if level == 'advanced' else '初级'}学习计划...")
-    plan = generate_learning_plan(
-        state["subject"], state['history_plan'], level)
+    # 推测生成的计划条件一致时直接使用，否则丢弃后正常生成
+    result = await speculative_plans.take(
+        config["configurable"]["thread_id"], (level, state["subject"], state["history_plan"]))
+    if result is None:
+        result = await asyncio.to_thread(
+            generate_learning_plan, state["subject"], state['history_plan'], level)
+    plan, plan_data = result
 
     return {
         "learning_plan": plan,
+        "plan_data": plan_data,
         "status": "presenting_plan",
         "messages": state["messages"] + [
             AIMessage(content=f"为您生成了一份{level}学习计划：\n\n{plan}\n\n您对这个计划满意吗？")
@@ -191,8 +393,9 @@ def handle_feedback_node(state: State) -> State:
     logger.info("处理用户反馈节点")
     last_message = state["messages"][-1]
     if isinstance(last_message, HumanMessage):
-        response = last_message.content.lower()
-        if "是" in response or "满意" in response or "yes" in response:
+        # 规则没有把握时交给大模型判断，不满意的回复交给调整计划节点
+        if intent_classifier.classify("feedback", last_message.content, rule_yes_no,
+                                      lambda text: check_yes_no("您对这个计划满意吗？", text)):
             return {"is_satisfied": True, "status": "save_plan"}
         else:
             return {"is_satisfied": False, "status": "adjust_plan"}
@@ -203,12 +406,16 @@ def handle_feedback_node(state: State) -> State:
 async def save_plan_node(state: State, config) -> State:
     """保存学习计划节点"""
     logger.info("保存学习计划节点")
-    # 这里应该是实际保存到数据库的逻辑
-    db_session = config["configurable"].get("db_session")
-    plan = await study_plan_service.create_study_plan_from_ai_response(db_session, state["learning_plan"])
+    # 只在保存时短暂占用数据库连接
+    user_id = config["configurable"].get("user_id")
+    async with session_scope() as db_session:
+        plan = await study_plan_service.create_study_plan_from_ai_response(
+            db_session, state.get("plan_data") or state["learning_plan"], user_id)
+        await db_session.flush()
+        notes = await note_service.get_study_plan_notes(db_session, plan.id)
+    # 按概要和每天的主题切块索引，向量化在线程池中执行
     chroma_db = config["configurable"].get("chroma")
-    chroma_db.add_documents([Document(page_content=plan.content)])
-    chroma_db.persist()
+    await asyncio.to_thread(vector_index_service.index_plan, chroma_db, plan, notes)
     return {
         "status": "end",
         "messages": state["messages"] + [
@@ -217,6 +424,32 @@ async def save_plan_node(state: State, config) -> State:
     }
 
 
+def adjust_plan_by_patch(state: State, feedback: str) -> Optional[State]:
+    """增量调整当前的计划，只展示有变化的天；无法增量调整时返回 None，由调用方整体重新生成"""
+    try:
+        plan = study_plan_service.parse_ai_response(state.get("plan_data") or state["learning_plan"])
+    except Exception as e:
+        logger.warning(f"当前计划无法解析，整体重新生成: {e}")
+        return None
+    result = adjust_learning_plan(plan, feedback)
+    if result is None:
+        return None
+    adjusted, changed_days = result
+    changes = adjusted.to_markdown(days=changed_days)
+    if changed_days:
+        summary = f"根据您的反馈，已调整第{'、'.join(map(str, changed_days))}天的安排"
+    else:
+        summary = "根据您的反馈，已调整学习计划"
+    return {
+        "learning_plan": adjusted.to_markdown(),
+        "plan_data": adjusted.model_dump(),
+        "status": "presenting_plan",
+        "messages": state["messages"] + [
+            AIMessage(content=f"{summary}：\n\n{changes}\n\n您对这个调整后的计划满意吗？")
+        ]
+    }
+
+
 @method_logger
 def adjust_plan_node(state: State) -> State:
     """调整学习计划节点"""
@@ -224,17 +457,22 @@ def adjust_plan_node(state: State) -> State:
     last_message = state["messages"][-1]
     if isinstance(last_message, HumanMessage):
         feedback = last_message.content
+        if settings.PLAN_ADJUST_MODE == "patch":
+            result = adjust_plan_by_patch(state, feedback)
+            if result is not None:
+                return result
         # 基于用户反馈重新生成计划
         # 确定当前级别
         level = "advanced" if state.get(
             "want_deep_learn", False) else "beginner"
 
         # 生成调整后的计划
-        adjusted_plan = generate_learning_plan(
-            f"{state['subject']}，根据反馈调整: {feedback}", state["history_plan"], level)
+        adjusted_plan, plan_data = generate_learning_plan(
+            f"{state['subject']}，根据反馈调整: {feedback}", state["history_plan"], level, stage="adjust_plan")
 
         return {
             "learning_plan": adjusted_plan,
+            "plan_data": plan_data,
             "status": "presenting_plan",
             "messages": state["messages"] + [
                 AIMessage(
@@ -260,12 +498,14 @@ builder.add_node("adjust_plan", adjust_plan_node)
 # 动态入口点函数
 
 
+# 每轮对话在等待用户回复的节点之后结束（路由到 END），下一轮根据保存的状态
+# 直接进入处理这条回复的节点，已经完成的节点不会重复执行
 @method_logger
 def get_entry_point(state: State) -> str:
     """根据状态动态决定入口点"""
     status = state.get("status")
     logger.info(f"当前状态:{status}")
-    if status or not status or status == "checking_input_completeness":
+    if not status or status == "checking_input_completeness":
         return "check_input_completeness"
     if status == "retrieve":
         return "retrieve"
@@ -290,7 +530,10 @@ builder.add_conditional_edges(
     lambda state: state["status"],
     {
         "retrieve": "retrieve",
-        "checking_input_completeness": "check_input_completeness"
+        # 已经和完整性判断同时完成了检索
+        "retrieved": "ask_deep_learn",
+        # 等待用户补充信息
+        "checking_input_completeness": END
     }
 )
 builder.add_edge("retrieve", "ask_deep_learn")
@@ -298,12 +541,14 @@ builder.add_conditional_edges(
     "ask_deep_learn",
     lambda state: state["status"],
     {
-        "asking_deep_learn": "handle_deep_learn_response",
+        # 等待用户回答是否深入学习
+        "asking_deep_learn": END,
         "generate_beginner_plan": "generate_plan"
     }
 )
 builder.add_edge("handle_deep_learn_response", "generate_plan")
-builder.add_edge("generate_plan", "handle_feedback")
+# 展示计划后等待用户反馈
+builder.add_edge("generate_plan", END)
 builder.add_conditional_edges(
     "handle_feedback",
     lambda state: state["status"],
@@ -313,4 +558,4 @@ builder.add_conditional_edges(
     }
 )
 builder.add_edge("save_plan", END)
-builder.add_edge("adjust_plan", "handle_feedback")
+builder.add_edge("adjust_plan", END)
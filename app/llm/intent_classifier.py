@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: intent_classifier.py
+功能: 基于规则的快速分类（输入是否完整、是/否回答），把握不大时交给大模型
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+
+规则分类在微秒级完成。每次分类按 task 和 path（rule / llm / default）计数，
+规则命中时按大模型分类的平均耗时累计节省的时间。
+"""
+import re
+import time
+from typing import Callable, Optional
+
+from app.utils.metrics import CLASSIFIER_DECISIONS_TOTAL, CLASSIFIER_SECONDS, CLASSIFIER_SAVED_SECONDS
+
+# 学习目标：想达到什么。单独的"想"、"能"、"计划"几乎每句学习请求里都有，不算目标
+_GOAL_PATTERN = re.compile(
+    r"目标|目的|希望|想要|打算|为了|达到|能够|学会|掌握|通过|考试|考研|考证|面试|找工作|转行|工作中|项目|"
+    r"goal|want|hope|able to")
+# 当前水平：现在会什么。只认明确描述水平的说法，"想了解一下"、"python入门"这类不算
+_LEVEL_PATTERN = re.compile(
+    r"基础|零基础|没有基础|无基础|初学|新手|小白|刚开始|会一点|会一些|学过|接触过|了解过|了解一些|有所了解|"
+    r"没学过|从未|从来没|工作了|年经验|经验|beginner|basic|experience")
+
+# 否定的修改意见（"不用修改"、"不需要再调整了"）是满意的意思，判断之前先去掉
+_NEGATED_CHANGE_PATTERN = re.compile(r"(不用|不需要|没必要|无需|不必)再?(修改|改动|改|调整|变动)了?")
+# 提问（"是否可以再详细一点"）既不是肯定也不是否定，交给大模型
+_QUESTION_PATTERN = re.compile(r"是否|能否|可否|能不能|可不可以|[?？]")
+# 否定或修改意见；"否"只在开头时算否定
+_NO_PATTERN = re.compile(
+    r"不是|不要|不想|不用|不需要|不满意|不太|不行|不好|不对|不够|没必要|算了|^否|^no\b|\bnope\b|不了|换一|重新|调整|修改|"
+    r"太难|太简单|太多|太少|增加|减少|改")
+# 肯定：单独的短回答整句匹配，"是"、"想"、"希望"、"满意"等在去掉否定的部分之后任意位置出现即可
+_YES_PATTERN = re.compile(
+    r"^(对|对的|好|好的|好啊|行|可以|嗯|嗯嗯|要|没意见|确定|ok|okay|yep|sure)[,，!！。.~～\s]*$|"
+    r"是|想|希望|满意|可以的|没问题|就这样|就按这个|挺好|很好|深入|yes")
+
+
+def rule_input_completeness(text: str) -> Optional[bool]:
+    """
+    规则判断输入是否完整（包含学习目标和当前水平）
+
+    Return:
+        True/False 表示有把握的结论，None 表示没有把握
+    """
+    text = (text or "").strip().lower()
+    has_goal = bool(_GOAL_PATTERN.search(text))
+    has_level = bool(_LEVEL_PATTERN.search(text))
+    if has_goal and has_level:
+        return True
+    # 很短且既没有目标也没有水平描述，例如"学习python"
+    if not has_goal and not has_level and len(text) <= 12:
+        return False
+    return None
+
+
+def rule_yes_no(text: str) -> Optional[bool]:
+    """
+    规则判断是/否回答
+
+    否定词覆盖的部分（"不是"、"不满意"）不再参与肯定的判断；同时有肯定和否定（"想把第三天改一下"）时没有把握
+
+    Return:
+        True 表示肯定，False 表示否定或提出修改意见，None 表示无法判断
+    """
+    text = _NEGATED_CHANGE_PATTERN.sub(" ", (text or "").strip().lower())
+    if _QUESTION_PATTERN.search(text):
+        return None
+    has_no = bool(_NO_PATTERN.search(text))
+    has_yes = bool(_YES_PATTERN.search(_NO_PATTERN.sub(" ", text).strip()))
+    if has_no and has_yes:
+        return None
+    if has_no:
+        return False
+    if has_yes:
+        return True
+    return None
+
+
+class IntentClassifier:
+    """规则优先、大模型兜底的分类器"""
+
+    def __init__(self):
+        # 各任务大模型分类耗时的滑动平均，用来估算规则命中节省的时间
+        self._llm_seconds = {}
+
+    def classify(self, task: str, text: str, rule: Callable[[str], Optional[bool]],
+                 fallback: Optional[Callable[[str], bool]] = None, default: bool = False) -> bool:
+        """
+        分类
+
+        Args:
+            task: 任务名（监控指标的标签）
+            text: 用户输入
+            rule: 规则分类函数，没有把握时返回 None
+            fallback: 规则没有把握时调用的大模型分类函数，为 None 时返回 default
+            default: 没有大模型兜底时的默认结论
+
+        Return:
+            bool: 分类结果
+        """
+        start_time = time.perf_counter()
+        result = rule(text)
+        if result is not None:
+            path = "rule"
+            if task in self._llm_seconds:
+                CLASSIFIER_SAVED_SECONDS.inc(self._llm_seconds[task], task=task)
+        elif fallback is not None:
+            path = "llm"
+            result = fallback(text)
+            elapsed = time.perf_counter() - start_time
+            previous = self._llm_seconds.get(task)
+            self._llm_seconds[task] = elapsed if previous is None else 0.9 * previous + 0.1 * elapsed
+        else:
+            path, result = "default", default
+        CLASSIFIER_SECONDS.observe(time.perf_counter() - start_time, task=task, path=path)
+        CLASSIFIER_DECISIONS_TOTAL.inc(task=task, path=path)
+        return result
+
+
+intent_classifier = IntentClassifier()
@@ -1,6 +1,7 @@
 import os
 from langchain_openai import ChatOpenAI
 from dotenv import load_dotenv
+from app.llm.callbacks import llm_metrics_callback
 load_dotenv()
 
 # 确保 OpenAI API 密钥正确读取
@@ -14,5 +15,8 @@ llm = ChatOpenAI(
     base_url=os.getenv("OPENAI_API_URL"),
     model="deepseek-chat",
     temperature=0.7,
-    streaming=True
+    streaming=True,
+    # 流式输出时在最后一个 chunk 中返回 token 用量
+    stream_usage=True,
+    callbacks=[llm_metrics_callback]
 )
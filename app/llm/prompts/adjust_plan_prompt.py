@@ -0,0 +1,15 @@
+class AdjustPlanPrompt:
+    """根据用户反馈增量调整学习计划的提示词"""
+
+    PROMPT = """你是一个专业的教育顾问，用户对下面的学习计划提出了修改意见，请根据修改意见调整学习计划，只输出需要修改的部分。
+            当前的学习计划（JSON）：
+                {current_plan}
+            用户的修改意见：
+                {feedback}
+            输出要求：
+            1. 我是一个中文用户，所有字段都用中文填写。
+            2. 标题、天数、目标、描述没有变化时不要填写。
+            3. changed_days 中只包含内容有变化或新增的天，没有变化的天不要输出。
+            4. 如果修改了计划天数，填写新的 total_days，超出新天数的天会被删除，新增的天必须输出。
+            5. 按照给定的 JSON 结构输出，不要输出其他内容。
+        """
@@ -1,13 +1,13 @@
 class GenNoteDetailPrompt:
-    """生成笔记的详细内容的提示词"""
+    """
+    生成笔记的详细内容的提示词
+
+    system 提示词只包含固定的说明和学习计划的总体目标，同一个学习计划的每条笔记完全相同，
+    可以命中大模型服务端的提示词缓存（按前缀匹配）；每天变化的内容都放在 user 提示词中。
+    """
 
     SYS_PROMPT = """作为一个专业的教育顾问，为了能够达到学习计划的总体目标，请为今天要学习的知识点生成详细的学习指南。
                     同时请根据之前学习过的内容，在本内容开始之前，对之前学习过的内容展开简要的复习。
-                    学习计划总体目标：
-                    {study_plan_content}
-
-                    之前已学习的内容：
-                    {previous_content}
 
                     请按照以下结构提供详细的学习内容：
 
@@ -41,9 +41,15 @@ class GenNoteDetailPrompt:
                     - 补充阅读建议
 
                     请确保内容具体、实用，并且易于理解和操作。重点关注知识的实际应用和与之前学习内容的联系。
+
+                    学习计划总体目标：
+                    {study_plan_content}
              """
 
     USER_PROMPT = """
+                之前已学习的内容：
+                   {previous_content}
+
                 今天将要学习的知识点如下：
                    {topics}
 
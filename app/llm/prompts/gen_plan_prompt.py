@@ -62,3 +62,38 @@ class GenPlanPrompt:
             3. 关键知识点3
             4. ......
         """
+
+    # 结构化输出模式（JSON Schema / function calling）使用的提示词，输出格式由 StudyPlanOutput 的 schema 约束
+    STRUCTURED_PROMPT_WITHOUT_HISTORY = """你是一个专业的教育顾问，请根据用户输入的内容，为用户制定一个的入门级别的学习计划。
+            请确保：
+            1. 知识点循序渐进，由浅入深
+            2. 每天的学习内容适量，考虑学习者的接受能力
+            3. 知识点之间有合理的联系
+            4. 每天的主题明确，知识点具体
+            5. 知识点应当可操作和可实践
+            输入内容：
+                主题：{subject}
+            输出要求：
+            1. 我是一个中文用户，所有字段都用中文填写。
+            2. 如果用户没有明确的提出计划的天数，请制定一份10天的学习计划。
+            3. 必须严格的输出每一天的安排，daily_plans 的数量与 total_days 一致。
+            4. 按照给定的 JSON 结构输出学习计划，不要输出其他内容。
+        """
+
+    STRUCTURED_PROMPT_WITH_HISTORY = """你是一个专业的教育顾问，请在根据用户以往的学习履历，推断出用户已经掌握的知识点。并为用户制定一个更深入的学习计划。
+            请确保：
+            1. 知识点循序渐进，由浅入深
+            2. 每天的学习内容适量，考虑学习者的接受能力
+            3. 知识点之间有合理的联系
+            4. 每天的主题明确，知识点具体
+            5. 知识点应当可操作和可实践
+            以往的学习履历：
+                {history_study_plan}
+            输入内容：
+                {subject}
+            输出要求：
+            1. 我是一个中文用户，所有字段都用中文填写。
+            2. 如果用户没有明确的提出计划的天数，请制定一份10天的学习计划。
+            3. 必须严格的输出每一天的安排，daily_plans 的数量与 total_days 一致。
+            4. 按照给定的 JSON 结构输出学习计划，不要输出其他内容。
+        """
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: speculative.py
+功能: 推测执行的学习计划生成任务
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+
+询问用户是否深入学习时，用户的回答还没有到达，先在后台按最可能的回答生成计划。
+回答到达后，如果需要的计划与推测的一致就直接使用后台任务的结果，否则丢弃。
+
+任务只保存在当前进程中，多 worker 部署时下一轮请求落到其他 worker 上只是不命中，按正常流程生成。
+每个任务创建时设置 TTL 定时器，用户放弃会话、没有后续请求时也会按时丢弃。
+"""
+import asyncio
+import time
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from app.core.config import settings
+from app.utils.logger import get_logger
+from app.utils.metrics import SPECULATIVE_PLAN_TOTAL
+
+logger = get_logger(__name__)
+
+
+class SpeculativeTasks:
+
+    def __init__(self, ttl: float):
+        """
+        Args:
+            ttl: 任务的保留时间（秒），超过后即使没有被取走也会被丢弃
+        """
+        self.ttl = ttl
+        # 会话id -> (推测的key, 任务, 创建时间, 过期定时器)
+        self._tasks: Dict[str, Tuple[Hashable, asyncio.Task, float, asyncio.TimerHandle]] = {}
+
+    def _discard(self, session_id: str, result: str):
+        _, task, _, timer = self._tasks.pop(session_id)
+        timer.cancel()
+        # 线程中的大模型调用不能中断，取消只是不再等待它的结果
+        task.cancel()
+        SPECULATIVE_PLAN_TOTAL.inc(result=result)
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        for session_id in [s for s, (_, _, created, _) in self._tasks.items() if now - created > self.ttl]:
+            self._discard(session_id, "expired")
+
+    def _expire(self, session_id: str, task: asyncio.Task):
+        """TTL 定时器的回调，会话的任务已经被替换或取走时不处理"""
+        entry = self._tasks.get(session_id)
+        if entry is not None and entry[1] is task:
+            self._discard(session_id, "expired")
+
+    def discard(self, session_id: str):
+        """丢弃会话的推测任务（会话已经不会再用到它，例如本轮没有停在询问是否深入学习）"""
+        if session_id in self._tasks:
+            self._discard(session_id, "discarded")
+
+    def start(self, session_id: str, key: Hashable, func, *args):
+        """
+        在线程池中启动一个推测任务，同一个会话之前的任务会被丢弃
+
+        Args:
+            session_id: 会话id
+            key: 推测的条件，取结果时必须一致才算命中
+            func: 同步函数（如 generate_learning_plan）
+            args: 函数参数
+        """
+        self._evict_expired()
+        if session_id in self._tasks:
+            self._discard(session_id, "miss")
+        task = asyncio.create_task(asyncio.to_thread(func, *args))
+        # 结果可能不会被取走，这里读取一次异常，避免 "exception was never retrieved" 警告
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        timer = asyncio.get_running_loop().call_later(self.ttl, self._expire, session_id, task)
+        self._tasks[session_id] = (key, task, time.monotonic(), timer)
+        logger.info("启动推测生成任务", session_id=session_id)
+
+    async def take(self, session_id: str, key: Hashable) -> Optional[Any]:
+        """
+        取出会话的推测任务结果
+
+        Args:
+            session_id: 会话id
+            key: 实际需要的条件
+
+        Return:
+            Any|None: 条件一致且没有过期时返回任务结果（还没完成时等待），否则丢弃任务并返回 None
+        """
+        self._evict_expired()
+        entry = self._tasks.get(session_id)
+        if entry is None:
+            return None
+        if entry[0] != key:
+            self._discard(session_id, "miss")
+            return None
+        _, task, _, timer = self._tasks.pop(session_id)
+        timer.cancel()
+        try:
+            result = await task
+        except Exception as e:
+            logger.warning(f"推测生成任务失败: {e}", session_id=session_id)
+            SPECULATIVE_PLAN_TOTAL.inc(result="error")
+            return None
+        SPECULATIVE_PLAN_TOTAL.inc(result="hit")
+        return result
+
+
+# Global instance，询问是否深入学习时在后台推测生成的计划
+speculative_plans = SpeculativeTasks(settings.PLAN_SPECULATIVE_TTL)
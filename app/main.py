@@ -1,22 +1,28 @@
-from fastapi import Depends, FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from contextlib import asynccontextmanager
+from contextlib import AsyncExitStack, asynccontextmanager
 from fastapi.exceptions import RequestValidationError
 from app.core.config import settings
 from app.core.dependencies import get_current_user
 from app.core.exceptions import http_exception_handler, validation_exception_handler
-from app.core.loggin_config import setup_logging
+from app.core.loggin_config import setup_logging, stop_logging
 from app.db.vector_db_helper import ChromaLangChainManager
 from app.middleware.logging_middleware import LoggingMiddleware
 from app.router import api_router
 from app.db.init_db import init_db
-from app.llm.graph import builder
+from app.db.graph_session_store import create_graph_session_store
+from app.llm.graph import builder, warm_up_chains
+from app.services.note_batch_service import note_batch_service
+from app.services.usage_service import usage_service
 from langgraph.checkpoint.memory import MemorySaver
 
 from app.utils.logger import get_logger
+from app.utils.metrics import registry, CONTENT_TYPE
 
 # 设置日志配置
-setup_logging(settings.log_path, settings.log_level)
+setup_logging(settings.log_path, settings.log_level,
+              settings.LOG_QUEUE_SIZE, settings.LOG_ASYNC)
 logger = get_logger('app')
 
 
@@ -25,25 +31,39 @@ async def lifespan(app: FastAPI):
     # 启动时执行
     await init_db()
     logger.info("Database Initialized")
-    # 定义全局变量 sessions
-    app.state.sessions = {}
-    logger.info("App started, sessions initialized")
+    # graph 会话状态存储，多 worker 部署时使用 postgres
+    app.state.sessions = create_graph_session_store(settings.SESSION_STORE)
+    logger.info(f"App started, sessions initialized: {settings.SESSION_STORE}")
 
     # 加载向量数据库
     logger.info("loading vector")
     chroma = ChromaLangChainManager()
     app.state.chroma = chroma
     app.state.vector_store = chroma.load_existing_collection()
+    # 恢复上次未完成的批量生成笔记任务
+    await note_batch_service.resume_jobs(chroma)
+    # 定期把大模型用量写入数据库
+    usage_service.start(settings.LLM_USAGE_FLUSH_INTERVAL)
 
-    # 启动graph
-    checkpointer = MemorySaver()
-    app.state.graph = builder.compile(checkpointer=checkpointer)
+    async with AsyncExitStack() as stack:
+        # 启动graph，多 worker 部署时检查点保存在共享的 sqlite 文件中
+        if settings.GRAPH_CHECKPOINTER == "sqlite":
+            from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+            checkpointer = await stack.enter_async_context(
+                AsyncSqliteSaver.from_conn_string(settings.GRAPH_CHECKPOINT_PATH))
+        else:
+            checkpointer = MemorySaver()
+        app.state.graph = builder.compile(checkpointer=checkpointer)
+        warm_up_chains()
 
-    logger.info("App started, graph initialized")
-    yield
+        logger.info("App started, graph initialized")
+        yield
 
     # 关闭时执行（可选）
     logger.info("Shutting down...")
+    await note_batch_service.shutdown()
+    await usage_service.stop()
+    stop_logging()
 
 
 app = FastAPI(
@@ -74,3 +94,12 @@ app.include_router(api_router, prefix=settings.API_V1_STR)
 @app.get("/")
 async def root():
     return {"message": "Welcome to Smart Note API"}
+
+
+async def metrics(request: Request):
+    """Prometheus 格式的监控指标"""
+    return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
+
+
+# 用 add_route 注册，不经过全局的 get_current_user 认证依赖，也不出现在 API 文档中
+app.add_route("/metrics", metrics, include_in_schema=False)
@@ -2,100 +2,108 @@
 import time
 import logging
 import uuid
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from app.utils.logger import request_id_var, user_id_var, get_logger
+from app.utils.metrics import HTTP_REQUEST_DURATION, SSE_STREAMS_IN_FLIGHT
 
-class LoggingMiddleware(BaseHTTPMiddleware):
-    """日志记录中间件"""
-    
-    def __init__(self, app, exclude_paths: list = None):
-        super().__init__(app)
-        self.exclude_paths = exclude_paths or ['/health', '/metrics']
+
+class LoggingMiddleware:
+    """
+    日志记录中间件（纯ASGI实现）
+
+    不再继承 BaseHTTPMiddleware：响应消息直接透传给下游的 send，
+    不会额外创建 task 和内存流，SSE 的每个 chunk 都会立即发送出去。
+    """
+
+    def __init__(self, app: ASGIApp, exclude_paths: list = None):
+        self.app = app
+        self.exclude_paths = tuple(exclude_paths or ['/health', '/metrics'])
         self.logger = get_logger('middleware')
         self.access_logger = logging.getLogger('uvicorn.access')
-    
-    async def dispatch(self, request: Request, call_next):
-        # 跳过健康检查等路径
-        if any(request.url.path.startswith(path) for path in self.exclude_paths):
-            return await call_next(request)
-        
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        # 只处理 http 请求，跳过 websocket/lifespan 以及健康检查等路径
+        if scope["type"] != "http" or scope["path"].startswith(self.exclude_paths):
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+
         # 生成请求ID
-        request_id = request.headers.get('X-Request-ID') or str(uuid.uuid4())
+        request_id = headers.get('x-request-id') or str(uuid.uuid4())
         request_id_var.set(request_id)
-        
-        # 尝试从认证信息中获取用户ID
-        user_id = self._get_user_id(request)
-        user_id_var.set(user_id)
-        
-        # 记录请求开始
-        start_time = time.time()
-        self.logger.info(
-            "Request started",
-            method=request.method,
-            path=request.url.path,
-            client_ip=request.client.host if request.client else 'unknown'
-        )
-        
+
+        # 用户ID 在认证通过后由 get_current_user 设置
+        user_id_var.set(None)
+
+        start_time = time.perf_counter()
+        status_code = 500
+        is_sse = False
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code, is_sse
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                # 流式响应的头部在第一个 chunk 之前发送，这里的耗时即首字节时间
+                response_headers = MutableHeaders(scope=message)
+                response_headers.append("X-Request-ID", request_id)
+                response_headers.append(
+                    "X-Process-Time", f"{time.perf_counter() - start_time:.6f}")
+                if response_headers.get("content-type", "").startswith("text/event-stream"):
+                    is_sse = True
+                    SSE_STREAMS_IN_FLIGHT.inc()
+            await send(message)
+
         try:
-            response = await call_next(request)
-            process_time = time.time() - start_time
-            
-            # 记录访问日志
-            self._log_access(request, response, process_time, user_id)
-            
-            # 记录请求完成
-            self.logger.info(
-                "Request completed",
-                method=request.method,
-                path=request.url.path,
-                status_code=response.status_code,
-                process_time=process_time
-            )
-            
-            # 添加响应头
-            response.headers["X-Request-ID"] = request_id
-            response.headers["X-Process-Time"] = str(process_time)
-            
-            return response
-            
+            await self.app(scope, receive, send_wrapper)
         except Exception as exc:
-            process_time = time.time() - start_time
+            process_time = time.perf_counter() - start_time
             self.logger.error(
                 "Request failed",
-                method=request.method,
-                path=request.url.path,
+                method=scope["method"],
+                path=scope["path"],
                 error=str(exc),
                 process_time=process_time,
                 exc_info=True
             )
             raise
-    
-    def _get_user_id(self, request: Request) -> str:
-        """从请求中获取用户ID"""
-        # 这里可以根据你的认证系统实现
-        # 例如从 JWT token 或 session 中获取
-        auth_header = request.headers.get('Authorization')
-        if auth_header and auth_header.startswith('Bearer '):
-            # 解析 token 获取用户ID
-            # token = auth_header[7:]
-            # user_id = decode_token(token).get('user_id')
-            return 'user-from-token'  # 示例
-        return 'anonymous'
-    
-    def _log_access(self, request: Request, response: Response, process_time: float, user_id: str):
+        finally:
+            if is_sse:
+                SSE_STREAMS_IN_FLIGHT.dec()
+            # 用路由模板而不是实际路径作为标签，避免 /notes/1、/notes/2 ... 造成标签爆炸
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start_time,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=status_code)
+
+        # 响应体全部发送完成后只记录一次访问日志和一条结构化日志
+        process_time = time.perf_counter() - start_time
+        client_addr = scope["client"][0] if scope.get("client") else 'unknown'
+        self._log_access(scope, client_addr, status_code, process_time, user_id_var.get() or 'anonymous')
+        self.logger.info(
+            "Request completed",
+            method=scope["method"],
+            path=scope["path"],
+            client_ip=client_addr,
+            status_code=status_code,
+            process_time=process_time
+        )
+
+    def _log_access(self, scope: Scope, client_addr: str, status_code: int, process_time: float, user_id: str):
         """记录访问日志"""
-        client_addr = request.client.host if request.client else 'unknown'
-        request_line = f"{request.method} {request.url.path} HTTP/1.1"
-        
+        request_line = f"{scope['method']} {scope['path']} HTTP/{scope.get('http_version', '1.1')}"
+
         # 使用 uvicorn.access 记录器记录标准访问日志
         self.access_logger.info(
             "",
             extra={
                 'client_addr': client_addr,
                 'request_line': request_line,
-                'status_code': response.status_code,
+                'status_code': status_code,
                 'user_id': user_id,
                 'process_time': process_time
             }
-        )
\ No newline at end of file
+        )
@@ -11,7 +11,7 @@
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.db.session import Base
-from sqlalchemy import JSON, Column, Integer, String, DateTime, ForeignKey, Text, Boolean
+from sqlalchemy import JSON, Column, Integer, String, DateTime, ForeignKey, Text, Boolean, Date, Float, Index, UniqueConstraint, text
 
 
 class Note(Base):
@@ -73,3 +73,50 @@ class Conversation(Base):
     ai_message = Column(String)    # AI回复
     created_at = Column(DateTime(timezone=True), server_default=func.now())  # 创建时间
     metadata_data = Column(JSON)        # 额外元数据
+
+
+class GraphSession(Base):
+    __tablename__ = "graph_sessions"
+
+    session_id = Column(String, primary_key=True)  # 会话ID（前端生成）
+    state = Column(JSON, nullable=False)  # 序列化后的 graph 状态
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class NoteGenerationJob(Base):
+    __tablename__ = "note_generation_jobs"
+    # 每个学习计划最多一个未结束（pending / running）的任务，并发提交时由数据库保证
+    __table_args__ = (Index("uq_note_generation_jobs_active_plan", "study_plan_id", unique=True,
+                            postgresql_where=text("status IN ('pending', 'running')")),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    study_plan_id = Column(Integer, ForeignKey("study_plans.id"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending / running / completed / failed
+    total = Column(Integer, nullable=False, default=0)  # 学习计划的笔记数
+    skipped = Column(Integer, nullable=False, default=0)  # 开始运行时已经有详细内容的笔记数
+    completed = Column(Integer, nullable=False, default=0)  # 本次运行生成成功的笔记数
+    failed = Column(Integer, nullable=False, default=0)  # 本次运行生成失败的笔记数
+    completion_tokens = Column(Integer, nullable=False, default=0)  # 本次运行输出的token数
+    started_at = Column(DateTime(timezone=True))  # 最近一次开始（或恢复）运行的时间
+    finished_at = Column(DateTime(timezone=True))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class LLMUsage(Base):
+    __tablename__ = "llm_usage"
+    __table_args__ = (UniqueConstraint("day", "user_id", "endpoint", "stage"),)
+
+    id = Column(Integer, primary_key=True)
+    day = Column(Date, nullable=False, index=True)  # 统计日期
+    user_id = Column(String, nullable=False)  # 用户ID（没有登录的调用为 anonymous，后台任务为 system）
+    endpoint = Column(String, nullable=False)  # 接口的路由模板或后台任务名
+    stage = Column(String, nullable=False)  # 大模型调用所属的环节（提示词模板）
+    calls = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    cached_tokens = Column(Integer, nullable=False, default=0)
+    total_seconds = Column(Float, nullable=False, default=0)  # 调用总耗时之和
+    ttft_seconds = Column(Float, nullable=False, default=0)  # 首token等待时间之和（流式调用）
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, computed_field
-from datetime import date, datetime
+from datetime import date, datetime, timezone
 from typing import Optional
 
 from app.models.study_plan import StudyPlanTitle
@@ -66,3 +66,28 @@ class CurrentDayNote(BaseModel):
         json_encoders = {
             datetime: lambda dt: dt.strftime("%Y-%m-%d")
         }
+
+
+class NoteGenerationJobResponse(BaseModel):
+    id: int
+    study_plan_id: int
+    status: str
+    total: int
+    skipped: int
+    completed: int
+    failed: int
+    completion_tokens: int
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    created_at: Optional[datetime] = None
+
+    @computed_field
+    def notes_per_minute(self) -> Optional[float]:
+        """本次运行的吞吐量（每分钟生成的笔记数）"""
+        if self.started_at is None:
+            return None
+        elapsed = ((self.finished_at or datetime.now(timezone.utc)) - self.started_at).total_seconds()
+        return round(self.completed / elapsed * 60, 2) if elapsed > 0 else None
+
+    class Config:
+        from_attributes = True
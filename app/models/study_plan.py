@@ -10,9 +10,9 @@
 """
 
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional
+from typing import Iterable, List, Optional
 
 
 # Pydantic Models
@@ -55,6 +55,84 @@ class StudyPlanAiResp(BaseModel):
     ai_response: str
 
 
+class DailyPlanOutput(BaseModel):
+    """大模型结构化输出：每天的学习安排"""
+    day: int = Field(description="第几天，从1开始")
+    topic: str = Field(description="当天主要学习主题")
+    key_points: List[str] = Field(description="当天的关键知识点")
+
+
+class StudyPlanOutput(BaseModel):
+    """大模型结构化输出：学习计划（JSON Schema / function calling 模式）"""
+    title: str = Field(description="学习的主题")
+    total_days: int = Field(description="计划天数")
+    goal: str = Field(description="具体学习目标")
+    description: str = Field(description="总体学习概述")
+    daily_plans: List[DailyPlanOutput] = Field(description="每一天的学习安排，天数与 total_days 一致")
+
+    def to_markdown(self, days: Optional[Iterable[int]] = None) -> str:
+        """
+        渲染成展示给用户的 markdown，格式与 markdown 模式下大模型的输出一致
+
+        Args:
+            days: 只渲染这些天的安排（增量调整后只展示有变化的天），None 表示全部
+        """
+        days = None if days is None else set(days)
+        lines = [
+            f"### 学习主题: {self.title}",
+            f"### 学习天数: {self.total_days}天",
+            f"### 学习目标: {self.goal}",
+            "### 学习计划描述:",
+            self.description,
+            "",
+            "### 学习计划大纲",
+        ]
+        for day_plan in self.daily_plans:
+            if days is not None and day_plan.day not in days:
+                continue
+            lines.append(f"**第{day_plan.day}天**")
+            lines.append(f"* 学习内容: {day_plan.topic}")
+            lines.append("* 学习知识点:")
+            lines.extend(f"{i}. {point}" for i, point in enumerate(day_plan.key_points, 1))
+            lines.append("")
+        return "\n".join(lines).rstrip()
+
+
+class StudyPlanPatch(BaseModel):
+    """大模型结构化输出：根据用户反馈对学习计划的修改，只包含有变化的部分"""
+    title: Optional[str] = Field(None, description="新的学习主题，没有变化时不填")
+    total_days: Optional[int] = Field(None, description="新的计划天数，没有变化时不填")
+    goal: Optional[str] = Field(None, description="新的学习目标，没有变化时不填")
+    description: Optional[str] = Field(None, description="新的总体学习概述，没有变化时不填")
+    changed_days: List[DailyPlanOutput] = Field(
+        default_factory=list, description="内容有变化或新增的天（day 为调整后的第几天），没有变化的天不要输出")
+
+    def apply(self, plan: StudyPlanOutput) -> Optional[StudyPlanOutput]:
+        """
+        把修改应用到学习计划上
+
+        Args:
+            plan: 当前的学习计划
+
+        Return:
+            StudyPlanOutput|None: 修改后的新计划（不修改传入的计划）；合并后第 1 到 total_days 天不连续
+            （例如天数增加但没有给出新增的天）时返回 None，由调用方重新生成完整的计划
+        """
+        daily_plans = {day_plan.day: day_plan for day_plan in plan.daily_plans}
+        daily_plans.update({day_plan.day: day_plan for day_plan in self.changed_days})
+        total_days = self.total_days or max(daily_plans, default=plan.total_days)
+        if total_days < 1 or any(day not in daily_plans for day in range(1, total_days + 1)):
+            return None
+        update = {field: value for field, value in (("title", self.title), ("goal", self.goal),
+                                                   ("description", self.description)) if value}
+        return plan.model_copy(update={
+            **update,
+            "total_days": total_days,
+            # 天数减少时删除多出来的天
+            "daily_plans": [daily_plans[day] for day in sorted(daily_plans) if day <= total_days],
+        })
+
+
 class GenPlanGraphState(BaseModel):
     subject: str
     # 曾经创建的学习计划
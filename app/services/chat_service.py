@@ -1,15 +1,20 @@
 import asyncio
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Union
 from pydantic import BaseModel
 from dotenv import load_dotenv
 from langchain.schema import HumanMessage, SystemMessage
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.db.session import session_scope
 from app.llm.llm_loader import llm as chat
-from app.core.messages import ErrorMessages, CommonMessages
+from app.llm.callbacks import LLM_STAGE_KEY
+from app.core.messages import ErrorMessages
 from app.services.conversation_service import conversation_service
+from app.services.vector_index_service import SOURCE_NOTE
 from app.models import conversation as conv_model
 from app.core.dependencies import method_logger
 from app.utils.logger import get_logger
+from app.utils.sse import SSEEvent
 
 load_dotenv()
 logger = get_logger(__name__)
@@ -37,31 +42,69 @@ class AIChatService:
         return messages
 
     @method_logger
-    async def generate_stream_by_langchain(self, db: AsyncSession, user_msg: str, session_id: str, meta_data: str = None) -> AsyncGenerator[str, None]:
-        messages = await self.build_messages(db, session_id)
+    def retrieve_note_context(self, chroma, user_msg: str, user_id: int) -> str:
+        """
+        从当前用户的笔记切块中检索和问题相关的片段
+
+        Args:
+            chroma: ChromaLangChainManager实例
+            user_msg: 用户的问题
+            user_id: 当前登录的用户ID
+
+        Return:
+            str: 相关片段，没有时返回空字符串
+        """
+        docs = chroma.similarity_search_with_relevance_scores(
+            user_msg,
+            k=settings.CHAT_CONTEXT_K,
+            filter_dict=chroma.build_filter(user_id=user_id, source=SOURCE_NOTE),
+            score_threshold=settings.CHAT_CONTEXT_THRESHOLD)
+        return "\n\n".join(doc.page_content for doc, _ in docs)
+
+    @method_logger
+    async def generate_stream_by_langchain(self, user_msg: str, session_id: str, meta_data: str = None,
+                                           chroma=None, user_id: int = None
+                                           ) -> AsyncGenerator[Union[str, SSEEvent], None]:
+        # 读取历史和保存对话各自使用短会话，流式输出期间不占用连接
+        async with session_scope() as db:
+            messages = await self.build_messages(db, session_id)
+        if chroma is not None and user_id is not None:
+            # 只把检索到的少量片段作为参考资料，不保存到对话历史中
+            context = await asyncio.to_thread(self.retrieve_note_context, chroma, user_msg, user_id)
+            if context:
+                messages.append(SystemMessage(content=f"以下是用户笔记中的相关内容，可作为回答的参考：\n\n{context}"))
         messages.append(HumanMessage(content=user_msg))
         full_response = ""
+        cancelled = False
+        # 使用异步生成器逐步返回响应
+        stream = chat.astream(messages, config={"metadata": {LLM_STAGE_KEY: "chat"}})
         try:
-            # 使用异步生成器逐步返回响应
-            async for chunk in chat.astream(messages):
+            async for chunk in stream:
                 content = chunk.content
                 if content is not None:
                     full_response += content
                     yield f"{content}"
                     await asyncio.sleep(0.02)  # 控制流的速度
+        except (asyncio.CancelledError, GeneratorExit):
+            # 客户端断开：关闭大模型的流，已生成的部分按 LLM_PARTIAL_OUTPUT_POLICY 决定是否保存
+            cancelled = True
+            logger.info(f"客户端断开，停止生成回复: session_id={session_id}")
+            raise
         except Exception as e:
             logger.error(str(e))
-            yield ErrorMessages.LLM_CALLING_ERROR
+            yield SSEEvent(ErrorMessages.LLM_CALLING_ERROR, "error")
         finally:
-            logger.info("保存完整对话到数据库")
-            conversation = conv_model.ConversationCreate(
-                session_id=session_id,
-                user_message=user_msg,
-                ai_message=full_response,
-                metadata_data=meta_data
-            )
-            await conversation_service.create_conversation(db, conversation)
-            yield CommonMessages.LLM_PROCESS_FINISH
+            await stream.aclose()
+            if not cancelled or settings.LLM_PARTIAL_OUTPUT_POLICY == "save":
+                logger.info("保存完整对话到数据库")
+                conversation = conv_model.ConversationCreate(
+                    session_id=session_id,
+                    user_message=user_msg,
+                    ai_message=full_response,
+                    metadata_data=meta_data
+                )
+                async with session_scope() as db:
+                    await conversation_service.create_conversation(db, conversation)
 
 
 # Global instance
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: history_search_service.py
+功能: 学习历史的混合检索（BM25 关键词 + 向量，倒数排名融合）
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+
+检索路径（记录在 history_retrieval_* 指标的 path 标签中）:
+    empty   - 用户没有任何学习计划，直接返回，不做向量化
+    keyword - 关键词覆盖率足够高，直接使用关键词结果（BM25 分数也要达到下限），不做向量化
+    hybrid  - 关键词结果不可靠，再做向量检索，两路结果按倒数排名融合；
+              融合结果只保留达到向量相关度阈值的切块，关键词只影响排序
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import List
+
+from app.core.config import settings
+from app.core.dependencies import method_logger
+from app.db.keyword_index import BM25Index, reciprocal_rank_fusion
+from app.services.vector_index_service import SOURCE_PLAN, SOURCE_PLAN_DAY
+from app.utils.logger import get_logger
+from app.utils.metrics import HISTORY_RETRIEVAL_SECONDS, HISTORY_RETRIEVAL_TOTAL
+
+logger = get_logger(__name__)
+
+
+class HistorySearchService:
+
+    def __init__(self):
+        # user_id -> (过期时间, BM25Index)，按最近使用排序
+        self._indexes: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def invalidate(self, user_id: int):
+        """用户的学习计划有变化时丢弃缓存的关键词索引"""
+        with self._lock:
+            self._indexes.pop(user_id, None)
+
+    def _get_index(self, chroma, user_id: int) -> BM25Index:
+        """
+        获取用户的关键词索引
+
+        每个用户的计划切块数量不多，按需从向量库读取正文建立索引并缓存一段时间。
+        多 worker 部署时其他进程写入的数据最多延迟 KEYWORD_INDEX_TTL 秒可见。
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._indexes.get(user_id)
+            if cached and cached[0] > now:
+                self._indexes.move_to_end(user_id)
+                return cached[1]
+        documents = chroma.get_documents(
+            chroma.build_filter(user_id=user_id, source=[SOURCE_PLAN, SOURCE_PLAN_DAY]))
+        index = BM25Index(documents)
+        with self._lock:
+            self._indexes[user_id] = (now + settings.KEYWORD_INDEX_TTL, index)
+            self._indexes.move_to_end(user_id)
+            while len(self._indexes) > settings.KEYWORD_INDEX_MAX_USERS:
+                self._indexes.popitem(last=False)
+        return index
+
+    @method_logger
+    def search(self, chroma, subject: str, user_id: int, k: int = 3) -> List[str]:
+        """
+        检索用户学习过的相关内容
+
+        Args:
+            chroma: ChromaLangChainManager实例
+            subject: 用户输入的学习主题
+            user_id: 当前登录的用户ID
+            k: 返回结果数量
+
+        Return:
+            list: 相关切块的正文
+        """
+        start_time = time.perf_counter()
+        index = self._get_index(chroma, user_id)
+        texts = {}
+        if len(index) == 0:
+            path, ranked = "empty", []
+        else:
+            keyword_hits = [hit for hit in index.search(subject, k * 2)
+                            if hit[2] >= settings.HISTORY_KEYWORD_MIN_COVERAGE
+                            and hit[1] >= settings.HISTORY_KEYWORD_MIN_SCORE]
+            if keyword_hits and keyword_hits[0][2] >= settings.HISTORY_KEYWORD_COVERAGE:
+                path, ranked = "keyword", [hit[0] for hit in keyword_hits[:k]]
+            else:
+                path = "hybrid"
+                dense_hits = chroma.similarity_search_with_relevance_scores(
+                    subject,
+                    k=k * 2,
+                    filter_dict=chroma.build_filter(user_id=user_id, source=[SOURCE_PLAN, SOURCE_PLAN_DAY]),
+                    score_threshold=settings.HISTORY_SIMILARITY_THRESHOLD)
+                # 缓存的关键词索引可能还没有最新写入的切块，正文以向量检索的结果为准
+                texts = {doc.id: doc.page_content for doc, _ in dense_hits}
+                fused = reciprocal_rank_fusion([[hit[0] for hit in keyword_hits], list(texts)])
+                # 只有关键词命中、没有达到向量阈值的切块不返回，避免常见词的命中被当成学过
+                ranked = [doc_id for doc_id, _ in fused if doc_id in texts][:k]
+
+        contexts = [texts.get(doc_id) or index.documents[doc_id][0] for doc_id in ranked]
+        HISTORY_RETRIEVAL_SECONDS.observe(time.perf_counter() - start_time, path=path)
+        HISTORY_RETRIEVAL_TOTAL.inc(path=path, hit=str(bool(contexts)).lower())
+        logger.info("检索学习历史", path=path, hits=len(contexts))
+        return contexts
+
+
+# Global instance
+history_search_service = HistorySearchService()
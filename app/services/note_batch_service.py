@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: note_batch_service.py
+功能: 批量生成学习计划全部笔记的详细内容
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+
+- 每天的提示词只用到之前几天计划中的要点（已经解析好保存在笔记中），不依赖之前笔记的生成结果，
+  所以各天可以并行生成，并发数由 NOTE_BATCH_CONCURRENCY 限制（进程内所有任务共享）
+- 每生成一条笔记立即保存，并更新任务表中的进度
+- 任务中断后（进程退出、重启）可以恢复：已经有详细内容的笔记会被跳过。
+  运行中的任务每 NOTE_BATCH_HEARTBEAT_SECONDS 秒更新一次 updated_at（心跳），
+  超过 NOTE_BATCH_STALE_SECONDS 没有更新的任务可以被其他进程接手
+- 每个学习计划最多一个未结束的任务，由 note_generation_jobs 上的部分唯一索引保证
+"""
+import asyncio
+import time
+import traceback
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from app.core.config import settings
+from app.core.dependencies import method_logger
+from app.db.session import session_scope
+from app.llm.ai_service import ai_service
+from app.models.db_models import Note, NoteGenerationJob, StudyPlan
+from app.services.note_service import note_service
+from app.services.usage_service import usage_service
+from app.utils.logger import endpoint_var, get_logger, user_id_var
+from app.utils.metrics import NOTE_BATCH_JOB_SECONDS, NOTE_BATCH_NOTES_TOTAL
+
+logger = get_logger(__name__)
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+# 未结束的任务状态，与部分唯一索引 uq_note_generation_jobs_active_plan 的条件一致
+ACTIVE_STATUSES = (JOB_PENDING, JOB_RUNNING)
+
+
+class NoteBatchService:
+
+    def __init__(self):
+        # 当前进程中正在运行的任务，job_id -> asyncio.Task
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._semaphore = asyncio.Semaphore(settings.NOTE_BATCH_CONCURRENCY)
+
+    @staticmethod
+    def _claimable():
+        """可以开始运行的任务：等待中，或者运行中但已经很久没有更新（进程异常退出）"""
+        stale_before = datetime.now(timezone.utc) - timedelta(seconds=settings.NOTE_BATCH_STALE_SECONDS)
+        return or_(NoteGenerationJob.status == JOB_PENDING,
+                   and_(NoteGenerationJob.status == JOB_RUNNING, NoteGenerationJob.updated_at < stale_before))
+
+    @method_logger
+    async def create_job(self, study_plan_id: int, user_id: int, chroma=None) -> NoteGenerationJob:
+        """
+        创建批量生成任务并在后台运行；该学习计划已经有未结束的任务时直接返回该任务
+
+        Args:
+            study_plan_id: 学习计划ID
+            user_id: 学习计划所属的用户ID
+            chroma: ChromaLangChainManager实例，为 None 时不建立索引
+
+        Return:
+            NoteGenerationJob: 任务
+        """
+        active = select(NoteGenerationJob).where(
+            NoteGenerationJob.study_plan_id == study_plan_id, NoteGenerationJob.status.in_(ACTIVE_STATUSES))
+        async with session_scope() as db:
+            job = (await db.execute(active)).scalars().first()
+            if job is None:
+                total = (await db.execute(
+                    select(func.count()).select_from(Note).where(Note.study_plan_id == study_plan_id))).scalar_one()
+                # 并发提交时只有一个插入成功，其余的冲突后读取已经存在的任务
+                stmt = insert(NoteGenerationJob).values(
+                    study_plan_id=study_plan_id, user_id=user_id, status=JOB_PENDING, total=total
+                ).on_conflict_do_nothing(
+                    index_elements=[NoteGenerationJob.study_plan_id],
+                    index_where=NoteGenerationJob.status.in_(ACTIVE_STATUSES)
+                ).returning(NoteGenerationJob.id)
+                job_id = (await db.execute(stmt)).scalar_one_or_none()
+                job = await db.get(NoteGenerationJob, job_id) if job_id else (await db.execute(active)).scalars().first()
+        self._spawn(job.id, chroma)
+        return job
+
+    @method_logger
+    async def get_job(self, job_id: int) -> Optional[NoteGenerationJob]:
+        async with session_scope() as db:
+            return await db.get(NoteGenerationJob, job_id)
+
+    def _spawn(self, job_id: int, chroma):
+        if job_id in self._tasks:
+            return
+        task = asyncio.create_task(self.run_job(job_id, chroma))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    @method_logger
+    async def resume_jobs(self, chroma=None) -> int:
+        """
+        启动时恢复未完成的任务
+
+        Return:
+            int: 恢复的任务数
+        """
+        async with session_scope() as db:
+            job_ids = (await db.execute(select(NoteGenerationJob.id).where(self._claimable()))).scalars().all()
+        for job_id in job_ids:
+            self._spawn(job_id, chroma)
+        if job_ids:
+            logger.info(f"恢复 {len(job_ids)} 个批量生成笔记的任务")
+        return len(job_ids)
+
+    async def shutdown(self):
+        """停止当前进程中的任务，并把它们改回等待状态，下次启动时立即恢复"""
+        job_ids = list(self._tasks)
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        if job_ids:
+            async with session_scope() as db:
+                await db.execute(update(NoteGenerationJob).where(
+                    NoteGenerationJob.id.in_(job_ids), NoteGenerationJob.status == JOB_RUNNING
+                ).values(status=JOB_PENDING))
+
+    @staticmethod
+    async def _progress(job_id: int, **increments):
+        """原子地增加任务的进度计数，同时刷新 updated_at"""
+        values = {name: getattr(NoteGenerationJob, name) + amount for name, amount in increments.items()}
+        async with session_scope() as db:
+            await db.execute(update(NoteGenerationJob).where(NoteGenerationJob.id == job_id).values(**values))
+
+    @staticmethod
+    async def _heartbeat(job_id: int):
+        """任务运行期间定期刷新 updated_at，避免生成较慢时被其他进程当成已退出的任务接手"""
+        while True:
+            await asyncio.sleep(settings.NOTE_BATCH_HEARTBEAT_SECONDS)
+            try:
+                async with session_scope() as db:
+                    await db.execute(update(NoteGenerationJob).where(
+                        NoteGenerationJob.id == job_id, NoteGenerationJob.status == JOB_RUNNING
+                    ).values(updated_at=func.now()))
+            except Exception as e:
+                logger.warning(f"批量任务心跳失败: job_id={job_id}, {e}")
+
+    async def run_job(self, job_id: int, chroma=None):
+        """
+        运行批量生成任务
+
+        Args:
+            job_id: 任务ID
+            chroma: ChromaLangChainManager实例，为 None 时不建立索引
+        """
+        async with session_scope() as db:
+            # 先把任务改为运行中，其他进程不会再接手同一个任务
+            result = await db.execute(
+                update(NoteGenerationJob).where(NoteGenerationJob.id == job_id, self._claimable())
+                .values(status=JOB_RUNNING, started_at=func.now(), finished_at=None,
+                        skipped=0, completed=0, failed=0, completion_tokens=0)
+                .returning(NoteGenerationJob.study_plan_id, NoteGenerationJob.user_id))
+            claimed = result.one_or_none()
+            if claimed is None:
+                return
+            study_plan_id, user_id = claimed
+            study_plan = await db.get(StudyPlan, study_plan_id)
+            notes = (await db.execute(select(Note).where(Note.study_plan_id == study_plan_id)
+                                      .order_by(Note.planned_study_start_time))).scalars().all()
+            # 已经有详细内容的笔记跳过（中断后恢复的任务、用户已经打开过的笔记）
+            pending = [(i, note) for i, note in enumerate(notes) if not note.detailed_content]
+            await db.execute(update(NoteGenerationJob).where(NoteGenerationJob.id == job_id)
+                             .values(total=len(notes), skipped=len(notes) - len(pending)))
+
+        # 任务在后台运行（或启动时恢复），大模型用量记到任务所属的用户
+        user_id_var.set(str(user_id))
+        endpoint_var.set("note_batch")
+        logger.info(f"开始批量生成笔记: job_id={job_id}, 共 {len(notes)} 条, 需要生成 {len(pending)} 条")
+        start_time = time.perf_counter()
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            results = await asyncio.gather(*(self._generate(job_id, study_plan, notes, i, chroma) for i, _ in pending))
+        finally:
+            heartbeat.cancel()
+        elapsed = time.perf_counter() - start_time
+        completed = sum(1 for tokens in results if tokens is not None)
+        tokens = sum(tokens for tokens in results if tokens)
+
+        status = JOB_COMPLETED if completed == len(pending) else JOB_FAILED
+        async with session_scope() as db:
+            await db.execute(update(NoteGenerationJob).where(NoteGenerationJob.id == job_id)
+                             .values(status=status, finished_at=func.now()))
+        NOTE_BATCH_JOB_SECONDS.observe(elapsed, status=status)
+        logger.info(f"批量生成笔记结束: job_id={job_id}, 状态 {status}, 成功 {completed}/{len(pending)} 条, "
+                    f"耗时 {elapsed:.1f}s, {completed / max(elapsed, 1e-9) * 60:.1f} 条/分钟, "
+                    f"{tokens / max(elapsed, 1e-9):.1f} tokens/秒")
+
+    async def _generate(self, job_id: int, study_plan: StudyPlan, notes, index: int, chroma) -> Optional[int]:
+        """
+        生成并保存一条笔记
+
+        Return:
+            int|None: 输出的token数（接口没有返回时为0），失败时为 None
+        """
+        note = notes[index]
+        async with self._semaphore:
+            if usage_service.is_over_budget(study_plan.user_id):
+                # 超出当天的token预算，这条笔记记为失败，之后可以重新提交任务继续生成
+                logger.warning(f"超出每日token预算，跳过笔记: job_id={job_id}, note_id={note.id}")
+                NOTE_BATCH_NOTES_TOTAL.inc(result="over_budget")
+                await self._progress(job_id, failed=1)
+                return None
+            sys_prompt, user_prompt = note_service.build_prompts(note, notes[:index], study_plan)
+            try:
+                response = await ai_service.generate_response(sys_prompt, user_prompt, stage="note_batch")
+                await note_service.save_detailed_content(
+                    note, response.content, study_plan.user_id, chroma, mark_studied=False)
+            except Exception:
+                logger.error(traceback.format_exc())
+                NOTE_BATCH_NOTES_TOTAL.inc(result="failed")
+                await self._progress(job_id, failed=1)
+                return None
+        tokens = response.completion_tokens or 0
+        NOTE_BATCH_NOTES_TOTAL.inc(result="ok")
+        await self._progress(job_id, completed=1, completion_tokens=tokens)
+        return tokens
+
+
+# Global instance
+note_batch_service = NoteBatchService()
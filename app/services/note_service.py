@@ -1,22 +1,38 @@
+import asyncio
 from datetime import datetime
+from functools import lru_cache
 import traceback
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from sqlalchemy import select, func, update
 from sqlalchemy.orm import selectinload
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.core.messages import CommonMessages, ErrorMessages
+from app.core.messages import ErrorMessages
 from app.llm.prompts.gen_note_detail_prompt import GenNoteDetailPrompt
 from app.models.note import NoteUpdate
 from app.models.db_models import Note
+from app.db.session import session_scope
 from app.services.study_plan_service import study_plan_service
+from app.services.vector_index_service import vector_index_service
 from app.llm.ai_service import ai_service
+from app.core.config import settings
 from app.core.dependencies import method_logger
 from app.utils.logger import get_logger
+from app.utils.sse import SSEEvent
 
 
 logger = get_logger(__name__)
 
 
+@lru_cache(maxsize=settings.NOTE_PROMPT_CACHE_SIZE)
+def _plan_system_prompt(study_plan_id: int, study_plan_content: str) -> str:
+    """
+    格式化学习计划的 system 提示词
+
+    同一个学习计划的每条笔记使用完全相同的字符串，内容变化（计划被修改）时按新的内容重新格式化。
+    """
+    return GenNoteDetailPrompt.SYS_PROMPT.format(study_plan_content=study_plan_content)
+
+
 class NoteService:
 
     @method_logger
@@ -88,46 +104,101 @@ class NoteService:
         return notes
 
     @method_logger
-    async def generate_detailed_content(self, db: AsyncSession, note_id: int):
-        """生成笔记的详细学习内容"""
+    async def generate_detailed_content(self, note_id: int, chroma=None):
+        """
+        生成笔记的详细学习内容
+
+        读取上下文和保存结果各自使用短会话，流式输出期间不占用数据库连接。
+        保存后把详细内容切块写入向量库，重新生成时只更新有变化的切块。
+        客户端断开（迭代被取消或生成器被关闭）时立即关闭大模型的流，已生成的部分按
+        LLM_PARTIAL_OUTPUT_POLICY 决定是否保存。
+
+        Args:
+            note_id: note id
+            chroma: ChromaLangChainManager实例，为 None 时不建立索引
+        """
         gen_success_flg = True
+        cancelled = False
+        chunks = []
         try:
-            stm = select(Note).where(Note.id == note_id)
-            result = await db.execute(stm)
-            note = result.scalars().one_or_none()
-            # 获取该学习计划的所有笔记，用于构建学习上下文
-            all_notes = await self.get_study_plan_notes(db, note.study_plan_id)
-            previous_notes = [
-                n for n in all_notes if n.planned_study_start_time < note.planned_study_start_time]
-            # 获取学习计划信息
-            study_plan = await study_plan_service.get_study_plan(db, note.study_plan_id)
-            # 构建提示词
-            if len(previous_notes) > 5:
-                sys_prompt = self._gen_system_prompt(
-                    previous_notes[-5::], study_plan)
-            else:
-                sys_prompt = self._gen_system_prompt(
-                    previous_notes, study_plan)
-            user_prompt = self._gen_user_prompt(note)
+            async with session_scope() as db:
+                stm = select(Note).where(Note.id == note_id)
+                result = await db.execute(stm)
+                note = result.scalars().one_or_none()
+                # 获取该学习计划的所有笔记，用于构建学习上下文
+                all_notes = await self.get_study_plan_notes(db, note.study_plan_id)
+                previous_notes = [
+                    n for n in all_notes if n.planned_study_start_time < note.planned_study_start_time]
+                # 获取学习计划信息
+                study_plan = await study_plan_service.get_study_plan(db, note.study_plan_id)
+            sys_prompt, user_prompt = self.build_prompts(note, previous_notes, study_plan)
 
             # 调用AI生成详细内容
-            chunks = []
-            async for chunk in ai_service.generate_stream_response(sys_prompt, user_prompt):
-                chunks.append(chunk)
-                yield chunk
-
+            stream = ai_service.generate_stream_response(sys_prompt, user_prompt, stage="note_detail")
+            try:
+                async for chunk in stream:
+                    chunks.append(chunk)
+                    yield chunk
+            finally:
+                # 在 yield 处被关闭时大模型的流不会自动关闭，这里显式关闭
+                await stream.aclose()
+
+        except (asyncio.CancelledError, GeneratorExit):
+            cancelled = True
+            logger.info(f"客户端断开，停止生成笔记: note_id={note_id}, 已生成 {len(chunks)} 段")
+            raise
         except Exception as e:
             logger.error(traceback.format_exc())
             gen_success_flg = False
-            yield ErrorMessages.LLM_CALLING_ERROR
+            yield SSEEvent(ErrorMessages.LLM_CALLING_ERROR, "error")
         finally:
+            if cancelled:
+                gen_success_flg = bool(chunks) and settings.LLM_PARTIAL_OUTPUT_POLICY == "save"
             if gen_success_flg:
-                # 更新笔记的详细内容
-                stm = update(Note).where(Note.id == note.id).values(detailed_content="".join(chunks),
-                                                                    actual_study_start_time=datetime.now(),
-                                                                    is_completed=True).returning(Note)
-                result = await db.execute(stm)
-                yield CommonMessages.LLM_PROCESS_FINISH
+                await self.save_detailed_content(note, "".join(chunks), study_plan.user_id, chroma)
+
+    @method_logger
+    async def save_detailed_content(self, note: Note, content: str, user_id: int, chroma=None,
+                                    mark_studied: bool = True):
+        """
+        保存笔记的详细内容，并把详细内容切块写入向量库
+
+        Args:
+            note: 笔记
+            content: 生成的详细内容
+            user_id: 笔记所属的用户ID
+            chroma: ChromaLangChainManager实例，为 None 时不建立索引
+            mark_studied: 是否同时记录为已学习（用户打开笔记时生成），批量预先生成时为 False
+        """
+        values = {"detailed_content": content}
+        if mark_studied:
+            values.update(actual_study_start_time=datetime.now(), is_completed=True)
+        async with session_scope() as db:
+            await db.execute(update(Note).where(Note.id == note.id).values(**values))
+        if chroma is not None:
+            note.detailed_content = content
+            try:
+                await asyncio.to_thread(vector_index_service.index_note, chroma, note, user_id)
+            except Exception:
+                # 索引失败不影响笔记内容的保存
+                logger.error(traceback.format_exc())
+
+    def build_prompts(self, note: Note, previous_notes: List[Note], study_plan) -> Tuple[str, str]:
+        """
+        构建生成笔记详细内容的提示词
+
+        system 提示词在同一个学习计划内不变，之前学习过的内容（最近5天的要点）放在 user 提示词中。
+        之前的内容只用到每天计划中的要点，不依赖之前笔记的生成结果，所以各天可以并行生成。
+
+        Args:
+            note: 要生成的笔记
+            previous_notes: 按计划时间排序的、在这条笔记之前的笔记
+            study_plan: 学习计划
+
+        Return:
+            tuple: (system 提示词, user 提示词)
+        """
+        return self._gen_system_prompt(study_plan), self._gen_user_prompt(note, previous_notes[-5:])
 
     @method_logger
     def _get_knowledge_points(self, previous_notes: List[Note]):
@@ -151,24 +222,21 @@ class NoteService:
         return knowledge_points
 
     @method_logger
-    def _gen_system_prompt(self, previous_notes: List[Note], study_plan) -> str:
-        """构建system提示词"""
-        # 构建之前学习过的内容摘要
-        previous_content = "这是第一天的学习内容"
-        knowledge_points = self._get_knowledge_points(previous_notes)
-        if knowledge_points:
-            previous_content = ",".join(knowledge_points)
-
-        prompt = GenNoteDetailPrompt.SYS_PROMPT.format(study_plan_content=study_plan.content,
-                                                       previous_content=previous_content)
-        return prompt
+    def _gen_system_prompt(self, study_plan) -> str:
+        """构建system提示词（按学习计划缓存）"""
+        return _plan_system_prompt(study_plan.id, study_plan.content)
 
     @method_logger
-    def _gen_user_prompt(self, current_note) -> str:
+    def _gen_user_prompt(self, current_note, previous_notes: List[Note]) -> str:
         """生成用户提示词"""
+        # 构建之前学习过的内容摘要
+        previous_content = "这是第一天的学习内容"
+        previous_points = self._get_knowledge_points(previous_notes)
+        if previous_points:
+            previous_content = ",".join(previous_points)
         knowledge_points = self._get_knowledge_points([current_note])
         topics = ",".join(knowledge_points)
-        prompt = GenNoteDetailPrompt.USER_PROMPT.format(topics=topics)
+        prompt = GenNoteDetailPrompt.USER_PROMPT.format(previous_content=previous_content, topics=topics)
         return prompt
 
 
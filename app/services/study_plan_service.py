@@ -1,9 +1,10 @@
 import asyncio
 import json
 import re
+import time
 import traceback
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import Dict, List, Optional, Union
 
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -13,7 +14,10 @@ from langchain_core.messages import AIMessage
 from app.utils.logger import get_logger
 from app.utils.mk_2_json import markdown_to_json
 from app.models.db_models import Note, StudyPlan
+from app.models.study_plan import StudyPlanOutput
 from app.core.dependencies import method_logger
+from app.llm.speculative import speculative_plans
+from app.utils.metrics import PLAN_TURN_SECONDS
 
 
 logger = get_logger(__name__)
@@ -21,11 +25,43 @@ logger = get_logger(__name__)
 
 class StudyPlanService:
 
+    @staticmethod
+    def parse_ai_response(ai_response: Union[StudyPlanOutput, Dict, str]) -> StudyPlanOutput:
+        """
+        把大模型生成的学习计划转换成 StudyPlanOutput
+
+        Args:
+            ai_response: 结构化输出的对象或 dict、JSON 字符串，或 markdown 模式下的 markdown
+
+        Return:
+            StudyPlanOutput: 校验过的学习计划
+        """
+        if isinstance(ai_response, StudyPlanOutput):
+            return ai_response
+        if isinstance(ai_response, dict):
+            return StudyPlanOutput.model_validate(ai_response)
+        if ai_response.lstrip().startswith("{"):
+            return StudyPlanOutput.model_validate_json(ai_response)
+        # markdown 模式：按固定的行前缀解析
+        logger.info("从AI的响应结果提取信息并输出成json")
+        data = json.loads(markdown_to_json(ai_response))
+        total_days = data["total_days"]
+        if re.match(r"\d+天", data["total_days"]):
+            total_days = int(data["total_days"].replace("天", "").strip())
+        return StudyPlanOutput(
+            title=data["title"],
+            total_days=total_days,
+            goal=data["specific_goals"],
+            description=data["content"],
+            daily_plans=data["daily_plans"]
+        )
+
     @method_logger
     async def create_study_plan_from_ai_response(
         self,
         db: AsyncSession,
-        ai_response: str,
+        ai_response: Union[StudyPlanOutput, Dict, str],
+        user_id: int,
     ) -> StudyPlan:
         """
         创建学习计划
@@ -33,46 +69,44 @@ class StudyPlanService:
         Args:
             self: cls
             db: 数据库连接实例
-            ai_response: 大模型返回的内容
+            ai_response: 大模型返回的内容，结构化输出的学习计划（对象、dict 或 JSON）或 markdown
+            user_id: 学习计划所属的用户ID
 
         Retrun:
             StudyPlan: 创建好的学习计划
         """
 
         try:
-            logger.info("从AI的响应结果提取信息并输出成json")
-            ai_json_output = markdown_to_json(ai_response)
-            data = json.loads(ai_json_output)
+            # 结构化输出的计划直接使用，不再解析 markdown
+            data = self.parse_ai_response(ai_response)
             # 计算时间范围
-            total_days = data["total_days"]
-            if re.match(r"\d+天", data["total_days"]):
-                total_days = int(data["total_days"].replace("天", "").strip())
+            total_days = data.total_days
             start_time = datetime.now()
             end_time = start_time + timedelta(days=total_days)
 
             # 创建主学习计划
             logger.info("创建学习计划")
             study_plan = StudyPlan(
-                title=data["title"],
-                content=data["content"],
-                goal=data["specific_goals"],
+                title=data.title,
+                content=data.description,
+                goal=data.goal,
                 total_days=total_days,
                 start_time=start_time,
                 end_time=end_time,
-                user_id=1
+                user_id=user_id
             )
 
             db.add(study_plan)
             await db.flush()
             logger.info("创建学习计划完成")
             logger.info("为每天创建笔记模板")
-            for day_plan in data["daily_plans"]:
-                day_start = start_time + timedelta(days=day_plan["day"]-1)
+            for day_plan in data.daily_plans:
+                day_start = start_time + timedelta(days=day_plan.day-1)
                 note_create = Note(
                     study_plan_id=study_plan.id,
-                    study_content=f"# {day_plan['topic']}\n\n## 今日学习要点：\n" +
+                    study_content=f"# {day_plan.topic}\n\n## 今日学习要点：\n" +
                     "\n".join(
-                        [f"- {point}" for point in day_plan["key_points"]]),
+                        [f"- {point}" for point in day_plan.key_points]),
                     detailed_content="",  # 留空供用户填写笔记
                     note_content="",  # 留空供用户填写笔记
                     planned_study_start_time=day_start,
@@ -122,7 +156,7 @@ class StudyPlanService:
         return result.scalars().one_or_none()
 
     @method_logger
-    async def ge_study_plan_event_stream(self, state, graph, db, sessions, session_id, vector_store, chroma):
+    async def ge_study_plan_event_stream(self, state, graph, sessions, session_id, vector_store, chroma, user_id):
         """
         生成学习计划
 
@@ -130,44 +164,60 @@ class StudyPlanService:
             self: cls
             state: graph中的state
             graph: graph实例
-            db: 数据库连接实例
-            sessions: fastapi的全局变量sessions
+            sessions: graph会话状态存储（GraphSessionStore）
             ession_id: 代表当前回话的唯一的ID
             vector_store: 向量存储的实例
             chroma: chroma的实例
+            user_id: 当前登录的用户ID，检索和保存学习计划时按用户隔离
 
         """
         # 边运行边 yield 事件
         config = {"configurable": {"thread_id": session_id,
-                                   "db_session": db,
                                    "vector_store": vector_store,
-                                   "chroma": chroma}}
+                                   "chroma": chroma,
+                                   "user_id": user_id}}
         output_text = ""
+        status = state.get("status", "start")
+        start_time = time.perf_counter()
 
-        # 让 checkpointer 自动处理状态恢复，我们只需要传递新消息
+        # 会话状态保存在 sessions 中，每轮把完整的状态作为输入，checkpointer 只在本轮内使用
         logger.info(
             f"开始执行，当前状态: {state.get('status', 'unknown')}", session_id=session_id)
-        # 使用 astream 执行，checkpointer 会自动从检查点恢复状态
-        async for event in graph.astream(state, config=config):
-            for node_name, partial_state in event.items():
-                logger.info(f"执行节点名称:{node_name}", session_id=session_id)
-                if "messages" in partial_state and isinstance(partial_state["messages"][-1], AIMessage):
-                    output_text = partial_state["messages"][-1].content
-
-            logger.info("实时保存状态")
+        stream = graph.astream(state, config=config)
+        try:
+            async for event in stream:
+                for node_name, partial_state in event.items():
+                    logger.info(f"执行节点名称:{node_name}", session_id=session_id)
+                    status = partial_state.get("status", status)
+                    if "messages" in partial_state and isinstance(partial_state["messages"][-1], AIMessage):
+                        output_text = partial_state["messages"][-1].content
+
+                logger.info("实时保存状态")
+                try:
+                    await asyncio.sleep(0.1)
+                    current_state = await graph.aget_state(config)
+                    if current_state.values:
+                        await sessions.set(session_id, current_state.values)
+                        logger.info(f"保存状态: {current_state.values.get('status')}")
+                except Exception as e:
+                    logger.info(f"状态保存失败: {e}")
+
+                if output_text:
+                    # 每轮对话的端到端耗时，按本轮结束时的状态区分（询问、展示计划、保存等）
+                    PLAN_TURN_SECONDS.observe(time.perf_counter() - start_time, status=status)
+                    yield output_text
+                    break
+        finally:
+            await stream.aclose()
+            # 删除本轮的检查点：否则每个 thread 的检查点会一直保留（会话被淘汰或结束后也不会释放），
+            # 下一轮 add_messages 还会把 sessions 中已经丢弃的早期消息合并回来
             try:
-                await asyncio.sleep(0.1)
-                current_state = graph.get_state(config)
-                if current_state.values:
-                    sessions[session_id] = current_state.values
-                    logger.info(f"保存状态: {current_state.values.get('status')}")
+                await graph.checkpointer.adelete_thread(session_id)
             except Exception as e:
-                logger.info(f"状态保存失败: {e}")
-
-            if output_text:
-                yield output_text
-                break
-
+                logger.warning(f"删除检查点失败: {e}", session_id=session_id)
+            # 只有停在询问是否深入学习时，下一轮才会用到推测生成的计划
+            if status != "asking_deep_learn":
+                speculative_plans.discard(session_id)
 
 # Global instance
 study_plan_service = StudyPlanService()
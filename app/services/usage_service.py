@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: usage_service.py
+功能: 大模型用量统计和每日token预算
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+
+- 每次大模型调用（AIService 和 langchain 的 llm）都记录 token 数、耗时和首token时间，
+  按 (日期, 用户, 接口, 环节) 在内存中累加，由后台任务定期批量写入 llm_usage 表
+- 用户当天的token总数保存在内存中，预算检查只读内存（每个 worker 每天第一次检查某个用户时读取一次数据库）。
+  写入数据库后重新读取这些用户当天的总数，其他 worker 的用量也会在下一次写入后被计入
+"""
+import asyncio
+import threading
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.core.config import settings
+from app.db.session import session_scope
+from app.models.db_models import LLMUsage
+from app.utils.logger import endpoint_var, get_logger, user_id_var
+from app.utils.metrics import LLM_BUDGET_REJECTED_TOTAL, observe_llm_call
+
+logger = get_logger(__name__)
+
+# 累加的字段，顺序与 _pending 中的列表一致
+USAGE_FIELDS = ("calls", "prompt_tokens", "completion_tokens", "cached_tokens", "total_seconds", "ttft_seconds")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的token数，用于拿不到接口返回的 usage 的情况（例如流式调用被取消）
+
+    按 DeepSeek 给出的换算比例：1 个中文字符约 0.6 个token，1 个英文字符约 0.3 个token
+    """
+    if not text:
+        return 0
+    ascii_chars = sum(1 for ch in text if ch.isascii())
+    return int((len(text) - ascii_chars) * 0.6 + ascii_chars * 0.3) + 1
+
+
+class UsageService:
+
+    def __init__(self, daily_token_budget: int = 0):
+        """
+        Args:
+            daily_token_budget: 每个用户每天的token上限（输入 + 输出），0 表示不限制
+        """
+        self.daily_token_budget = daily_token_budget
+        # 大模型调用可能在线程池中执行，修改内存数据时加锁
+        self._lock = threading.Lock()
+        # (日期, 用户, 接口, 环节) -> 还没有写入数据库的累计值
+        self._pending: Dict[Tuple[date, str, str, str], List[float]] = {}
+        # (日期, 用户) -> 已写入数据库的当天总token数（最近一次读取的值）
+        self._flushed_totals: Dict[Tuple[date, str], int] = {}
+        # (日期, 用户) -> 还没有写入数据库的token数
+        self._pending_totals: Dict[Tuple[date, str], int] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def record(self, stage: str, duration: float, ttft: float = None, completion_tokens: int = None,
+               prompt_tokens: int = None, cached_tokens: int = None):
+        """
+        记录一次大模型调用：更新监控指标，并按当前请求的用户和接口累加用量
+
+        Args:
+            stage: 调用所属的环节（提示词模板）
+            duration: 调用总耗时（秒）
+            ttft: 首个token的等待时间（秒），非流式调用为 None
+            completion_tokens: 输出的token数
+            prompt_tokens: 输入的token数
+            cached_tokens: 输入中命中提示词缓存的token数
+        """
+        observe_llm_call(stage, duration, ttft=ttft, completion_tokens=completion_tokens,
+                         prompt_tokens=prompt_tokens, cached_tokens=cached_tokens)
+        today = date.today()
+        user_id = user_id_var.get() or "anonymous"
+        endpoint = endpoint_var.get() or "unknown"
+        tokens = (prompt_tokens or 0) + (completion_tokens or 0)
+        values = (1, prompt_tokens or 0, completion_tokens or 0, cached_tokens or 0, duration, ttft or 0)
+        with self._lock:
+            row = self._pending.setdefault((today, user_id, endpoint, stage), [0] * len(USAGE_FIELDS))
+            for i, value in enumerate(values):
+                row[i] += value
+            self._pending_totals[(today, user_id)] = self._pending_totals.get((today, user_id), 0) + tokens
+
+    def used_tokens(self, user_id: str) -> int:
+        """用户当天已使用的token数（内存中的值）"""
+        key = (date.today(), str(user_id))
+        return self._flushed_totals.get(key, 0) + self._pending_totals.get(key, 0)
+
+    def is_over_budget(self, user_id) -> bool:
+        return self.daily_token_budget > 0 and self.used_tokens(str(user_id)) >= self.daily_token_budget
+
+    async def check_budget(self, user_id):
+        """
+        检查用户当天的token预算
+
+        每个 worker 每天只在第一次检查某个用户时读取一次数据库，之后只读内存。
+
+        Raises:
+            HTTPException: 超出预算时返回 429
+        """
+        if self.daily_token_budget <= 0:
+            return
+        if (date.today(), str(user_id)) not in self._flushed_totals:
+            await self.load_totals([str(user_id)])
+        if self.is_over_budget(user_id):
+            LLM_BUDGET_REJECTED_TOTAL.inc()
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="今日的大模型用量已达到上限，请明天再试")
+
+    async def load_totals(self, user_ids: Iterable[str]):
+        """从数据库读取这些用户当天的总token数"""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        today = date.today()
+        stmt = (select(LLMUsage.user_id, func.sum(LLMUsage.prompt_tokens + LLMUsage.completion_tokens))
+                .where(LLMUsage.day == today, LLMUsage.user_id.in_(user_ids))
+                .group_by(LLMUsage.user_id))
+        async with session_scope() as db:
+            rows = (await db.execute(stmt)).all()
+        totals = {user_id: 0 for user_id in user_ids}
+        totals.update({user_id: int(total or 0) for user_id, total in rows})
+        with self._lock:
+            for user_id, total in totals.items():
+                self._flushed_totals[(today, user_id)] = total
+            # 只保留当天的数据
+            self._flushed_totals = {key: value for key, value in self._flushed_totals.items() if key[0] == today}
+
+    @staticmethod
+    def _to_row(key: Tuple[date, str, str, str], values: List[float]) -> Dict:
+        day, user_id, endpoint, stage = key
+        return {"day": day, "user_id": user_id, "endpoint": endpoint, "stage": stage,
+                **dict(zip(USAGE_FIELDS, values))}
+
+    async def flush(self) -> int:
+        """
+        把内存中累加的用量批量写入数据库（同一行的数值累加）
+
+        Return:
+            int: 写入的行数
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            # 写入并重新读取总数之前，这部分用量仍然计入预算
+            pending_totals = dict(self._pending_totals)
+        if not pending:
+            return 0
+        stmt = insert(LLMUsage)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["day", "user_id", "endpoint", "stage"],
+            set_={**{name: getattr(LLMUsage, name) + getattr(stmt.excluded, name) for name in USAGE_FIELDS},
+                  "updated_at": func.now()})
+        try:
+            async with session_scope() as db:
+                await db.execute(stmt, [self._to_row(key, values) for key, values in pending.items()])
+        except Exception:
+            # 写入失败时放回内存，下次再写
+            with self._lock:
+                for key, values in pending.items():
+                    row = self._pending.setdefault(key, [0] * len(USAGE_FIELDS))
+                    for i, value in enumerate(values):
+                        row[i] += value
+            raise
+        # 重新读取这些用户当天的总数（包括其他 worker 写入的用量），已经写入的部分不再单独计数
+        await self.load_totals({user_id for (_, user_id) in pending_totals})
+        with self._lock:
+            for key, tokens in pending_totals.items():
+                remaining = self._pending_totals.get(key, 0) - tokens
+                if remaining > 0:
+                    self._pending_totals[key] = remaining
+                else:
+                    self._pending_totals.pop(key, None)
+        return len(pending)
+
+    async def _flush_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"写入大模型用量失败: {e}")
+
+    def start(self, interval: float):
+        """启动定期写入的后台任务"""
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop(interval))
+
+    async def stop(self):
+        """停止后台任务，并写入剩余的用量"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        await self.flush()
+
+
+# Global instance
+usage_service = UsageService(settings.LLM_DAILY_TOKEN_BUDGET)
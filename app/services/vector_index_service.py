@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: vector_index_service.py
+功能: 学习计划和笔记的切块索引
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+
+每个切块使用稳定的id，元数据中保存内容的 hash。重新索引时只向量化内容有变化的切块，
+并删除已经不存在的旧切块（例如重新生成笔记后变少的部分）。
+
+切块id:
+    plan:{plan_id}:overview     学习计划的标题、概要和目标
+    note:{note_id}:topic        每天的学习主题和要点
+    note:{note_id}:chunk:{i}    AI 生成的详细学习内容
+"""
+import hashlib
+from typing import Dict, List
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from app.core.config import settings
+from app.core.dependencies import method_logger
+from app.models.db_models import Note, StudyPlan
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 切块来源，检索时按来源过滤
+SOURCE_PLAN = "plan"
+SOURCE_PLAN_DAY = "plan_day"
+SOURCE_NOTE = "note"
+
+
+class VectorIndexService:
+
+    def __init__(self):
+        # 优先按 markdown 标题和段落切分，再按中文句子切分
+        self.splitter = RecursiveCharacterTextSplitter(
+            chunk_size=settings.VECTOR_CHUNK_SIZE,
+            chunk_overlap=settings.VECTOR_CHUNK_OVERLAP,
+            separators=["\n## ", "\n### ", "\n\n", "\n", "。", "！", "？", "；", "，", " ", ""],
+            keep_separator=True
+        )
+
+    @staticmethod
+    def _content_hash(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _make_chunk(self, text: str, metadata: Dict) -> Document:
+        return Document(page_content=text, metadata={**metadata, "content_hash": self._content_hash(text)})
+
+    def build_plan_chunks(self, plan: StudyPlan, notes: List[Note]) -> Dict[str, Document]:
+        """
+        把学习计划切分成概要和每天的主题
+
+        Args:
+            plan: 学习计划
+            notes: 学习计划下的笔记（每天一条）
+
+        Return:
+            dict: 切块id -> Document
+        """
+        base = {"user_id": plan.user_id, "plan_id": plan.id, "created_at": int(plan.start_time.timestamp())}
+        overview = "\n".join(part for part in (plan.title, plan.content, plan.goal) if part)
+        chunks = {f"plan:{plan.id}:overview": self._make_chunk(overview, {**base, "source": SOURCE_PLAN})}
+        for note in notes:
+            chunks[f"note:{note.id}:topic"] = self._make_chunk(
+                note.study_content, {**base, "note_id": note.id, "source": SOURCE_PLAN_DAY})
+        return chunks
+
+    def build_note_chunks(self, note: Note, user_id: int) -> Dict[str, Document]:
+        """
+        把笔记的详细内容切块
+
+        Args:
+            note: 笔记
+            user_id: 笔记所属的用户ID
+
+        Return:
+            dict: 切块id -> Document
+        """
+        base = {"user_id": user_id, "plan_id": note.study_plan_id, "note_id": note.id,
+                "source": SOURCE_NOTE, "created_at": int(note.planned_study_start_time.timestamp())}
+        texts = self.splitter.split_text(note.detailed_content or "")
+        return {f"note:{note.id}:chunk:{i}": self._make_chunk(text, {**base, "chunk_index": i})
+                for i, text in enumerate(texts)}
+
+    @method_logger
+    def sync(self, chroma, chunks: Dict[str, Document], filter_dict: Dict) -> Dict[str, int]:
+        """
+        同步一组切块：只写入新增或内容变化的切块，删除不再存在的切块
+
+        Args:
+            chroma: ChromaLangChainManager实例
+            chunks: 最新的切块，切块id -> Document
+            filter_dict: 这一组切块在向量库中的范围（如某条笔记的全部切块）
+
+        Return:
+            dict: 写入、删除、未变化的切块数量
+        """
+        existing = chroma.get_metadatas(filter_dict)
+        changed = {chunk_id: doc for chunk_id, doc in chunks.items()
+                   if (existing.get(chunk_id) or {}).get("content_hash") != doc.metadata["content_hash"]}
+        stale = [chunk_id for chunk_id in existing if chunk_id not in chunks]
+        chroma.upsert_documents(list(changed), list(changed.values()))
+        chroma.delete_documents(stale)
+        stats = {"upserted": len(changed), "deleted": len(stale), "unchanged": len(chunks) - len(changed)}
+        logger.info("向量索引同步完成", **stats)
+        return stats
+
+    def index_plan(self, chroma, plan: StudyPlan, notes: List[Note]) -> Dict[str, int]:
+        """索引学习计划的概要和每天的主题"""
+        stats = self.sync(chroma, self.build_plan_chunks(plan, notes),
+                          chroma.build_filter(plan_id=plan.id, source=[SOURCE_PLAN, SOURCE_PLAN_DAY]))
+        # 延迟导入，history_search_service 依赖本模块的常量
+        from app.services.history_search_service import history_search_service
+        history_search_service.invalidate(plan.user_id)
+        return stats
+
+    def index_note(self, chroma, note: Note, user_id: int) -> Dict[str, int]:
+        """索引笔记的详细内容，重新生成笔记后旧的多余切块会被删除"""
+        return self.sync(chroma, self.build_note_chunks(note, user_id),
+                         chroma.build_filter(note_id=note.id, source=SOURCE_NOTE))
+
+
+# Global instance
+vector_index_service = VectorIndexService()
@@ -1,4 +1,5 @@
 import logging
+import time
 from contextvars import ContextVar
 import uuid
 from typing import Optional, Dict, Any
@@ -6,6 +7,8 @@ from typing import Optional, Dict, Any
 # 请求上下文变量
 request_id_var: ContextVar[Optional[str]] = ContextVar('request_id', default=None)
 user_id_var: ContextVar[Optional[str]] = ContextVar('user_id', default=None)
+# 当前请求的路由模板（或后台任务名），用于按接口统计大模型用量
+endpoint_var: ContextVar[Optional[str]] = ContextVar('endpoint', default=None)
 
 class RequestContextFilter(logging.Filter):
     """为日志记录添加请求上下文信息"""
@@ -15,12 +18,17 @@ class RequestContextFilter(logging.Filter):
         record.user_id = user_id_var.get() or 'anonymous'
         return True
 
+_context_filter = RequestContextFilter()
+# 已创建的 AppLogger，按名称缓存
+_loggers: Dict[str, "AppLogger"] = {}
+
 class AppLogger:
     """应用日志记录器封装"""
     
     def __init__(self, name: str):
         self.logger = logging.getLogger(name)
-        self.logger.addFilter(RequestContextFilter())
+        if _context_filter not in self.logger.filters:
+            self.logger.addFilter(_context_filter)
     
     def _extra_fields(self, **kwargs) -> Dict[str, Any]:
         """构建额外的日志字段"""
@@ -32,16 +40,19 @@ class AppLogger:
         return extra
     
     def info(self, msg: str, **kwargs):
-        self.logger.info(msg, extra=self._extra_fields(**kwargs))
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(msg, extra=self._extra_fields(**kwargs))
     
     def error(self, msg: str, exc_info=True, **kwargs):
         self.logger.error(msg, exc_info=exc_info, extra=self._extra_fields(**kwargs))
     
     def warning(self, msg: str, **kwargs):
-        self.logger.warning(msg, extra=self._extra_fields(**kwargs))
+        if self.logger.isEnabledFor(logging.WARNING):
+            self.logger.warning(msg, extra=self._extra_fields(**kwargs))
     
     def debug(self, msg: str, **kwargs):
-        self.logger.debug(msg, extra=self._extra_fields(**kwargs))
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(msg, extra=self._extra_fields(**kwargs))
     
     def metric(self, metric_name: str, value: float, tags: Dict[str, str] = None):
         """记录监控指标"""
@@ -50,10 +61,13 @@ class AppLogger:
             'metric': metric_name,
             'value': value,
             'tags': tags or {},
-            'timestamp': logging.time()
+            'timestamp': time.time()
         }
         metric_logger.info('metric', extra=metric_data)
 
 def get_logger(name: str) -> AppLogger:
-    """获取应用日志记录器"""
-    return AppLogger(name)
\ No newline at end of file
+    """获取应用日志记录器（同名只创建一次）"""
+    logger = _loggers.get(name)
+    if logger is None:
+        logger = _loggers.setdefault(name, AppLogger(name))
+    return logger
\ No newline at end of file
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: metrics.py
+功能: 进程内的监控指标，以 Prometheus 文本格式导出（不依赖第三方库）
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+"""
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Tuple
+
+# 默认的耗时桶（秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """
+    固定桶的直方图
+
+    observe 只做一次二分查找和几次加法，可以放在高频调用的路径上。
+    """
+    __slots__ = ("bounds", "counts", "count", "sum", "_lock")
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        # 最后一个桶是 +Inf
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        """记录一个观测值"""
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def cumulative_buckets(self) -> List[Tuple[float, int]]:
+        """
+        累计桶计数
+
+        Return:
+            list: (上界, 小于等于该上界的观测数) 的列表，最后一项的上界为 inf
+        """
+        with self._lock:
+            counts = list(self.counts)
+        result = []
+        total = 0
+        for bound, count in zip(self.bounds + (float("inf"),), counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, q: float) -> float:
+        """根据桶计数估算分位数（返回所在桶的上界）"""
+        buckets = self.cumulative_buckets()
+        total = buckets[-1][1]
+        if total == 0:
+            return 0.0
+        rank = q * total
+        for bound, cumulative in buckets:
+            if cumulative >= rank:
+                return bound if bound != float("inf") else self.bounds[-1]
+        return self.bounds[-1]
+
+    def snapshot(self) -> Dict:
+        """导出直方图的当前状态"""
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": self.cumulative_buckets(),
+        }
+
+
+# 每个指标最多保留的标签组合数，超过后新的组合都记到 OVERFLOW_LABEL 下
+MAX_SERIES = 200
+OVERFLOW_LABEL = "other"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_histogram(name: str, labels: Dict[str, str], histogram: Histogram) -> List[str]:
+    """把一个直方图渲染成 Prometheus 文本格式的多行"""
+    lines = []
+    for bound, cumulative in histogram.cumulative_buckets():
+        bucket_labels = dict(labels, le=_format_value(bound))
+        lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}")
+    lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+    return lines
+
+
+class _Metric(ABC):
+    """带标签的指标族，标签组合的数量有上限"""
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 max_series: int = MAX_SERIES):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.max_series = max_series
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _child(self, labels: Dict[str, str]):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        child = self._series.get(key)
+        if child is None:
+            with self._lock:
+                child = self._series.get(key)
+                if child is None:
+                    if len(self._series) >= self.max_series:
+                        key = (OVERFLOW_LABEL,) * len(self.labelnames)
+                        child = self._series.get(key)
+                    if child is None:
+                        child = self._series[key] = self._new_child()
+        return child
+
+    @abstractmethod
+    def _new_child(self):
+        """创建一个标签组合的存储"""
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        """Prometheus 文本格式的样本行"""
+
+    def _labels(self, key) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    type_name = "counter"
+
+    def _new_child(self):
+        return [0.0]
+
+    def inc(self, amount: float = 1, **labels):
+        child = self._child(labels)
+        with self._lock:
+            child[0] += amount
+
+    def value(self, **labels) -> float:
+        return self._child(labels)[0]
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self._labels(key))} {_format_value(child[0])}"
+                for key, child in list(self._series.items())]
+
+
+class Gauge(_Metric):
+    """可增可减的当前值，也可以在采集时通过回调函数计算"""
+    type_name = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._function = None
+
+    def _new_child(self):
+        return [0.0]
+
+    def set(self, value: float, **labels):
+        self._child(labels)[0] = value
+
+    def inc(self, amount: float = 1, **labels):
+        child = self._child(labels)
+        with self._lock:
+            child[0] += amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function):
+        """采集时调用 function() 得到当前值（只用于不带标签的指标）"""
+        self._function = function
+
+    def _samples(self) -> List[str]:
+        if self._function is not None:
+            try:
+                return [f"{self.name} {_format_value(float(self._function()))}"]
+            except Exception:
+                return []
+        return [f"{self.name}{_format_labels(self._labels(key))} {_format_value(child[0])}"
+                for key, child in list(self._series.items())]
+
+
+class HistogramMetric(_Metric):
+    """带标签的直方图"""
+    type_name = "histogram"
+
+    def __init__(self, *args, buckets: Iterable[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return Histogram(self.buckets)
+
+    def observe(self, value: float, **labels):
+        self._child(labels).observe(value)
+
+    def snapshot(self, **labels) -> Dict:
+        """导出某个标签组合的直方图状态"""
+        return self._child(labels).snapshot()
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, histogram in list(self._series.items()):
+            lines.extend(render_histogram(self.name, self._labels(key), histogram))
+        return lines
+
+
+class MetricsRegistry:
+    """进程内的指标注册表，以 Prometheus 文本格式导出"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> HistogramMetric:
+        return self._get_or_create(HistogramMetric, name, documentation, labelnames, buckets=buckets)
+
+    def register_collector(self, collector):
+        """注册一个在采集时调用的函数，返回 Prometheus 文本格式的行列表"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# Prometheus 文本格式的 Content-Type
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 应用使用的指标
+HTTP_REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds", "HTTP请求耗时（按路由模板统计）", ("method", "route", "status"))
+SSE_STREAMS_IN_FLIGHT = registry.gauge(
+    "sse_streams_in_flight", "正在进行中的SSE流数量")
+DB_POOL_CHECKOUT_SECONDS = registry.histogram(
+    "db_pool_checkout_seconds", "从连接池获取连接的等待时间")
+DB_POOL_IN_USE = registry.gauge(
+    "db_pool_connections_in_use", "已被借出的数据库连接数")
+DB_POOL_SATURATION = registry.gauge(
+    "db_pool_saturation", "已借出连接数 / 连接池容量（pool_size + max_overflow）")
+LLM_TTFT_SECONDS = registry.histogram(
+    "llm_time_to_first_token_seconds", "大模型首个token的等待时间", ("stage",))
+LLM_CALL_SECONDS = registry.histogram(
+    "llm_call_duration_seconds", "大模型调用的总耗时", ("stage",))
+LLM_TOKENS_PER_SECOND = registry.histogram(
+    "llm_tokens_per_second", "大模型输出速度（首个token之后）", ("stage",),
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 500))
+LLM_COMPLETION_TOKENS = registry.histogram(
+    "llm_completion_tokens", "每次调用输出的token数", ("stage",),
+    buckets=(16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192))
+LLM_PROMPT_TOKENS = registry.counter(
+    "llm_prompt_tokens_total", "输入的token总数", ("stage",))
+# 缓存命中率 = llm_prompt_cached_tokens_total / llm_prompt_tokens_total
+LLM_PROMPT_CACHED_TOKENS = registry.counter(
+    "llm_prompt_cached_tokens_total", "输入中命中服务端提示词缓存的token数", ("stage",))
+EMBEDDING_SECONDS = registry.histogram(
+    "embedding_duration_seconds", "向量化耗时", ("op",))
+VECTOR_SEARCH_SECONDS = registry.histogram(
+    "vector_search_duration_seconds", "向量检索耗时", ("op",))
+HISTORY_RETRIEVAL_SECONDS = registry.histogram(
+    "history_retrieval_duration_seconds", "检索学习历史的耗时（按检索路径统计）", ("path",))
+HISTORY_RETRIEVAL_TOTAL = registry.counter(
+    "history_retrieval_total", "检索学习历史的次数（按检索路径和是否命中统计）", ("path", "hit"))
+CLASSIFIER_DECISIONS_TOTAL = registry.counter(
+    "intent_classifier_decisions_total", "意图分类次数（path: rule 规则命中 / llm 大模型兜底 / default 默认值）",
+    ("task", "path"))
+CLASSIFIER_SECONDS = registry.histogram(
+    "intent_classifier_duration_seconds", "意图分类耗时", ("task", "path"))
+CLASSIFIER_SAVED_SECONDS = registry.counter(
+    "intent_classifier_saved_seconds_total", "规则命中时按大模型分类的平均耗时估算节省的时间", ("task",))
+PLAN_OUTPUT_TOTAL = registry.counter(
+    "plan_output_total", "生成学习计划的次数（按输出方式和结果统计，result: ok / invalid / incomplete）", ("mode", "result"))
+PLAN_TURN_SECONDS = registry.histogram(
+    "plan_turn_duration_seconds", "生成学习计划的每轮对话耗时（从收到输入到返回回复，按回复后的状态统计）", ("status",))
+SPECULATIVE_PLAN_TOTAL = registry.counter(
+    "speculative_plan_total", "推测生成的学习计划（result: hit 命中 / miss 未命中 / expired 过期 / discarded 会话不再需要 / error 失败）", ("result",))
+GRAPH_SESSIONS = registry.gauge(
+    "graph_sessions", "内存中保存的生成计划会话数")
+GRAPH_SESSION_BYTES = registry.gauge(
+    "graph_session_bytes", "内存中会话状态压缩后的总字节数")
+GRAPH_SESSION_EVICTIONS_TOTAL = registry.counter(
+    "graph_session_evictions_total", "被淘汰的会话数（reason: ttl 过期 / lru 超出数量或内存上限）", ("reason",))
+NOTE_BATCH_NOTES_TOTAL = registry.counter(
+    "note_batch_notes_total", "批量生成的笔记数（result: ok / failed / over_budget）", ("result",))
+NOTE_BATCH_JOB_SECONDS = registry.histogram(
+    "note_batch_job_duration_seconds", "批量生成笔记任务的耗时", ("status",),
+    buckets=(10, 30, 60, 120, 300, 600, 1200, 1800, 3600))
+LLM_BUDGET_REJECTED_TOTAL = registry.counter(
+    "llm_budget_rejected_total", "超出每日token预算被拒绝的请求数")
+SSE_RESUMED_TOTAL = registry.counter(
+    "sse_resumed_total", "通过 Last-Event-ID 续传的SSE流数")
+SSE_UPSTREAM_CLOSED_TOTAL = registry.counter(
+    "sse_upstream_closed_total", "客户端断开后在结束之前被关闭的上游流数")
+LLM_STREAMS_CANCELLED_TOTAL = registry.counter(
+    "llm_streams_cancelled_total", "客户端断开后被取消的大模型流式调用数", ("stage",))
+LOG_RECORDS_DROPPED = registry.counter(
+    "log_records_dropped_total", "日志队列满时被丢弃的日志条数")
+
+
+def observe_llm_call(stage: str, duration: float, ttft: float = None,
+                     completion_tokens: int = None, prompt_tokens: int = None, cached_tokens: int = None):
+    """
+    记录一次大模型调用的指标
+
+    Args:
+        stage: 调用所属的环节（如 chat、note_detail、check_input）
+        duration: 调用总耗时（秒）
+        ttft: 首个token的等待时间（秒），非流式调用为 None
+        completion_tokens: 输出的token数
+        prompt_tokens: 输入的token数
+        cached_tokens: 输入中命中提示词缓存的token数
+    """
+    LLM_CALL_SECONDS.observe(duration, stage=stage)
+    if ttft is not None:
+        LLM_TTFT_SECONDS.observe(ttft, stage=stage)
+    if completion_tokens:
+        LLM_COMPLETION_TOKENS.observe(completion_tokens, stage=stage)
+        generation_time = duration - (ttft or 0)
+        if generation_time > 0:
+            LLM_TOKENS_PER_SECOND.observe(completion_tokens / generation_time, stage=stage)
+    if prompt_tokens:
+        LLM_PROMPT_TOKENS.inc(prompt_tokens, stage=stage)
+        # 没有命中时也记录 0，保证该环节的序列存在
+        LLM_PROMPT_CACHED_TOKENS.inc(cached_tokens or 0, stage=stage)
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: sse.py
+功能: SSE（text/event-stream）流式响应
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+
+- 上游生成器输出的每段内容只编码一次（data: 帧的 bytes），发送和续传都直接使用编码好的帧
+- 一段时间没有数据时发送心跳注释，避免代理断开空闲连接
+- 上游由后台任务读取，帧保存在有界的缓冲区中。客户端断开后带 Last-Event-ID 重连，
+  从缓冲区续传；超过 SSE_RESUME_GRACE_SECONDS 没有重连时关闭上游（停止大模型调用）
+- 流结束时发送 done 事件，出错时发送 error 事件
+- 可续传的流只保存在当前进程中，多 worker 部署时需要重连到同一个 worker（否则重新生成）
+"""
+import asyncio
+import uuid
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Deque, List, NamedTuple, Optional, Tuple, Union
+
+from fastapi import Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.messages import ErrorMessages
+from app.utils.logger import get_logger, user_id_var
+from app.utils.metrics import SSE_RESUMED_TOTAL, SSE_UPSTREAM_CLOSED_TOTAL
+
+logger = get_logger(__name__)
+
+# 心跳（注释行，客户端会忽略）
+HEARTBEAT = b": ping\n\n"
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    # 关闭 nginx 的响应缓冲
+    "X-Accel-Buffering": "no",
+}
+
+
+class SSEEvent(NamedTuple):
+    """上游生成器可以输出 SSEEvent 指定事件类型，直接输出 str 时为默认的 message 事件"""
+    data: str
+    event: Optional[str] = None
+
+
+def encode_frame(data: str, event: Optional[str] = None, event_id: Optional[str] = None) -> bytes:
+    """
+    编码一个 SSE 帧
+
+    Args:
+        data: 内容，多行时每行一个 data: 字段
+        event: 事件类型，None 为默认的 message 事件
+        event_id: 事件ID，客户端重连时通过 Last-Event-ID 发回
+
+    Return:
+        bytes: 编码后的帧
+    """
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+
+class SSEStream:
+    """一个事件流：后台任务读取上游生成器，编码后的帧保存在有界的缓冲区中"""
+
+    def __init__(self, source: AsyncIterator[Union[str, SSEEvent]], user_id: Optional[str], buffer_size: int):
+        self.stream_id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.buffer_size = buffer_size
+        self._source = source
+        # (序号, 帧)
+        self._frames: Deque[Tuple[int, bytes]] = deque(maxlen=buffer_size)
+        self._next_seq = 1
+        # 已经发送给客户端的最大序号，客户端跟不上时上游等待，缓冲区中的帧不会在发送之前被挤掉
+        self.sent = 0
+        self.attached = 0
+        self.done = False
+        # 上游在结束之前被关闭（客户端断开后没有重连），不能再续传
+        self.closed = False
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._close_handle: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def changed(self) -> asyncio.Event:
+        """有新的帧、流结束或有帧被发送时 set 的事件（每次通知后换成新的事件）"""
+        return self._changed
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _append(self, data: str, event: Optional[str] = None):
+        seq = self._next_seq
+        self._next_seq += 1
+        self._frames.append((seq, encode_frame(data, event, f"{self.stream_id}:{seq}")))
+        self._notify()
+
+    def frames_after(self, seq: int) -> Optional[List[Tuple[int, bytes]]]:
+        """
+        序号 seq 之后的帧
+
+        Return:
+            list|None: 帧的列表；seq 之后的帧已经被挤出缓冲区时为 None
+        """
+        if self._frames and self._frames[0][0] > seq + 1:
+            return None
+        return [(s, frame) for s, frame in self._frames if s > seq]
+
+    def mark_sent(self, seq: int):
+        if seq > self.sent:
+            self.sent = seq
+            self._notify()
+
+    async def _produce(self):
+        try:
+            async for item in self._source:
+                while self.attached and self._next_seq - self.sent > self.buffer_size:
+                    await self.changed.wait()
+                if isinstance(item, SSEEvent):
+                    self._append(item.data, item.event)
+                elif item:
+                    self._append(item)
+            self._append("", "done")
+        except asyncio.CancelledError:
+            self.closed = True
+            SSE_UPSTREAM_CLOSED_TOTAL.inc()
+            raise
+        except Exception as e:
+            logger.error(f"SSE 上游出错: {e}", exc_info=True)
+            self._append(ErrorMessages.LLM_CALLING_ERROR, "error")
+            self._append("", "done")
+        finally:
+            # 显式关闭上游生成器，释放大模型的连接
+            await self._source.aclose()
+            self.done = True
+            self._notify()
+
+    def attach(self):
+        """客户端连接（或重连）"""
+        self.attached += 1
+        if self._close_handle is not None:
+            self._close_handle.cancel()
+            self._close_handle = None
+        if self._task is None:
+            self._task = asyncio.create_task(self._produce())
+
+    def detach(self, grace: float):
+        """客户端断开，grace 秒内没有重连时关闭上游"""
+        self.attached -= 1
+        self._notify()
+        if self.attached or self.done or self._task is None:
+            return
+        if grace > 0:
+            self._close_handle = asyncio.get_running_loop().call_later(grace, self._close_upstream)
+        else:
+            self._close_upstream()
+
+    def _close_upstream(self):
+        self._close_handle = None
+        if not self.attached and self._task is not None and not self._task.done():
+            logger.info(f"客户端断开，关闭上游: stream_id={self.stream_id}")
+            self._task.cancel()
+
+
+class EventStreamResponse(Response):
+    """发送 SSEStream 中的帧，同时监听客户端断开"""
+    media_type = "text/event-stream"
+
+    def __init__(self, stream: SSEStream, after: int = 0, heartbeat: float = 15, grace: float = 0):
+        self.stream = stream
+        self.after = after
+        self.heartbeat = heartbeat
+        self.grace = grace
+        self.status_code = 200
+        self.background = None
+        self.init_headers(SSE_HEADERS)
+
+    async def _send_frames(self, send: Send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        after = self.after
+        while True:
+            frames = self.stream.frames_after(after)
+            if frames is None:
+                # 客户端太久没有读取，需要的帧已经被挤出缓冲区
+                logger.warning(f"SSE 缓冲区溢出，断开连接: stream_id={self.stream.stream_id}")
+                break
+            if frames:
+                for seq, frame in frames:
+                    await send({"type": "http.response.body", "body": frame, "more_body": True})
+                    after = seq
+                self.stream.mark_sent(after)
+                continue
+            if self.stream.done:
+                break
+            # 先取出事件再等待，避免错过等待之前的通知
+            changed = self.stream.changed
+            try:
+                await asyncio.wait_for(changed.wait(), self.heartbeat)
+            except asyncio.TimeoutError:
+                await send({"type": "http.response.body", "body": HEARTBEAT, "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    @staticmethod
+    async def _wait_disconnect(receive: Receive):
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        self.stream.attach()
+        sender = asyncio.create_task(self._send_frames(send))
+        listener = asyncio.create_task(self._wait_disconnect(receive))
+        try:
+            await asyncio.wait({sender, listener}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (sender, listener):
+                task.cancel()
+            await asyncio.gather(sender, listener, return_exceptions=True)
+            self.stream.detach(self.grace)
+        if sender.done() and not sender.cancelled() and sender.exception() is not None:
+            raise sender.exception()
+
+
+class SSEManager:
+    """创建和续传 SSE 流；可续传的流按创建顺序保留最近 max_streams 个"""
+
+    def __init__(self, max_streams: int, buffer_size: int, heartbeat: float, grace: float):
+        self.max_streams = max_streams
+        self.buffer_size = buffer_size
+        self.heartbeat = heartbeat
+        self.grace = grace
+        self._streams: "OrderedDict[str, SSEStream]" = OrderedDict()
+
+    def resume(self, request: Request) -> Optional[EventStreamResponse]:
+        """
+        客户端带 Last-Event-ID 重连时，从缓冲区续传
+
+        Return:
+            EventStreamResponse|None: 流已经不存在、已被关闭、不属于当前用户或需要的帧已被挤出时为 None，
+            此时调用方应重新生成
+        """
+        last_event_id = request.headers.get("last-event-id")
+        if not last_event_id:
+            return None
+        stream_id, _, seq = last_event_id.partition(":")
+        stream = self._streams.get(stream_id)
+        if stream is None or stream.closed or stream.user_id != user_id_var.get() or not seq.isdigit():
+            return None
+        if stream.frames_after(int(seq)) is None:
+            return None
+        SSE_RESUMED_TOTAL.inc()
+        logger.info(f"SSE 续传: stream_id={stream_id}, last_event_id={last_event_id}")
+        return EventStreamResponse(stream, int(seq), self.heartbeat, self.grace)
+
+    def response(self, request: Request, source: AsyncIterator[Union[str, SSEEvent]]) -> EventStreamResponse:
+        """
+        把上游生成器包装成 SSE 响应；客户端带 Last-Event-ID 重连且可以续传时，不使用 source
+
+        Args:
+            request: request请求
+            source: 上游生成器，输出 str 或 SSEEvent
+
+        Return:
+            EventStreamResponse: SSE 响应
+        """
+        resumed = self.resume(request)
+        if resumed is not None:
+            # source 还没有开始迭代，不会调用大模型
+            return resumed
+        stream = SSEStream(source, user_id_var.get(), self.buffer_size)
+        self._streams[stream.stream_id] = stream
+        while len(self._streams) > self.max_streams:
+            # 被挤出的流不再能续传，正在进行的不受影响
+            self._streams.popitem(last=False)
+        return EventStreamResponse(stream, 0, self.heartbeat, self.grace)
+
+
+# Global instance
+sse_manager = SSEManager(settings.SSE_REPLAY_STREAMS, settings.SSE_REPLAY_BUFFER,
+                         settings.SSE_HEARTBEAT_SECONDS, settings.SSE_RESUME_GRACE_SECONDS)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: bench_db_pool.py
+功能: 连接池饱和测试：模拟并发的流式请求，测量其他普通请求的排队时间
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+
+两种模式:
+    held   - 旧做法，整个流式响应期间持有同一个会话/连接
+    scoped - 读取和写入各用一次 session_scope，流式输出期间不占用连接
+
+需要可以连接的 PostgreSQL（使用 .env 中的配置）。
+
+运行方式:
+    python -m benchmarks.bench_db_pool --streams 30 --stream-seconds 5
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.db.session import session_scope, engine
+
+
+async def stream_held(stream_seconds: float):
+    async with session_scope() as db:
+        await db.execute(text("SELECT 1"))
+        await asyncio.sleep(stream_seconds)  # 模拟大模型流式输出
+        await db.execute(text("SELECT 1"))
+
+
+async def stream_scoped(stream_seconds: float):
+    async with session_scope() as db:
+        await db.execute(text("SELECT 1"))
+    await asyncio.sleep(stream_seconds)
+    async with session_scope() as db:
+        await db.execute(text("SELECT 1"))
+
+
+async def short_request(latencies: list, failures: list):
+    start = time.perf_counter()
+    try:
+        async with session_scope() as db:
+            await db.execute(text("SELECT 1"))
+        latencies.append(time.perf_counter() - start)
+    except Exception as e:
+        failures.append(e)
+
+
+async def run(mode: str, streams: int, stream_seconds: float, requests: int):
+    stream = stream_held if mode == "held" else stream_scoped
+    latencies, failures = [], []
+    stream_tasks = [asyncio.create_task(stream(stream_seconds)) for _ in range(streams)]
+    await asyncio.sleep(0.2)  # 等流式请求先拿到连接
+    await asyncio.gather(*(short_request(latencies, failures) for _ in range(requests)))
+    await asyncio.gather(*stream_tasks, return_exceptions=True)
+
+    if latencies:
+        latencies.sort()
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        print(f"[{mode}] 普通请求 {len(latencies)} 个成功, {len(failures)} 个失败, "
+              f"p50={statistics.median(latencies) * 1000:.1f}ms p99={p99 * 1000:.1f}ms")
+    else:
+        print(f"[{mode}] 普通请求全部失败: {failures[0]!r}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--streams", type=int, default=30)
+    parser.add_argument("--stream-seconds", type=float, default=5)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"pool_size={settings.DB_POOL_SIZE} max_overflow={settings.DB_MAX_OVERFLOW} "
+          f"pool_timeout={settings.DB_POOL_TIMEOUT}s, 并发流式请求 {args.streams} 个")
+    for mode in ("held", "scoped"):
+        await run(mode, args.streams, args.stream_seconds, args.requests)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
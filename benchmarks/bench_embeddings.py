@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: bench_embeddings.py
+功能: 向量化后端对比：torch / torch_int8 / onnx 的吞吐、峰值内存和与原模型的一致性
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+
+每个后端在独立的子进程中运行，峰值内存（ru_maxrss）包含导入和加载模型的开销。
+一致性为各后端向量与 torch 原始模型向量的余弦相似度。
+
+运行方式:
+    python -m benchmarks.bench_embeddings --texts 2000 --threads 4
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+SAMPLES = [
+    "我想学习python，没有任何基础，希望能完成简单的编程",
+    "机器学习基础：线性回归、逻辑回归与模型评估",
+    "深入理解 Transformer 的自注意力机制和位置编码",
+    "英语口语日常对话练习，每天三十分钟",
+    "考研数学：极限、导数与积分的常见题型",
+    "数据库索引的原理以及 SQL 查询优化",
+    "今天学习了列表推导式和生成器，理解了惰性求值",
+    "吉他入门：C、G、Am、F 四个和弦的转换练习",
+]
+
+
+def make_texts(n: int) -> list:
+    return [f"{SAMPLES[i % len(SAMPLES)]}（第{i}条）" for i in range(n)]
+
+
+def worker(backend: str, threads: int, n: int, out: str):
+    import numpy as np
+    from app.llm.embedding_loader import create_embeddings
+
+    start = time.perf_counter()
+    embeddings = create_embeddings(backend, threads)
+    load_seconds = time.perf_counter() - start
+
+    texts = make_texts(n)
+    embeddings.embed_documents(texts[:32])  # 预热
+    start = time.perf_counter()
+    vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for text in texts[:200]:
+        embeddings.embed_query(text)
+    query_ms = (time.perf_counter() - start) / min(n, 200) * 1000
+
+    np.save(out, vectors)
+    print(json.dumps({
+        "load_seconds": load_seconds,
+        "per_second": n / elapsed,
+        "query_ms": query_ms,
+        # Linux 上 ru_maxrss 的单位是 KB
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", nargs="+", default=["torch", "torch_int8", "onnx"])
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--out", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.worker, args.threads, args.texts, args.out)
+        return
+
+    import numpy as np
+
+    tmp = tempfile.mkdtemp(prefix="bench_emb_")
+    reference = None
+    for backend in args.backends:
+        out = os.path.join(tmp, f"{backend}.npy")
+        result = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_embeddings", "--worker", backend,
+             "--threads", str(args.threads), "--texts", str(args.texts), "--out", out],
+            capture_output=True, text=True, check=True)
+        stats = json.loads(result.stdout.strip().splitlines()[-1])
+        vectors = np.load(out)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        if backend == "torch":
+            reference = vectors
+        agreement = ""
+        if reference is not None:
+            cosine = (vectors * reference).sum(axis=1)
+            agreement = f" | 与 torch 的余弦相似度 mean={cosine.mean():.4f} min={cosine.min():.4f}"
+        print(f"{backend:<11} 加载 {stats['load_seconds']:5.1f}s | {stats['per_second']:7.1f} 条/秒 | "
+              f"单条查询 {stats['query_ms']:6.2f}ms | 峰值内存 {stats['peak_rss_mb']:7.1f}MB{agreement}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: bench_graph_chains.py
+功能: graph 节点的框架开销测试：使用零延迟的桩模型，对比每次重建链与复用预先构建的链
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+
+桩模型立即返回固定内容，测出的时间全部是模板解析、链的构建和调用本身的开销。
+
+运行方式:
+    python -m benchmarks.bench_graph_chains --iterations 2000
+"""
+import argparse
+import os
+import statistics
+import time
+
+# graph 模块导入时会创建真实的大模型客户端（不会发出请求），这里只需要一个占位的 key
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel  # noqa: E402
+from langchain_core.messages import HumanMessage  # noqa: E402
+from langchain_core.prompts import ChatPromptTemplate, PromptTemplate  # noqa: E402
+
+from app.llm import graph  # noqa: E402
+from app.llm.prompts.check_input_completeness_prompt import CheckInputCompletenessPrompt  # noqa: E402
+from app.llm.prompts.gen_plan_prompt import GenPlanPrompt  # noqa: E402
+
+
+def rebuild_and_invoke(stub, level: str):
+    """改动之前的做法：每次调用都重新解析模板并组装链"""
+    if level == "check_input":
+        chain = ChatPromptTemplate.from_template(CheckInputCompletenessPrompt.PROMPT) | stub
+        return chain.invoke("我想学习python，没有基础，目标是能写简单的脚本")
+    if level == "beginner":
+        chain = ChatPromptTemplate.from_template(GenPlanPrompt.PROMPT_WITHOUT_HISTORY) | stub
+        return chain.invoke({"subject": "python"})
+    chain = PromptTemplate(input_variables=["history_study_plan", "subject"],
+                           template=GenPlanPrompt.PROMPT_WITH_HISTORY) | stub
+    return chain.invoke({"subject": "python", "history_study_plan": "python 入门"})
+
+
+def cached_invoke(chains, level: str):
+    if level == "check_input":
+        return chains["check_input"].invoke("我想学习python，没有基础，目标是能写简单的脚本")
+    if level == "beginner":
+        return chains["beginner"].invoke({"subject": "python"})
+    return chains["advanced"].invoke({"subject": "python", "history_study_plan": "python 入门"})
+
+
+def measure(fn, iterations: int) -> list:
+    for _ in range(min(iterations, 50)):
+        fn()
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def report(name: str, latencies: list):
+    print(f"  {name:<24} mean={statistics.mean(latencies) * 1e6:8.1f}µs "
+          f"p50={statistics.median(latencies) * 1e6:8.1f}µs")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    stub = FakeListChatModel(responses=["是"])
+    # 桩模型不支持 function calling，只比较 markdown 方式的链
+    chains = graph.build_chains(stub, "markdown")
+    for level in ("check_input", "beginner", "advanced"):
+        print(f"{level}:")
+        report("每次重建链", measure(lambda: rebuild_and_invoke(stub, level), args.iterations))
+        report("复用预构建的链", measure(lambda: cached_invoke(chains, level), args.iterations))
+
+    # 节点整体开销（包含 method_logger 等）
+    graph.chains = chains
+    state = {"messages": [HumanMessage(content="我想学习python，没有基础，目标是能写简单的脚本")],
+             "subject": "python", "history_plan": "", "learned_before": False, "want_deep_learn": False}
+    print("节点:")
+    report("check_input_completeness", measure(lambda: graph.check_input_completeness_node(state), args.iterations))
+    report("generate_plan", measure(lambda: graph.generate_plan_node(state), args.iterations))
+
+
+if __name__ == "__main__":
+    main()
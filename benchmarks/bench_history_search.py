@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: bench_history_search.py
+功能: 学习历史检索对比：纯向量检索与混合检索（BM25 + 向量 + RRF）的延迟和命中率
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+
+为多个用户写入不同主题的学习计划切块（使用真实的向量化模型和 numpy 后端，数据在临时目录），
+用简短的中文主题查询，命中指返回的第一条切块属于同一主题。
+
+运行方式:
+    python -m benchmarks.bench_history_search --users 50
+"""
+import argparse
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from langchain_core.documents import Document
+
+from app.core.config import settings
+from app.services.history_search_service import history_search_service
+from app.services.vector_index_service import SOURCE_PLAN, SOURCE_PLAN_DAY
+from app.utils.metrics import HISTORY_RETRIEVAL_TOTAL
+
+TOPICS = {
+    "python": ("Python 编程入门", ["变量与数据类型", "流程控制与函数", "列表推导式与生成器", "面向对象编程"],
+               ["学习python", "python基础", "想学python编程"]),
+    "english": ("英语口语提升", ["日常对话练习", "发音与语调", "常用口语表达"],
+                ["学习英语口语", "英语对话", "练习口语"]),
+    "ml": ("机器学习基础", ["线性回归", "逻辑回归与分类", "模型评估与交叉验证"],
+           ["学习机器学习", "机器学习入门", "回归模型"]),
+    "guitar": ("吉他入门", ["认识和弦", "扫弦节奏", "弹唱练习"],
+               ["学吉他", "吉他和弦", "学习弹吉他"]),
+    "sql": ("数据库与 SQL", ["SELECT 查询", "JOIN 多表查询", "索引与查询优化"],
+            ["学习sql", "数据库查询", "sql优化"]),
+}
+
+
+def build_corpus(chroma, users: int, rng: random.Random):
+    """每个用户随机学习过 2 个主题"""
+    learned = {}
+    for user_id in range(users):
+        topics = rng.sample(sorted(TOPICS), 2)
+        learned[user_id] = topics
+        ids, docs = [], []
+        for plan_id, topic in enumerate(topics):
+            title, days, _ = TOPICS[topic]
+            base = {"user_id": user_id, "plan_id": user_id * 10 + plan_id, "topic": topic}
+            ids.append(f"plan:{user_id}:{plan_id}:overview")
+            docs.append(Document(page_content=f"{title}\n{'、'.join(days)}", metadata={**base, "source": SOURCE_PLAN}))
+            for day, point in enumerate(days):
+                ids.append(f"plan:{user_id}:{plan_id}:day:{day}")
+                docs.append(Document(page_content=f"# {point}\n\n## 今日学习要点：\n- {title} {point}",
+                                     metadata={**base, "source": SOURCE_PLAN_DAY}))
+        chroma.upsert_documents(ids, docs)
+    return learned
+
+
+def path_count(path: str) -> int:
+    return int(sum(HISTORY_RETRIEVAL_TOTAL.value(path=path, hit=hit) for hit in ("true", "false")))
+
+
+def is_hit(texts: list, topic: str) -> bool:
+    """第一条结果属于查询的主题"""
+    title, days, _ = TOPICS[topic]
+    return bool(texts) and (title in texts[0] or any(day in texts[0] for day in days))
+
+
+def dense_search(chroma, subject: str, user_id: int, k: int):
+    return chroma.similarity_search_with_relevance_scores(
+        subject, k=k, filter_dict=chroma.build_filter(user_id=user_id, source=[SOURCE_PLAN, SOURCE_PLAN_DAY]),
+        score_threshold=settings.HISTORY_SIMILARITY_THRESHOLD)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+
+    settings.VECTOR_BACKEND = "numpy"
+    from app.db.vector_db_helper import ChromaLangChainManager
+
+    rng = random.Random(0)
+    path = tempfile.mkdtemp(prefix="bench_history_")
+    try:
+        chroma = ChromaLangChainManager(persist_directory=path)
+        chroma.load_existing_collection()
+        learned = build_corpus(chroma, args.users, rng)
+        queries = [(user_id, topic, query) for user_id in range(args.users)
+                   for topic in TOPICS for query in TOPICS[topic][2]]
+
+        # 预热关键词索引缓存和模型
+        for user_id in range(args.users):
+            history_search_service.search(chroma, "预热", user_id, args.k)
+
+        paths = ("empty", "keyword", "hybrid")
+        before = {name: path_count(name) for name in paths}
+        results = {"dense": ([], 0, 0), "hybrid": ([], 0, 0)}
+        for name in results:
+            latencies, hits, expected = [], 0, 0
+            for user_id, topic, query in queries:
+                start = time.perf_counter()
+                if name == "dense":
+                    texts = [doc.page_content for doc, _ in dense_search(chroma, query, user_id, args.k)]
+                else:
+                    texts = history_search_service.search(chroma, query, user_id, args.k)
+                latencies.append(time.perf_counter() - start)
+                if topic in learned[user_id]:
+                    expected += 1
+                    hits += is_hit(texts, topic)
+            results[name] = (latencies, hits, expected)
+
+        for name, (latencies, hits, expected) in results.items():
+            latencies.sort()
+            p99 = latencies[int(len(latencies) * 0.99) - 1]
+            print(f"{name:<7} p50={statistics.median(latencies) * 1000:.2f}ms p99={p99 * 1000:.2f}ms "
+                  f"命中率 {hits}/{expected} = {hits / expected:.2%}")
+        print("混合检索路径分布:", {name: path_count(name) - before[name] for name in paths})
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
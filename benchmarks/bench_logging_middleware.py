@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: bench_logging_middleware.py
+功能: 测量 LoggingMiddleware 每个请求的额外开销，并确认 SSE 的 chunk 没有被缓冲
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+
+运行方式:
+    python -m benchmarks.bench_logging_middleware
+"""
+import asyncio
+import logging
+import time
+
+from app.middleware.logging_middleware import LoggingMiddleware
+
+N_REQUESTS = 20000
+SSE_CHUNKS = 5
+SSE_INTERVAL = 0.05
+
+
+def make_scope(path: str = "/api/v1/notes/1") -> dict:
+    return {
+        "type": "http",
+        "http_version": "1.1",
+        "method": "GET",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "headers": [(b"authorization", b"Bearer xxx")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("127.0.0.1", 8000),
+    }
+
+
+async def plain_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def sse_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", b"text/event-stream")]})
+    for i in range(SSE_CHUNKS):
+        await send({"type": "http.response.body",
+                    "body": f"data: {i}\n\n".encode(), "more_body": True})
+        await asyncio.sleep(SSE_INTERVAL)
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def noop_send(message):
+    pass
+
+
+async def time_requests(app) -> float:
+    scope = make_scope()
+    start = time.perf_counter()
+    for _ in range(N_REQUESTS):
+        await app(dict(scope), receive, noop_send)
+    return (time.perf_counter() - start) / N_REQUESTS
+
+
+async def check_sse_unbuffered():
+    arrivals = []
+    start = time.perf_counter()
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            arrivals.append(time.perf_counter() - start)
+
+    await LoggingMiddleware(sse_app)(make_scope(), receive, send)
+    # 第 i 个 chunk 应该在 i * SSE_INTERVAL 附近到达，而不是在响应结束时一起到达
+    for i, arrival in enumerate(arrivals):
+        assert arrival < i * SSE_INTERVAL + SSE_INTERVAL / 2, arrivals
+    print(f"SSE chunk 到达时间(s): {[round(a, 3) for a in arrivals]}")
+
+
+async def main():
+    # 只测量中间件本身，日志输出不计入
+    logging.disable(logging.CRITICAL)
+    baseline = await time_requests(plain_app)
+    wrapped = await time_requests(LoggingMiddleware(plain_app))
+    print(f"无中间件: {baseline * 1e6:.1f} us/req")
+    print(f"LoggingMiddleware: {wrapped * 1e6:.1f} us/req")
+    print(f"额外开销: {(wrapped - baseline) * 1e6:.1f} us/req")
+    await check_sse_unbuffered()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: bench_logging_pipeline.py
+功能: 对比日志关闭、同步 handler、队列 handler 三种情况下的每秒请求数
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+
+每个模拟请求包含中间件的一条日志、业务代码的一条日志，以及若干个被 method_logger
+装饰的方法调用（每次调用按采样率输出 START/END 两条日志）。
+
+运行方式:
+    python -m benchmarks.bench_logging_pipeline
+"""
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+from app.core.loggin_config import setup_logging, stop_logging, get_dropped_log_count
+from app.utils.logger import get_logger
+
+N_REQUESTS = 5000
+METHODS_PER_REQUEST = 6
+
+
+async def fake_request(logger, sample_rate: float):
+    logger.info("Request completed", method="GET", path="/api/v1/notes/1", status_code=200)
+    logger.info("获取笔记的详细信息")
+    for i in range(METHODS_PER_REQUEST):
+        sampled = random.random() < sample_rate
+        if sampled:
+            logger.info(f"METHOD START: NoteService.m{i}", method=f"NoteService.m{i}", stage="start")
+        await asyncio.sleep(0)
+        if sampled:
+            logger.info(f"METHOD END: NoteService.m{i}", method=f"NoteService.m{i}", stage="end",
+                        process_time="0.000s", success=True)
+
+
+async def run(sample_rate: float) -> float:
+    logger = get_logger("app.bench")
+    start = time.perf_counter()
+    for _ in range(N_REQUESTS):
+        await fake_request(logger, sample_rate)
+    return N_REQUESTS / (time.perf_counter() - start)
+
+
+def main():
+    results = []
+    with tempfile.TemporaryDirectory() as log_dir, open(os.devnull, "w") as devnull:
+        stdout = sys.stdout
+        sys.stdout = devnull  # json_console 输出到 /dev/null
+        try:
+            logging.disable(logging.CRITICAL)
+            results.append(("日志关闭", asyncio.run(run(1.0))))
+            logging.disable(logging.NOTSET)
+
+            for sample_rate in (1.0, 0.01):
+                setup_logging(log_dir, "INFO", use_queue=False)
+                results.append((f"同步 handler, 采样率 {sample_rate}", asyncio.run(run(sample_rate))))
+                setup_logging(log_dir, "INFO", use_queue=True)
+                rps = asyncio.run(run(sample_rate))
+                dropped = get_dropped_log_count()
+                stop_logging()
+                results.append((f"队列 handler, 采样率 {sample_rate} (丢弃 {dropped} 条)", rps))
+        finally:
+            sys.stdout = stdout
+
+    for name, rps in results:
+        print(f"{name}: {rps:,.0f} req/s")
+
+
+if __name__ == "__main__":
+    main()
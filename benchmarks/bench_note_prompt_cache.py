@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: bench_note_prompt_cache.py
+功能: 生成笔记时提示词缓存的命中率：对比固定前缀在前与易变内容在前两种提示词布局
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+
+会真实调用大模型（使用 .env 中的 OPENAI_API_KEY / OPENAI_API_URL），命中的token数取自接口返回的 usage
+（DeepSeek: prompt_cache_hit_tokens，OpenAI: prompt_tokens_details.cached_tokens）。
+按顺序为一个模拟学习计划的前几天生成笔记，每天之前学习过的内容都不同。
+
+运行方式:
+    python -m benchmarks.bench_note_prompt_cache --days 3
+"""
+import argparse
+import asyncio
+from types import SimpleNamespace
+
+from app.llm.ai_service import ai_service
+from app.services.note_service import note_service
+from app.utils.metrics import LLM_PROMPT_CACHED_TOKENS, LLM_PROMPT_TOKENS
+
+PLAN_CONTENT = ("本计划为有一点编程基础的学习者设计，循序渐进地掌握 python 数据分析：从 numpy、pandas 的基本操作开始，"
+                "到数据清洗、分组聚合、可视化，最后完成一个完整的分析报告。") * 8
+
+
+def make_notes(days: int):
+    return [SimpleNamespace(study_content=f"# 第{day}天\n\n## 今日学习要点：\n- 第{day}天知识点一\n- 第{day}天知识点二")
+            for day in range(1, days + 1)]
+
+
+async def run(layout: str, days: int):
+    study_plan = SimpleNamespace(id=hash(layout), content=PLAN_CONTENT)
+    notes = make_notes(days)
+    stage = f"bench_{layout}"
+    for i, note in enumerate(notes):
+        sys_prompt = note_service._gen_system_prompt(study_plan)
+        user_prompt = note_service._gen_user_prompt(note, notes[max(0, i - 5):i])
+        if layout == "volatile_first":
+            # 改动之前的布局：每天不同的内容出现在 system 提示词的前面，之后的部分无法命中缓存
+            head, _, tail = user_prompt.partition("今天将要学习的知识点如下")
+            sys_prompt, user_prompt = head + sys_prompt, "今天将要学习的知识点如下" + tail
+        await ai_service.generate_response(sys_prompt, user_prompt, stage=stage)
+    prompt_tokens = LLM_PROMPT_TOKENS.value(stage=stage)
+    cached_tokens = LLM_PROMPT_CACHED_TOKENS.value(stage=stage)
+    print(f"[{layout}] 输入 {prompt_tokens:.0f} tokens, 命中缓存 {cached_tokens:.0f} tokens, "
+          f"命中率 {cached_tokens / max(prompt_tokens, 1):.1%}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=3)
+    args = parser.parse_args()
+    for layout in ("volatile_first", "stable_prefix"):
+        await run(layout, args.days)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
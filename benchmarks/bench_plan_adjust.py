@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: bench_plan_adjust.py
+功能: 调整学习计划时大模型输出的token数：对比整体重新生成与增量修改（patch）
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+
+会真实调用大模型（使用 .env 中的 OPENAI_API_KEY / OPENAI_API_URL），token 数取自接口返回的 usage。
+先生成一份计划，再对同一份计划依次提出几条修改意见，分别用两种方式调整。
+
+运行方式:
+    python -m benchmarks.bench_plan_adjust --subject "我想学习python数据分析，有一点编程基础"
+"""
+import argparse
+import time
+
+from app.llm import graph
+from app.models.study_plan import StudyPlanOutput
+from app.utils.metrics import LLM_COMPLETION_TOKENS
+
+FEEDBACKS = [
+    "第3天的内容太多了，拆得简单一些",
+    "把第5天换成数据可视化",
+    "增加一天综合练习",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subject", default="我想学习python数据分析，有一点编程基础，目标是能独立完成简单的分析报告")
+    args = parser.parse_args()
+
+    _, plan_data = graph.generate_learning_plan(args.subject, "", "beginner")
+    if plan_data is None:
+        raise SystemExit("增量调整需要结构化输出，请把 PLAN_OUTPUT_MODE 设为 function_calling 或 json_schema")
+    plan = StudyPlanOutput.model_validate(plan_data)
+    print(f"原计划: {plan.total_days} 天")
+
+    for stage in ("adjust_plan", "adjust_patch"):
+        start = time.perf_counter()
+        for feedback in FEEDBACKS:
+            if stage == "adjust_plan":
+                graph.generate_learning_plan(f"{args.subject}，根据反馈调整: {feedback}", "", "beginner",
+                                             stage="adjust_plan")
+            else:
+                graph.adjust_learning_plan(plan, feedback)
+        elapsed = time.perf_counter() - start
+        tokens = LLM_COMPLETION_TOKENS.snapshot(stage=stage)
+        name = "整体重新生成" if stage == "adjust_plan" else "增量修改"
+        print(f"[{name}] {tokens['count']} 次调整, 平均输出 {tokens['sum'] / max(tokens['count'], 1):.0f} tokens, "
+              f"平均耗时 {elapsed / len(FEEDBACKS):.1f}s")
+
+
+if __name__ == "__main__":
+    main()
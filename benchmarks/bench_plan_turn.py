@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: bench_plan_turn.py
+功能: 生成学习计划每轮对话的端到端耗时：对比顺序执行与并行检索 + 推测生成
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+
+大模型调用和向量检索用固定延迟的桩函数代替，只比较节点编排方式带来的差异:
+    第1轮: 判断输入是否完整（大模型）+ 检索学习历史 + 询问是否深入学习
+    第2轮: 用户思考 --think 秒后回答"是"，处理回答 + 生成进阶计划
+
+运行方式:
+    python -m benchmarks.bench_plan_turn --check-ms 800 --retrieve-ms 300 --generate-ms 8000 --think-ms 3000
+"""
+import argparse
+import asyncio
+import os
+import time
+
+# graph 模块导入时会创建真实的大模型客户端（不会发出请求），这里只需要一个占位的 key
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+from langchain_core.messages import HumanMessage  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.llm import graph  # noqa: E402
+
+# 规则无法判断完整性，需要调用大模型
+SUBJECT = "我想系统地学习一下python的数据分析"
+
+
+def install_stubs(check_ms: float, retrieve_ms: float, generate_ms: float):
+    def check_input_info(text):
+        time.sleep(check_ms / 1000)
+        return "是"
+
+    def retrieve_learning_history(subject, vectorstore, user_id):
+        time.sleep(retrieve_ms / 1000)
+        return "python 入门学习计划"
+
+    def generate_learning_plan(subject, history_study_plan, level):
+        time.sleep(generate_ms / 1000)
+        return f"{level} plan", None
+
+    graph.check_input_info = check_input_info
+    graph.retrieve_learning_history = retrieve_learning_history
+    graph.generate_learning_plan = generate_learning_plan
+
+
+async def run_conversation(session_id: str, think_ms: float):
+    """按 graph 的边依次执行节点，返回两轮各自的耗时"""
+    config = {"configurable": {"thread_id": session_id, "chroma": None, "user_id": 1}}
+    state = {"subject": SUBJECT, "history_plan": "", "learned_before": None, "want_deep_learn": None,
+             "messages": [HumanMessage(content=SUBJECT)]}
+
+    start = time.perf_counter()
+    state.update(await graph.check_input_completeness_node(state, config))
+    if state["status"] == "retrieve":
+        state.update(graph.retrieve_node(state, config))
+    state.update(await graph.ask_deep_learn_node(state, config))
+    first_turn = time.perf_counter() - start
+
+    await asyncio.sleep(think_ms / 1000)
+    state["messages"] = state["messages"] + [HumanMessage(content="是")]
+    start = time.perf_counter()
+    state.update(graph.handle_deep_learn_response_node(state))
+    state.update(await graph.generate_plan_node(state, config))
+    second_turn = time.perf_counter() - start
+    return first_turn, second_turn
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--check-ms", type=float, default=800)
+    parser.add_argument("--retrieve-ms", type=float, default=300)
+    parser.add_argument("--generate-ms", type=float, default=8000)
+    parser.add_argument("--think-ms", type=float, default=3000)
+    args = parser.parse_args()
+
+    install_stubs(args.check_ms, args.retrieve_ms, args.generate_ms)
+    for name, parallel in (("顺序执行", False), ("并行检索 + 推测生成", True)):
+        settings.PLAN_PREFETCH_HISTORY = parallel
+        settings.PLAN_SPECULATIVE_GENERATION = parallel
+        first_turn, second_turn = await run_conversation(name, args.think_ms)
+        print(f"[{name}] 第1轮 {first_turn * 1000:.0f}ms, 第2轮 {second_turn * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
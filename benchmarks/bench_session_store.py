@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: bench_session_store.py
+功能: 内存会话存储的容量测试：写入大量模拟会话，统计压缩后的占用、淘汰数量和读写耗时
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+
+每个会话包含一份学习计划的 markdown、学习历史和若干轮消息，与真实对话的大小相近。
+
+运行方式:
+    python -m benchmarks.bench_session_store --sessions 20000 --budget-mb 64
+"""
+import argparse
+import asyncio
+import pickle
+import statistics
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from app.db.graph_session_store import MemoryGraphSessionStore
+from app.utils.metrics import GRAPH_SESSION_EVICTIONS_TOTAL
+
+PLAN = "\n".join(
+    f"**第{day}天**\n* 学习内容: 第{day}天的学习主题\n* 学习知识点:\n1. 知识点一\n2. 知识点二\n3. 知识点三"
+    for day in range(1, 11))
+
+
+def make_state(i: int, turns: int) -> dict:
+    messages = []
+    for turn in range(turns):
+        messages.append(HumanMessage(content=f"第{turn}轮的回答，会话{i}"))
+        messages.append(AIMessage(content=f"为您生成了一份学习计划：\n\n{PLAN}\n\n您对这个计划满意吗？"))
+    return {"subject": f"python 数据分析 {i}", "history_plan": PLAN, "learning_plan": PLAN,
+            "status": "presenting_plan", "input_completeness": True, "messages": messages}
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=20000)
+    parser.add_argument("--turns", type=int, default=4)
+    parser.add_argument("--budget-mb", type=int, default=64)
+    parser.add_argument("--max-session-kb", type=int, default=64)
+    args = parser.parse_args()
+
+    store = MemoryGraphSessionStore(max_entries=args.sessions, max_session_bytes=args.max_session_kb * 1024,
+                                    memory_budget_bytes=args.budget_mb * 1024 * 1024)
+    state = make_state(0, args.turns)
+    print(f"单个会话: 未压缩约 {len(pickle.dumps(state)) / 1024:.1f}KB, "
+          f"压缩后 {len(store._compact(state)) / 1024:.1f}KB")
+
+    set_latencies, get_latencies = [], []
+    for i in range(args.sessions):
+        state = make_state(i, args.turns)
+        start = time.perf_counter()
+        await store.set(str(i), state)
+        set_latencies.append(time.perf_counter() - start)
+    for i in range(args.sessions - 1, max(-1, args.sessions - 1001), -1):
+        start = time.perf_counter()
+        await store.get(str(i))
+        get_latencies.append(time.perf_counter() - start)
+
+    print(f"写入 {args.sessions} 个会话: 保留 {len(store._sessions)} 个, 占用 {store._bytes / 1024 / 1024:.1f}MB, "
+          f"淘汰 {GRAPH_SESSION_EVICTIONS_TOTAL.value(reason='lru'):.0f} 个")
+    print(f"set p50={statistics.median(set_latencies) * 1e6:.0f}µs, "
+          f"get p50={statistics.median(get_latencies) * 1e6:.0f}µs")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
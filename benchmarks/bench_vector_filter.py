@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: bench_vector_filter.py
+功能: 向量检索测试：对比全库检索和按 user_id 过滤检索在不同文档规模下的延迟
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+
+直接用 chromadb 写入随机的单位向量（维度与向量化模型一致），不加载模型，只测检索本身。
+数据写在临时目录中，测试结束后删除。
+
+运行方式:
+    python -m benchmarks.bench_vector_filter --sizes 10000 100000 1000000 --users 1000
+"""
+import argparse
+import shutil
+import statistics
+import tempfile
+import time
+
+import chromadb
+import numpy as np
+
+DIM = 384  # paraphrase-multilingual-MiniLM-L12-v2 的输出维度
+BATCH = 5000
+
+
+def random_unit_vectors(rng: np.random.Generator, n: int) -> np.ndarray:
+    vectors = rng.standard_normal((n, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def build_collection(client, size: int, users: int, rng: np.random.Generator):
+    collection = client.create_collection(f"bench_{size}", metadata={"hnsw:space": "cosine"})
+    now = int(time.time())
+    for start in range(0, size, BATCH):
+        n = min(BATCH, size - start)
+        ids = [str(i) for i in range(start, start + n)]
+        collection.add(
+            ids=ids,
+            embeddings=random_unit_vectors(rng, n).tolist(),
+            documents=[f"plan {i}" for i in range(start, start + n)],
+            metadatas=[{"user_id": int(rng.integers(users)), "plan_id": i, "created_at": now}
+                       for i in range(start, start + n)])
+    return collection
+
+
+def measure(fn, queries: int) -> list:
+    latencies = []
+    for _ in range(queries):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return latencies
+
+
+def report(name: str, latencies: list):
+    p99 = latencies[max(int(len(latencies) * 0.99) - 1, 0)]
+    print(f"  {name:<28} p50={statistics.median(latencies) * 1000:.2f}ms p99={p99 * 1000:.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    path = tempfile.mkdtemp(prefix="bench_chroma_")
+    try:
+        client = chromadb.PersistentClient(path=path)
+        for size in args.sizes:
+            print(f"{size} 个文档, {args.users} 个用户:")
+            collection = build_collection(client, size, args.users, rng)
+            query = random_unit_vectors(rng, 1).tolist()
+
+            # 旧做法：全库检索后在客户端按用户筛选，结果中往往一个该用户的文档都没有
+            def unfiltered():
+                collection.query(query_embeddings=query, n_results=args.k)
+
+            # 新做法：where 条件下推到 Chroma
+            def filtered():
+                collection.query(query_embeddings=query, n_results=args.k,
+                                 where={"user_id": int(rng.integers(args.users))})
+
+            report("全库检索", measure(unfiltered, args.queries))
+            report("where user_id 过滤检索", measure(filtered, args.queries))
+            client.delete_collection(collection.name)
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
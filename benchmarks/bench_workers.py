@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: bench_workers.py
+功能: 多 worker 吞吐测试：分别用 1/2/4/8 个 worker 启动服务，对同一个接口压测
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+
+每种 worker 数量会启动一次 gunicorn，等待服务就绪后用 httpx 并发请求，
+输出吞吐量、p50/p99 延迟以及主进程+worker 的总内存（RSS）。
+
+运行方式:
+    python -m benchmarks.bench_workers --path /api/v1/notes/1 --token <JWT>
+"""
+import argparse
+import asyncio
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+BIND = "127.0.0.1:8765"
+
+
+def total_rss_mb(pid: int) -> float:
+    """主进程及其子进程的 RSS 之和（MB）"""
+    pids = [str(pid)]
+    children = subprocess.run(["pgrep", "-P", str(pid)], capture_output=True, text=True).stdout.split()
+    pids.extend(children)
+    rss = 0
+    for p in pids:
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        rss += int(line.split()[1])
+        except FileNotFoundError:
+            pass
+    return rss / 1024
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            await client.get("/")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.5)
+    raise TimeoutError("服务启动超时")
+
+
+async def load(client: httpx.AsyncClient, path: str, concurrency: int, requests: int):
+    latencies = []
+    queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(None)
+
+    async def worker():
+        while not queue.empty():
+            queue.get_nowait()
+            start = time.perf_counter()
+            await client.get(path)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - start
+
+
+async def run(workers: int, args):
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), BIND=BIND)
+    proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "app.main:app", "-c", "gunicorn_conf.py"],
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+    try:
+        async with httpx.AsyncClient(base_url=f"http://{BIND}", headers=headers, timeout=60) as client:
+            await wait_ready(client)
+            await load(client, args.path, args.concurrency, args.concurrency)  # 预热
+            latencies, elapsed = await load(client, args.path, args.concurrency, args.requests)
+        latencies.sort()
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        print(f"workers={workers}: {len(latencies) / elapsed:.1f} req/s, "
+              f"p50={statistics.median(latencies) * 1000:.1f}ms p99={p99 * 1000:.1f}ms, "
+              f"RSS={total_rss_mb(proc.pid):.0f}MB")
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path", default="/")
+    parser.add_argument("--token", default=None)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+    for workers in args.workers:
+        await run(workers, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: calibrate_history_threshold.py
+功能: 校准 HISTORY_SIMILARITY_THRESHOLD：计算相关/无关主题对的相关度分布
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+
+相关度 = 1 - 余弦距离，与检索学习历史时使用的分数一致。
+输出两组分数的分位数，以及使两类错误之和最小的阈值，可以作为 .env 中 HISTORY_SIMILARITY_THRESHOLD 的取值。
+可以用 --pairs 指定自己的 jsonl 文件（每行 {"a": ..., "b": ..., "related": true/false}）。
+
+运行方式:
+    python -m benchmarks.calibrate_history_threshold
+"""
+import argparse
+import json
+
+import numpy as np
+
+from app.llm.embedding_loader import get_embeddings
+
+DEFAULT_PAIRS = [
+    ("我想学习python，没有任何基础", "Python 入门：变量、数据类型与流程控制", True),
+    ("学习python的面向对象编程", "Python 类与继承、魔术方法", True),
+    ("想系统学习机器学习", "机器学习基础：线性回归、逻辑回归与模型评估", True),
+    ("深入学习深度学习中的卷积神经网络", "CNN 原理与图像分类实战", True),
+    ("学习英语口语", "英语日常对话与发音练习", True),
+    ("准备考研数学", "高等数学：极限、导数与积分", True),
+    ("学习 SQL 查询", "数据库基础：SELECT、JOIN 与索引", True),
+    ("学习吉他", "吉他入门：和弦与扫弦", True),
+    ("我想学习python，没有任何基础", "英语日常对话与发音练习", False),
+    ("想系统学习机器学习", "吉他入门：和弦与扫弦", False),
+    ("学习英语口语", "高等数学：极限、导数与积分", False),
+    ("准备考研数学", "Python 类与继承、魔术方法", False),
+    ("学习 SQL 查询", "CNN 原理与图像分类实战", False),
+    ("学习吉他", "数据库基础：SELECT、JOIN 与索引", False),
+    ("学习日语五十音", "机器学习基础：线性回归、逻辑回归与模型评估", False),
+    ("学习摄影构图", "Python 入门：变量、数据类型与流程控制", False),
+]
+
+
+def load_pairs(path: str):
+    if not path:
+        return DEFAULT_PAIRS
+    with open(path, encoding="utf-8") as f:
+        return [(row["a"], row["b"], row["related"]) for row in map(json.loads, f)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pairs", default=None)
+    args = parser.parse_args()
+
+    pairs = load_pairs(args.pairs)
+    embeddings = get_embeddings()
+    a = np.array(embeddings.embed_documents([p[0] for p in pairs]))
+    b = np.array(embeddings.embed_documents([p[1] for p in pairs]))
+    a /= np.linalg.norm(a, axis=1, keepdims=True)
+    b /= np.linalg.norm(b, axis=1, keepdims=True)
+    scores = (a * b).sum(axis=1)
+    related = np.array([p[2] for p in pairs])
+
+    for name, values in (("相关", scores[related]), ("无关", scores[~related])):
+        p10, p50, p90 = np.percentile(values, [10, 50, 90])
+        print(f"{name}: n={len(values)} p10={p10:.3f} p50={p50:.3f} p90={p90:.3f}")
+
+    candidates = np.round(np.arange(0.0, 1.0, 0.01), 2)
+    errors = [((scores[related] < t).sum() + (scores[~related] >= t).sum(), t) for t in candidates]
+    best_error, best_threshold = min(errors)
+    print(f"建议阈值: HISTORY_SIMILARITY_THRESHOLD={best_threshold:.2f}（误判 {best_error}/{len(pairs)}）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: check_intent_rules.py
+功能: 检查意图分类规则对常见回复的判断结果
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+
+逐条检查 rule_yes_no / rule_input_completeness 的结果是否与预期一致，
+包括容易误判的回复（"满意，不用修改"、"是否可以再详细一点"）。不一致时以非0状态退出。
+
+运行方式:
+    python -m benchmarks.check_intent_rules
+"""
+import sys
+
+from app.llm.intent_classifier import rule_input_completeness, rule_yes_no
+
+# (回复, 预期结果)，None 表示规则没有把握，交给大模型
+YES_NO_CASES = [
+    # 满意，只是说明不需要修改
+    ("满意，不用修改", True),
+    ("满意，不用再调整了", True),
+    ("没问题，不用改了", True),
+    ("可以，不需要修改", True),
+    # 肯定（询问是否深入学习、是否满意）
+    ("是", True),
+    ("是的", True),
+    ("是的，希望", True),
+    ("希望", True),
+    ("想", True),
+    ("想，谢谢", True),
+    ("想啊", True),
+    ("满意", True),
+    ("好的", True),
+    ("可以", True),
+    ("yes", True),
+    # 否定和修改意见
+    ("不是", False),
+    ("不想", False),
+    ("不满意", False),
+    ("不好", False),
+    ("否", False),
+    ("no", False),
+    ("把天数改成5天", False),
+    ("第三天内容太多", False),
+    ("算了，重新生成吧", False),
+    # 没有把握
+    ("想把第三天改一下", None),
+    ("是否可以再详细一点", None),
+    ("能否加一天", None),
+    ("随便", None),
+]
+
+INPUT_COMPLETENESS_CASES = [
+    ("学python", False),
+    ("我想学习python入门", False),
+    ("我零基础，想学会python做数据分析", True),
+    ("学过一点c语言，目标是考研", True),
+    ("我想了解一下机器学习，能帮我做个计划吗", None),
+]
+
+
+def check(name, rule, cases) -> bool:
+    ok = True
+    for text, expected in cases:
+        result = rule(text)
+        if result is not expected:
+            ok = False
+            print(f"[FAIL] {name}({text!r}) = {result}，预期 {expected}")
+    print(f"[{'OK' if ok else 'FAIL'}] {name}: {len(cases)} 条")
+    return ok
+
+
+def main() -> int:
+    results = [
+        check("rule_yes_no", rule_yes_no, YES_NO_CASES),
+        check("rule_input_completeness", rule_input_completeness, INPUT_COMPLETENESS_CASES),
+    ]
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
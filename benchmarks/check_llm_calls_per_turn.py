@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: check_llm_calls_per_turn.py
+功能: 检查生成学习计划的多轮对话中，每轮对话调用大模型的次数
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+
+使用计数的桩模型和固定的检索结果，按接口的方式（会话存储 + checkpointer）执行一段完整的对话，
+每轮只应该执行处理这条回复所需的节点。调用次数与预期不符时以非0状态退出。
+
+对话（保存计划需要数据库，不包含在内）:
+    1. "学python"                         规则判定不完整，不调用大模型
+    2. "我想系统地学习一下python的数据分析"    大模型判断完整性，检索到学习历史，询问是否深入学习
+    3. "是"                               规则判定为肯定，生成进阶计划
+    4. "把天数改成5天"                      规则判定为修改意见，调整计划
+
+运行方式:
+    python -m benchmarks.check_llm_calls_per_turn
+"""
+import asyncio
+import os
+import sys
+
+# graph 模块导入时会创建真实的大模型客户端（不会发出请求），这里只需要一个占位的 key
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+from langchain_core.language_models.chat_models import SimpleChatModel  # noqa: E402
+from langchain_core.messages import HumanMessage  # noqa: E402
+from langgraph.checkpoint.memory import MemorySaver  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.db.graph_session_store import MemoryGraphSessionStore  # noqa: E402
+from app.llm import graph  # noqa: E402
+from app.services.study_plan_service import study_plan_service  # noqa: E402
+
+PLAN = """### 学习主题: python 数据分析
+### 学习天数: 2天
+### 学习目标: 能用 pandas 完成简单的数据分析
+### 学习计划描述:
+两天入门
+### 学习计划大纲
+**第1天**
+* 学习内容: pandas 基础
+* 学习知识点:
+1. DataFrame
+**第2天**
+* 学习内容: 数据清洗
+* 学习知识点:
+1. 缺失值处理"""
+
+# (用户输入, 预期的大模型调用次数, 本轮结束后预期的状态)
+TURNS = [
+    ("学python", 0, "checking_input_completeness"),
+    ("我想系统地学习一下python的数据分析", 1, "asking_deep_learn"),
+    ("是", 1, "presenting_plan"),
+    ("把天数改成5天", 1, "presenting_plan"),
+]
+
+
+class CountingChatModel(SimpleChatModel):
+    """记录调用次数的桩模型：完整性判断回答"是"，其他返回固定的计划"""
+    calls: int = 0
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs) -> str:
+        self.calls += 1
+        return "是" if "信息判断助手" in messages[-1].content else PLAN
+
+    @property
+    def _llm_type(self) -> str:
+        return "counting"
+
+
+async def run_turn(text: str, sessions, compiled_graph, session_id: str) -> str:
+    """与 gen_plan_by_graph 接口相同的方式构造状态并执行一轮对话"""
+    state = await sessions.get(session_id)
+    if state is None:
+        state = {"learned_before": None, "want_deep_learn": None, "learning_plan": None, "plan_data": None,
+                 "is_satisfied": None, "input_completeness": None, "status": "start", "subject": text,
+                 "messages": [HumanMessage(content=text)]}
+    else:
+        if not state["input_completeness"]:
+            state["subject"] = text
+        state["messages"].append(HumanMessage(content=text))
+    output = ""
+    async for chunk in study_plan_service.ge_study_plan_event_stream(
+            state, compiled_graph, sessions, session_id, None, None, 1):
+        output += chunk
+    return output
+
+
+async def main() -> int:
+    model = CountingChatModel()
+    graph.chains = graph.build_chains(model, "markdown")
+    graph.retrieve_learning_history = lambda subject, vectorstore, user_id: "python 入门学习计划"
+    # 推测生成会在等待回答时额外调用一次大模型，这里只检查每轮必需的调用
+    settings.PLAN_SPECULATIVE_GENERATION = False
+
+    sessions = MemoryGraphSessionStore()
+    compiled_graph = graph.builder.compile(checkpointer=MemorySaver())
+    failed = False
+    for i, (text, expected_calls, expected_status) in enumerate(TURNS, 1):
+        before = model.calls
+        await run_turn(text, sessions, compiled_graph, "check-session")
+        calls = model.calls - before
+        status = (await sessions.get("check-session")).get("status")
+        ok = calls == expected_calls and status == expected_status
+        failed = failed or not ok
+        print(f"[{'OK' if ok else 'FAIL'}] 第{i}轮 {text!r}: 大模型调用 {calls} 次（预期 {expected_calls}），"
+              f"状态 {status}（预期 {expected_status}）")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
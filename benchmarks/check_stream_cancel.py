@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: check_stream_cancel.py
+功能: 检查客户端断开后，上游大模型的流式连接被关闭
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+
+启动一个本地的桩服务器，以 OpenAI 流式接口的格式缓慢地输出 chunk，并记录客户端何时关闭连接。
+分别用 AIService.generate_stream_response（生成笔记）和 langchain 的 llm.astream（对话）
+作为 SSE 响应的上游，模拟的客户端读到几帧后断开，检查桩服务器在输出完之前就看到连接被关闭。
+不满足时以非0状态退出。
+
+运行方式:
+    python -m benchmarks.check_stream_cancel
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+# 需要在导入 app 模块之前指向桩服务器（llm_loader 导入时读取环境变量）
+HOST, PORT = "127.0.0.1", 18765
+os.environ["OPENAI_API_KEY"] = "check"
+os.environ["OPENAI_API_URL"] = f"http://{HOST}:{PORT}/v1"
+
+from app.llm.ai_service import ai_service  # noqa: E402
+from app.llm.callbacks import LLM_STAGE_KEY  # noqa: E402
+from app.llm.llm_loader import llm  # noqa: E402
+from app.utils.sse import SSEManager  # noqa: E402
+
+# 桩服务器输出的 chunk 数和间隔，全部输出需要 4 秒
+TOTAL_CHUNKS = 200
+CHUNK_INTERVAL = 0.02
+# 客户端读到这么多帧后断开
+DISCONNECT_AFTER_FRAMES = 5
+# 客户端断开后，上游连接应该在这个时间内被关闭
+CLOSE_TIMEOUT = 1.0
+
+
+class StubServer:
+    """以 OpenAI chat.completions 流式接口的格式输出的桩服务器，每个连接记录输出的 chunk 数和关闭时间"""
+
+    def __init__(self):
+        self.connections = []
+
+    @staticmethod
+    def _chunk(payload: dict) -> bytes:
+        data = f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+        return f"{len(data):x}\r\n".encode() + data + b"\r\n"
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        record = {"sent": 0, "closed_at": None}
+        self.connections.append(record)
+        head = await reader.readuntil(b"\r\n\r\n")
+        length = next((int(line.split(b":")[1]) for line in head.split(b"\r\n")
+                       if line.lower().startswith(b"content-length")), 0)
+        await reader.readexactly(length)
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+
+        async def wait_closed():
+            # 客户端关闭连接时 read 返回空
+            await reader.read()
+            record["closed_at"] = time.perf_counter()
+
+        watcher = asyncio.create_task(wait_closed())
+        try:
+            for i in range(TOTAL_CHUNKS):
+                if watcher.done():
+                    break
+                writer.write(self._chunk({
+                    "id": "stub", "object": "chat.completion.chunk", "created": 0, "model": "deepseek-chat",
+                    "choices": [{"index": 0, "delta": {"content": f"第{i}段"}, "finish_reason": None}]}))
+                await writer.drain()
+                record["sent"] += 1
+                await asyncio.sleep(CHUNK_INTERVAL)
+            else:
+                writer.write(self._chunk({"id": "stub", "object": "chat.completion.chunk", "created": 0,
+                                          "model": "deepseek-chat", "choices": []}))
+                writer.write(b"data: [DONE]\n\n")
+                writer.write(b"0\r\n\r\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        await asyncio.wait({watcher}, timeout=CLOSE_TIMEOUT * 2)
+        writer.close()
+
+
+async def chat_source():
+    """与对话接口相同的方式读取 langchain 的流"""
+    stream = llm.astream("你好", config={"metadata": {LLM_STAGE_KEY: "check_chat"}})
+    try:
+        async for chunk in stream:
+            yield chunk.content
+    finally:
+        await stream.aclose()
+
+
+async def run_client(response) -> float:
+    """模拟客户端：读到 DISCONNECT_AFTER_FRAMES 帧后断开，返回断开的时间"""
+    frames = 0
+    disconnected = asyncio.Event()
+
+    async def send(message):
+        nonlocal frames
+        if message["type"] == "http.response.body" and message["body"].startswith(b"id: "):
+            frames += 1
+            if frames >= DISCONNECT_AFTER_FRAMES:
+                disconnected.set()
+
+    async def receive():
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    await response({"type": "http"}, receive, send)
+    return time.perf_counter()
+
+
+async def check(name: str, server: StubServer, sse: SSEManager, source) -> bool:
+    before = len(server.connections)
+    request = type("Request", (), {"headers": {}})()
+    disconnected_at = await run_client(sse.response(request, source))
+    await asyncio.sleep(CLOSE_TIMEOUT)
+    record = server.connections[before] if len(server.connections) > before else None
+    if record is None:
+        print(f"[FAIL] {name}: 没有连接到桩服务器")
+        return False
+    closed_at = record["closed_at"]
+    ok = closed_at is not None and closed_at - disconnected_at <= CLOSE_TIMEOUT and record["sent"] < TOTAL_CHUNKS
+    delay = f"{closed_at - disconnected_at:.3f}s" if closed_at is not None else "未关闭"
+    print(f"[{'OK' if ok else 'FAIL'}] {name}: 客户端断开后上游连接关闭用时 {delay}, "
+          f"桩服务器输出 {record['sent']}/{TOTAL_CHUNKS} 个 chunk")
+    return ok
+
+
+async def main() -> int:
+    stub = StubServer()
+    server = await asyncio.start_server(stub.handle, HOST, PORT)
+    # 不等待重连，断开后立即关闭上游
+    sse = SSEManager(max_streams=16, buffer_size=256, heartbeat=15, grace=0)
+    try:
+        results = [
+            await check("生成笔记 (AIService)", stub, sse,
+                        ai_service.generate_stream_response("system", "user", stage="check_note")),
+            await check("对话 (langchain)", stub, sse, chat_source()),
+        ]
+    finally:
+        server.close()
+        await server.wait_closed()
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名: gunicorn_conf.py
+功能: 多 worker 部署的 gunicorn 配置
+作者: Yang
+创建日期: 2026-10-19
+版本号: 1.0
+变更说明: 无
+
+启动方式:
+    gunicorn app.main:app -c gunicorn_conf.py
+
+多 worker 部署时需要在 .env 中设置:
+    SESSION_STORE=postgres          # 会话状态在 worker 之间共享
+    GRAPH_CHECKPOINTER=sqlite       # graph 检查点在 worker 之间共享
+    CHROMA_SERVER_HOST=...          # VECTOR_BACKEND=chroma 时必须，本地 Chroma 不支持多进程读写
+"""
+import gc
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+# 大模型请求以 IO 等待为主，默认每个 CPU 核一个 worker
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+# 流式响应可能持续较长时间
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+graceful_timeout = 30
+keepalive = 5
+# 主进程先导入应用，worker 通过 fork 写时复制共享已导入的模块和向量化模型
+preload_app = True
+
+
+def on_starting(server):
+    from app.core.config import settings
+    # 本地持久化的 Chroma 在每个进程中都有自己的缓存和索引，文件锁不能保证多进程读写正确，启动时直接失败
+    if server.cfg.workers > 1 and settings.VECTOR_BACKEND == "chroma" and not settings.CHROMA_SERVER_HOST:
+        raise RuntimeError("多个 worker 使用 Chroma 时需要设置 CHROMA_SERVER_HOST（或使用 VECTOR_BACKEND=numpy）")
+    if settings.PRELOAD_EMBEDDINGS:
+        from app.llm.embedding_loader import get_embeddings
+        get_embeddings()
+        server.log.info("embedding model preloaded")
+    # 把已有对象移出 GC 跟踪，避免 worker 中的 GC 触碰这些页面导致写时复制失效
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # 日志监听线程不会被 fork 继承，需要在 worker 中重新启动
+    from app.core.loggin_config import reinit_logging_after_fork
+    reinit_logging_after_fork()